@@ -1,23 +1,33 @@
+import os
+import gzip
 import json
+import lzma
 import requests
 
 from config import settings
 import utils
 
 
-def extract(word="witchcraft", snippets=True):
+# one shard per jurisdiction stays open for the whole search: xz's default preset 6 needs ~94 MB per writer,
+# preset 1 a few MB for output about 10% larger
+SHARD_OPENERS = {
+    None: lambda path: open(path, 'w', encoding='utf-8'),
+    'gz': lambda path: gzip.open(path, 'wt', encoding='utf-8'),
+    'xz': lambda path: lzma.open(path, 'wt', encoding='utf-8', preset=1),
+}
+
+
+def search_results(word="witchcraft", snippets=True):
     """
-    Get cases that have the word you're looking for.
-    If snippets is True, save only the context of the word
-    otherwise, save the entire casebody
+    Yield (jurisdiction slug, case data) of each case that has the word you're looking for, a page at a time.
+    If snippets is True, case data has only the context of the word,
+    otherwise it has the entire casebody
     """
     url = utils.get_api_url() + 'cases?full_case=true&search=%s' % word
     headers = {'AUTHORIZATION': 'Token {}'.format(settings.API_KEY)}
     response = requests.get(url, headers=headers)
     res = response.json()
 
-    word_results = {}
-
     warning_printed = False
     while True:
         for case in res['results']:
@@ -61,16 +71,36 @@ def extract(word="witchcraft", snippets=True):
                     utils.print_info("\nWarning: Something went wrong -- your daily limit may have run out.\nPlease check your account: https://case.law/user/details")
                     print("\nError:", e)
                     warning_printed = True
-            if jur_slug in word_results.keys():
-                word_results[jur_slug].append(case_data)
-            else:
-                word_results[jur_slug] = [case_data]
+            yield jur_slug, case_data
 
         try:
             next_result = requests.get(res['next'], headers=headers)
             res = next_result.json()
         except:
             break
+
+
+def extract(word="witchcraft", snippets=True, out_format="json", compression=None):
+    """
+    Get cases that have the word you're looking for.
+    If snippets is True, save only the context of the word
+    otherwise, save the entire casebody
+
+    out_format="json" writes every case to one DATA_DIR/<word>.json file, keyed by jurisdiction, at the end.
+    out_format="jsonl" writes each case as soon as its page arrives, one line in DATA_DIR/<word>/<jurisdiction>.jsonl
+    (.jsonl.gz or .jsonl.xz with compression="gz" or "xz"), so memory use doesn't grow with the number of results
+    and an interrupted run keeps what it fetched. DATA_DIR/<word>/index.json lists the shards and their counts.
+    """
+    if out_format == "jsonl":
+        return extract_to_shards(word, snippets=snippets, compression=compression)
+
+    word_results = {}
+    for jur_slug, case_data in search_results(word, snippets=snippets):
+        if jur_slug in word_results.keys():
+            word_results[jur_slug].append(case_data)
+        else:
+            word_results[jur_slug] = [case_data]
+
     filename = "%s/%s.json" % (settings.DATA_DIR, word)
     with open(filename, "w+") as f:
         json.dump(word_results, f)
@@ -78,6 +108,55 @@ def extract(word="witchcraft", snippets=True):
     utils.print_info("\n>> Written to file %s" % filename)
 
 
+def extract_to_shards(word="witchcraft", snippets=True, compression=None):
+    """
+    Write cases that have the word to one jsonl shard per jurisdiction as they arrive, then write the index.
+    Return the index path.
+    """
+    if compression not in SHARD_OPENERS:
+        raise Exception("Unknown compression %s. Use gz or xz." % compression)
+    out_dir = os.path.join(settings.DATA_DIR, word)
+    os.makedirs(out_dir, exist_ok=True)
+    extension = ".jsonl" + ("." + compression if compression else "")
+
+    shards = {}
+    files = {}
+    try:
+        for jur_slug, case_data in search_results(word, snippets=snippets):
+            if jur_slug not in files:
+                shards[jur_slug] = {"path": jur_slug + extension, "cases": 0, "times_appeared": 0}
+                files[jur_slug] = SHARD_OPENERS[compression](os.path.join(out_dir, shards[jur_slug]["path"]))
+            files[jur_slug].write(json.dumps(case_data) + "\n")
+            shards[jur_slug]["cases"] += 1
+            shards[jur_slug]["times_appeared"] += case_data["times_appeared"] or 0
+    finally:
+        for shard_file in files.values():
+            shard_file.close()
+
+    index_path = os.path.join(out_dir, "index.json")
+    with open(index_path, "w") as f:
+        json.dump({"word": word, "snippets": snippets, "cases": sum(shard["cases"] for shard in shards.values()),
+                   "shards": shards}, f, indent=2, sort_keys=True)
+
+    utils.print_info("\n>> Written %s shards to %s" % (len(shards), out_dir))
+    return index_path
+
+
+def read_shards(index_path):
+    """
+    Yield (jurisdiction slug, case data) of every case in the shards listed by an index.json.
+    """
+    with open(index_path) as f:
+        index = json.load(f)
+    out_dir = os.path.dirname(index_path)
+    for jur_slug, shard in sorted(index["shards"].items()):
+        compression = shard["path"].rsplit(".", 1)[-1]
+        opener = {"gz": gzip.open, "xz": lzma.open}.get(compression, open)
+        with opener(os.path.join(out_dir, shard["path"]), "rt", encoding="utf-8") as shard_file:
+            for line in shard_file:
+                yield jur_slug, json.loads(line)
+
+
 def get_word_context(word, casebody):
     """
     Return snippet around word and times the word appeared in the case
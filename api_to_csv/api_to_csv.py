@@ -1,81 +1,532 @@
 import csv
+import gzip
 import json
+import os
 import sys
 import argparse
-import urllib.request
+import datetime
+import hashlib
+import http.client
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin, parse_qsl, urlencode
+
+try:
+    # optional: only importable when run from the repository root, e.g. python -m api_to_csv.api_to_csv
+    import instrumentation
+except ImportError:
+    instrumentation = None
 
 """
     This demonstration script fetches search results from the CAP cases endpoint and writes a subset of their fields to
-    a CSV file. It uses only the Python 3 standard library, so no additional installation is required.
-    
-    There is not currently a command line option to select which fields are included, so changing the fields requires
-    manually editing the script.
-    
+    a CSV (or JSON lines) file. It uses only the Python 3 standard library, so no additional installation is required.
+
+    Pages are fetched over one persistent, gzip-compressed HTTP connection per host, and the next page is downloaded in
+    a background thread while the current one is written. Several query urls can be fetched in parallel with
+    --workers; their results go to the same output, each case once.
+
+    --fields picks the columns: any top-level field of a case, a dotted path into nested ones (e.g. court.name),
+    "citation" for the official citation or "jurisdiction" for the jurisdiction's name. Nested values are written as
+    json.
+
+    --sync keeps an output file up to date instead of rewriting it. The first run writes everything and saves a
+    watermark next to the output (<out-path>.watermark.json: the latest decision date, the row count and a hash of the
+    file). Later runs only download cases decided on or after the watermark date, then compare the number of
+    older cases with the server's, halving the date range wherever they differ, and download only the years that
+    changed. Rows are upserted by id; cases no longer returned are removed. The cost of a refresh follows the number
+    of changes, not the size of the query. Changes to older cases that leave the counts as they were (an edit, or a
+    case removed while another was added) are not detected, so run with --sync --full now and then.
+
     Usage:
-    
+
         $ python api_to_csv.py -h
-        usage: api_to_csv.py [-h] [--api-key API_KEY] [--out-path OUT_PATH] url
-        
+        usage: api_to_csv.py [-h] [--api-key API_KEY] [--out-path OUT_PATH] [--fields FIELDS] [--format {csv,jsonl}]
+                             [--workers WORKERS] [--sync] [--full] [--metrics-path METRICS_PATH]
+                             url [url ...]
+
         Print CAPAPI query to CSV.
-        
+
         positional arguments:
           url                  target url, e.g.
                                https://api.case.law/v1/cases/?search=first+amendment
-        
+
         optional arguments:
           -h, --help           show this help message and exit
           --api-key API_KEY    api key (optional; only needed if requesting full text)
           --out-path OUT_PATH  output path (default stdout)
-        
-        example:
+          --fields FIELDS      comma separated fields to write (default
+                               id,frontend_url,name,name_abbreviation,citation,decision_date,jurisdiction)
+          --format {csv,jsonl}
+                               output format (default csv)
+          --workers WORKERS    urls fetched in parallel (default 1)
+          --sync               only fetch new and changed cases since the last --sync run into --out-path
+          --full               with --sync, refetch everything (still only rewriting changed rows)
+          --metrics-path METRICS_PATH
+                               write request metrics here (.prom or .json; needs the repository root on the python
+                               path)
+
+        examples:
           python api_to_csv.py --out-path first_amendment_cases.csv https://api.case.law/v1/cases/?search=first+amendment
+          python api_to_csv.py --workers 2 --format jsonl --fields id,name,court.name \\
+              "https://api.case.law/v1/cases/?jurisdiction=ill" "https://api.case.law/v1/cases/?jurisdiction=ark"
+          python api_to_csv.py --sync --out-path ill.csv "https://api.case.law/v1/cases/?jurisdiction=ill"
 """
 
 
+DEFAULT_FIELDS = ['id', 'frontend_url', 'name', 'name_abbreviation', 'citation', 'decision_date', 'jurisdiction']
+FIELD_GETTERS = {
+    'citation': lambda result: next((cite['cite'] for cite in result['citations'] if cite['type'] == 'official'), ''),
+    'jurisdiction': lambda result: result['jurisdiction']['name'],
+}
+_DONE = object()
+EARLIEST_DATE = '1600-01-01'
+LATEST_DATE = '9999-12-31'
+
 logger = logging.getLogger('api_to_csv')
 
 
-def get_results(url, api_key=None):
+class Client(object):
+    """
+        Fetches json pages, keeping one open connection per host. Not thread safe: use one client per thread.
+    """
+
+    def __init__(self, api_key=None, timeout=60):
+        self.headers = {'Accept-Encoding': 'gzip', 'Accept': 'application/json'}
+        if api_key:
+            self.headers['Authorization'] = 'Token {}'.format(api_key)
+        self.timeout = timeout
+        self.connections = {}
+
+    def connection(self, scheme, host):
+        if (scheme, host) not in self.connections:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            self.connections[(scheme, host)] = connection_class(host, timeout=self.timeout)
+        return self.connections[(scheme, host)]
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections = {}
+
+    def request(self, url, redirects=5):
+        """
+            Return the decompressed body of url, following redirects. Retries once on a fresh connection if the
+            server closed the kept-alive one.
+        """
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        for attempt in range(2):
+            connection = self.connection(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path or '/', headers=self.headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError):
+                connection.close()
+                del self.connections[(parts.scheme, parts.netloc)]
+                if attempt:
+                    raise
+                if instrumentation:
+                    instrumentation.increment('api_to_csv_retries_total')
+        if instrumentation:
+            instrumentation.increment('api_to_csv_response_bytes_total', len(body))
+        if response.status in (301, 302, 303, 307, 308) and redirects:
+            return self.request(urljoin(url, response.getheader('Location')), redirects - 1)
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if response.status >= 400:
+            raise Exception("HTTP %s fetching %s: %s" % (response.status, url, body[:200]))
+        return body
+
+    def get_json(self, url):
+        return json.loads(self.request(url).decode('utf-8'))
+
+
+def get_pages(url, api_key=None, prefetch=True):
+    """
+        Yield each page of results from the target URL. With prefetch, the next page is fetched by a background
+        thread while the caller handles the current one.
+    """
+    client = Client(api_key)
+
+    def fetch():
+        page_url = url
+        page_count = 1
+        while page_url:
+            logger.info("Fetching page %s" % page_count)
+            start = time.perf_counter()
+            page = client.get_json(page_url)
+            if instrumentation:
+                instrumentation.observe('api_to_csv_request_seconds', time.perf_counter() - start)
+                instrumentation.increment('api_to_csv_pages_total')
+                instrumentation.increment('api_to_csv_cases_total', len(page['results']))
+            yield page
+            page_url = page['next']
+            page_count += 1
+
+    if not prefetch:
+        try:
+            for page in fetch():
+                yield page
+        finally:
+            client.close()
+        return
+
+    pages = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def prefetcher():
+        try:
+            for page in fetch():
+                if not _put(pages, page, stop):
+                    return
+            _put(pages, _DONE, stop)
+        except Exception as e:
+            _put(pages, e, stop)
+        finally:
+            client.close()
+
+    thread = threading.Thread(target=prefetcher, daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                break
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        # the caller may stop early: let the prefetcher notice and exit
+        stop.set()
+        thread.join()
+
+
+def _put(items, item, stop):
+    """
+        Put item on a bounded queue, unless stop is set first. Return whether it was put.
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def get_results(url, api_key=None, prefetch=True):
     """
         Yield each individual case result from the target URL.
     """
-    headers = {}
-    if api_key:
-        headers['Authorization'] = 'Token {}'.format(api_key)
-    page_count = 1
-    while True:
-        logger.info("Fetching page %s" % page_count)
-        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
-        page = json.loads(response.read().decode('utf-8'))
+    for page in get_pages(url, api_key, prefetch=prefetch):
         for result in page['results']:
             yield result
-        url = page['next']
-        if not url:
-            break
-        page_count += 1
 
 
-def api_query_to_csv(url, api_key=None, out_path=None):
+def get_results_parallel(urls, api_key=None, workers=4):
+    """
+        Yield each case result of several target URLs, fetching up to workers of them at a time.
+        Results of different URLs are interleaved, and cases returned by more than one URL are only yielded once.
+    """
+    pages = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+
+    def fetch_all(url):
+        if stop.is_set():
+            return
+        try:
+            for page in get_pages(url, api_key, prefetch=False):
+                if not _put(pages, page['results'], stop):
+                    return
+            _put(pages, _DONE, stop)
+        except Exception as e:
+            _put(pages, e, stop)
+
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for url in urls:
+            executor.submit(fetch_all, url)
+        try:
+            finished = 0
+            while finished < len(urls):
+                results = pages.get()
+                if results is _DONE:
+                    finished += 1
+                    continue
+                if isinstance(results, Exception):
+                    raise results
+                for result in results:
+                    if result['id'] not in seen:
+                        seen.add(result['id'])
+                        yield result
+        finally:
+            stop.set()
+
+
+def _unique(results):
+    """
+        Yield results, skipping cases already yielded, as get_results_parallel does.
+    """
+    seen = set()
+    for result in results:
+        if result['id'] not in seen:
+            seen.add(result['id'])
+            yield result
+
+
+def get_field(result, field):
     """
-        Write all case results from URL to out_path, defaulting to stdout.
+        Return the value of a field of a case result, a dotted path (e.g. court.name), or one of FIELD_GETTERS.
     """
+    if field in FIELD_GETTERS:
+        return FIELD_GETTERS[field](result)
+    value = result
+    for key in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def api_query_to_csv(url, api_key=None, out_path=None, fields=None, out_format='csv', workers=1):
+    """
+        Write all case results from URL (or a list of URLs) to out_path, defaulting to stdout.
+    """
+    urls = [url] if isinstance(url, str) else url
+    fields = fields or DEFAULT_FIELDS
+    if workers > 1 and len(urls) > 1:
+        results = get_results_parallel(urls, api_key, workers=workers)
+    else:
+        results = _unique(result for url in urls for result in get_results(url, api_key))
+
     if out_path:
-        out_file = open(out_path, 'w', encoding='utf-8')
+        out_file = open(out_path, 'w', newline='', encoding='utf-8')
     else:
         out_file = sys.stdout
-    out = csv.writer(out_file)
-    out.writerow(['id', 'frontend_url', 'name', 'name_abbreviation', 'citation', 'decision_date', 'jurisdiction'])
-    for result in get_results(url, api_key):
-        out.writerow([
-            result['id'],
-            result['frontend_url'],
-            result['name'],
-            result['name_abbreviation'],
-            next((cite['cite'] for cite in result['citations'] if cite['type'] == 'official'), ''),
-            result['decision_date'],
-            result['jurisdiction']['name'],
-        ])
+    try:
+        if out_format == 'jsonl':
+            for result in results:
+                out_file.write(json.dumps({field: get_field(result, field) for field in fields}) + '\n')
+        else:
+            out = csv.writer(out_file)
+            out.writerow(fields)
+            for result in results:
+                row = []
+                for field in fields:
+                    value = get_field(result, field)
+                    row.append(json.dumps(value) if isinstance(value, (dict, list)) else value)
+                out.writerow(row)
+    finally:
+        if out_path:
+            out_file.close()
+
+
+def _row(result, fields, out_format):
+    """
+        A result projected to fields: a dict for jsonl, or the list of strings written to a csv.
+    """
+    if out_format == 'jsonl':
+        return {field: get_field(result, field) for field in fields}
+    row = []
+    for field in fields:
+        value = get_field(result, field)
+        row.append(json.dumps(value) if isinstance(value, (dict, list)) else '' if value is None else str(value))
+    return row
+
+
+def _read_rows(out_path, fields, out_format):
+    """
+        Return {str(id): row} of an output file, in file order, or None if it wasn't written with these fields and
+        format.
+    """
+    rows = {}
+    with open(out_path, newline='', encoding='utf-8') as in_file:
+        if out_format == 'jsonl':
+            for line in in_file:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    return None
+                if not isinstance(row, dict) or list(row) != fields:
+                    return None
+                rows[str(row['id'])] = row
+        else:
+            reader = csv.reader(in_file)
+            if next(reader, None) != fields:
+                return None
+            id_index = fields.index('id')
+            for row in reader:
+                rows[row[id_index]] = row
+    return rows
+
+
+def _write_rows(out_path, rows, fields, out_format):
+    temporary_path = out_path + '.tmp'
+    with open(temporary_path, 'w', newline='', encoding='utf-8') as out_file:
+        if out_format == 'jsonl':
+            for row in rows.values():
+                out_file.write(json.dumps(row) + '\n')
+        else:
+            out = csv.writer(out_file)
+            out.writerow(fields)
+            out.writerows(rows.values())
+    os.replace(temporary_path, out_path)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _full_date(date, last=False):
+    """
+        Pad a partial decision date (1820, 1820-12) to a full one: the first, or with last, the last possible day.
+    """
+    if len(date) >= 10:
+        return date[:10]
+    if len(date) == 7:
+        return date + ('-31' if last else '-01')
+    return date[:4] + ('-12-31' if last else '-01-01')
+
+
+def _with_dates(url, date_min, date_max, **params):
+    """
+        url restricted to decision dates in [date_min, date_max], within any date range the url already has.
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.pop('cursor', None)
+    query['decision_date_min'] = max(date_min, query.get('decision_date_min', date_min))
+    query['decision_date_max'] = min(date_max, query.get('decision_date_max', date_max))
+    query.update(params)
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+class _Sync(object):
+    """
+        Upserts the results of one query into the rows of its output file, range by range of decision dates.
+    """
+
+    def __init__(self, url, api_key, rows, fields, out_format):
+        self.url = url
+        self.api_key = api_key
+        self.client = Client(api_key)
+        self.rows = rows
+        self.fields = fields
+        self.out_format = out_format
+        self.date_index = fields.index('decision_date')
+        self.stats = {'new': 0, 'changed': 0, 'deleted': 0, 'refetched_ranges': 0, 'count_requests': 0}
+
+    def date(self, row):
+        return row['decision_date'] if self.out_format == 'jsonl' else row[self.date_index]
+
+    def local_ids(self, date_min, date_max):
+        return [case_id for case_id, row in self.rows.items()
+                if self.date(row) and date_min <= _full_date(self.date(row)) <= date_max]
+
+    def remote_count(self, date_min, date_max):
+        self.stats['count_requests'] += 1
+        return self.client.get_json(_with_dates(self.url, date_min, date_max, page_size=1))['count']
+
+    def refetch(self, date_min, date_max):
+        """
+            Replace the rows decided in [date_min, date_max] with the server's.
+        """
+        self.stats['refetched_ranges'] += 1
+        stale = set(self.local_ids(date_min, date_max))
+        for result in get_results(_with_dates(self.url, date_min, date_max), self.api_key):
+            case_id = str(result['id'])
+            row = _row(result, self.fields, self.out_format)
+            stale.discard(case_id)
+            if case_id not in self.rows:
+                self.stats['new'] += 1
+            elif self.rows[case_id] != row:
+                self.stats['changed'] += 1
+            else:
+                continue
+            self.rows[case_id] = row
+        for case_id in stale:
+            del self.rows[case_id]
+        self.stats['deleted'] += len(stale)
+
+    def check(self, date_min, date_max):
+        """
+            Refetch the parts of [date_min, date_max] whose number of cases differs from the server's, halving the
+            range down to single years.
+        """
+        if date_min > date_max:
+            return
+        count = self.remote_count(date_min, date_max)
+        if count is None:
+            logger.warning("The server doesn't report counts for this query: older cases can't be checked")
+            return
+        if count == len(self.local_ids(date_min, date_max)):
+            return
+        first_year, last_year = int(date_min[:4]), int(date_max[:4])
+        if first_year == last_year:
+            return self.refetch(date_min, date_max)
+        middle = (first_year + last_year) // 2
+        self.check(date_min, '%04d-12-31' % middle)
+        self.check('%04d-01-01' % (middle + 1), date_max)
+
+
+def sync_query_to_csv(url, api_key=None, out_path=None, fields=None, out_format='csv', full=False):
+    """
+        Bring out_path up to date with the results of url, fetching only what changed since the last sync (see
+        --sync above). Return counts of new, changed and deleted rows.
+    """
+    if not out_path:
+        raise Exception("Syncing needs an output path.")
+    fields = fields or DEFAULT_FIELDS
+    if 'id' not in fields or 'decision_date' not in fields:
+        raise Exception("Syncing needs the id and decision_date fields.")
+    watermark_path = out_path + '.watermark.json'
+    watermark = None
+    if not full and os.path.exists(out_path) and os.path.exists(watermark_path):
+        with open(watermark_path) as watermark_file:
+            watermark = json.load(watermark_file)
+        if (watermark['url'], watermark['fields'], watermark['format']) != (url, fields, out_format):
+            logger.warning("%s was written by another query: fetching everything" % out_path)
+            watermark = None
+        elif watermark['content_hash'] != _file_hash(out_path):
+            logger.warning("%s changed since the last sync: fetching everything" % out_path)
+            watermark = None
+
+    rows = _read_rows(out_path, fields, out_format) if os.path.exists(out_path) else {}
+    if rows is None:
+        logger.warning("%s has other fields: replacing it" % out_path)
+        rows = {}
+    sync = _Sync(url, api_key, rows, fields, out_format)
+    if watermark:
+        # cases decided on or after the watermark date (the same day may have new cases), then older changes
+        boundary = _full_date(watermark['max_decision_date'])
+        sync.refetch(boundary, LATEST_DATE)
+        sync.check(EARLIEST_DATE, (datetime.date.fromisoformat(boundary) - datetime.timedelta(days=1)).isoformat())
+    else:
+        sync.refetch(EARLIEST_DATE, LATEST_DATE)
+    sync.client.close()
+
+    if not watermark or sync.stats['new'] or sync.stats['changed'] or sync.stats['deleted']:
+        _write_rows(out_path, rows, fields, out_format)
+    dates = [sync.date(row) for row in rows.values() if sync.date(row)]
+    watermark = {
+        'url': url, 'fields': fields, 'format': out_format,
+        'max_decision_date': max(dates, key=_full_date) if dates else EARLIEST_DATE,
+        'count': len(rows),
+        'content_hash': _file_hash(out_path),
+        'synced_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(watermark_path, 'w') as watermark_file:
+        json.dump(watermark, watermark_file, indent=2)
+    return sync.stats
 
 
 def main():
@@ -85,15 +536,37 @@ def main():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description='Print CAPAPI query to CSV.',
-        epilog="""example:\n  python api_to_csv.py --out-path first_amendment_cases.csv https://api.case.law/v1/cases/?search=first+amendment"""
+        epilog="""examples:\n  python api_to_csv.py --out-path first_amendment_cases.csv https://api.case.law/v1/cases/?search=first+amendment\n  python api_to_csv.py --workers 2 --format jsonl --fields id,name,court.name \\\n      "https://api.case.law/v1/cases/?jurisdiction=ill" "https://api.case.law/v1/cases/?jurisdiction=ark\""""
     )
-    parser.add_argument('url', help='target url, e.g. https://api.case.law/v1/cases/?search=first+amendment')
+    parser.add_argument('url', nargs='+', help='target url, e.g. https://api.case.law/v1/cases/?search=first+amendment')
     parser.add_argument('--api-key', help='api key (optional; only needed if requesting full text)')
     parser.add_argument('--out-path', help='output path (default stdout)')
+    parser.add_argument('--fields', help='comma separated fields to write (default %s)' % ",".join(DEFAULT_FIELDS))
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='output format (default csv)')
+    parser.add_argument('--workers', type=int, default=1, help='urls fetched in parallel (default 1)')
+    parser.add_argument('--sync', action='store_true', help='only fetch new and changed cases since the last --sync '
+                                                            'run into --out-path')
+    parser.add_argument('--full', action='store_true', help='with --sync, refetch everything (still only rewriting '
+                                                            'changed rows)')
+    parser.add_argument('--metrics-path', help='write request metrics here (.prom or .json; needs the repository root '
+                                               'on the python path)')
     args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
-    api_query_to_csv(args.url, args.api_key, args.out_path)
+    fields = args.fields.split(',') if args.fields else None
+    if args.sync:
+        if len(args.url) > 1:
+            raise Exception("--sync takes a single url; sync each query to its own file.")
+        stats = sync_query_to_csv(args.url[0], args.api_key, args.out_path, fields=fields, out_format=args.format,
+                                  full=args.full)
+        logger.info("%(new)s new, %(changed)s changed, %(deleted)s deleted" % stats)
+    else:
+        api_query_to_csv(args.url, args.api_key, args.out_path, fields=fields, out_format=args.format,
+                         workers=args.workers)
+    if args.metrics_path:
+        if not instrumentation:
+            raise Exception("--metrics-path needs instrumentation.py; run as python -m api_to_csv.api_to_csv")
+        instrumentation.write(args.metrics_path)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
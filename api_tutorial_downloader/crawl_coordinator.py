@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from urllib.parse import urlencode
+
+import requests
+
+"""
+This script splits a large API crawl into jobs that any number of worker processes, on any number of machines, can
+share. It's the multi-machine version of api_tutorial_downloader.py: instead of editing the reporter and start year on
+each box, plan the crawl once and start workers wherever you like.
+
+Everything lives in one crawl directory that every worker can reach (a local directory, or a network share):
+
+    queue.sqlite3           the job queue
+    shards/<job>.jsonl      one output file per job, named after it, so re-running a job overwrites the same shard
+
+A job is one reporter or court over a range of years. Workers lease a job for --lease-seconds and renew the lease
+with a heartbeat while they work on it. A job whose worker died is leased again once its lease expires, and a job that
+fails is retried later (with exponential backoff) up to --max-attempts times. Workers keep waiting for retries and
+other workers' leases, and exit once every job is done or failed. No broker or server is needed: SQLite's locking
+arbitrates between workers. (SQLite locking relies on the file system; prefer a local disk, or a network file system
+with working locks such as NFSv4.)
+
+Usage:
+
+    $ python crawl_coordinator.py plan crawl/ --reporters 983 --start-year 1754 --end-year 2018 --years-per-job 10
+    $ python crawl_coordinator.py work crawl/ --processes 4      # on each machine
+    $ python crawl_coordinator.py status crawl/
+"""
+
+
+API_URL = 'https://api.case.law/v1/cases/'
+
+SCHEMA = """
+    create table if not exists jobs (
+        id text primary key,
+        params text not null,
+        status text not null default 'pending',
+        attempts integer not null default 0,
+        available_at real not null default 0,
+        lease_owner text,
+        lease_expires real,
+        cases integer,
+        last_error text,
+        updated real
+    )
+"""
+
+
+def connect(crawl_dir):
+    connection = sqlite3.connect(os.path.join(crawl_dir, 'queue.sqlite3'), timeout=60, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute(SCHEMA)
+    return connection
+
+
+def plan(crawl_dir, reporters=(), courts=(), start_year=1658, end_year=2018, years_per_job=10, full_case=False,
+         page_size=1000):
+    """
+        Add a job for every reporter or court and range of years_per_job years. Jobs already planned are left
+        untouched, so planning again is safe. Return the number of jobs added.
+    """
+    os.makedirs(os.path.join(crawl_dir, 'shards'), exist_ok=True)
+    connection = connect(crawl_dir)
+    added = 0
+    for field, values in (('reporter', reporters), ('court', courts)):
+        for value in values:
+            for year in range(start_year, end_year + 1, years_per_job):
+                last_year = min(year + years_per_job - 1, end_year)
+                job_id = '{}-{}_{}-{}'.format(field, value, year, last_year)
+                params = {field: value, 'decision_date_min': '{}-01-01'.format(year),
+                          'decision_date_max': '{}-12-31'.format(last_year), 'page_size': page_size}
+                if full_case:
+                    params['full_case'] = 'true'
+                cursor = connection.execute("insert or ignore into jobs (id, params, updated) values (?, ?, ?)",
+                                            (job_id, json.dumps(params, sort_keys=True), time.time()))
+                added += cursor.rowcount
+    return added
+
+
+def lease(connection, owner, lease_seconds, max_attempts):
+    """
+        Lease the next available job: pending, or leased with an expired lease. Return it, or None.
+        Jobs that would be available but have no attempts left are marked failed.
+    """
+    now = time.time()
+    connection.execute("begin immediate")
+    try:
+        connection.execute(
+            "update jobs set status = 'failed', updated = ?, "
+            "last_error = coalesce(last_error, 'lease expired on the last attempt') "
+            "where attempts >= ? and (status = 'pending' or (status = 'leased' and lease_expires < ?))",
+            (now, max_attempts, now))
+        job = connection.execute(
+            "select * from jobs where attempts < ? and available_at <= ? and "
+            "(status = 'pending' or (status = 'leased' and lease_expires < ?)) order by id limit 1",
+            (max_attempts, now, now)).fetchone()
+        if job:
+            connection.execute("update jobs set status = 'leased', lease_owner = ?, lease_expires = ?, "
+                               "attempts = attempts + 1, updated = ? where id = ?",
+                               (owner, now + lease_seconds, now, job['id']))
+        connection.execute("commit")
+    except Exception:
+        connection.execute("rollback")
+        raise
+    return job
+
+
+def next_available(connection):
+    """
+        Return the earliest time a job that isn't done or failed could be leased, or None if there is no such job.
+    """
+    return connection.execute(
+        "select min(case status when 'leased' then lease_expires else available_at end) from jobs "
+        "where status in ('pending', 'leased')").fetchone()[0]
+
+
+def heartbeat(connection, job_id, owner, lease_seconds):
+    """
+        Extend a lease. Return False if the job was leased to another worker meanwhile.
+    """
+    cursor = connection.execute("update jobs set lease_expires = ?, updated = ? "
+                                "where id = ? and lease_owner = ? and status = 'leased'",
+                                (time.time() + lease_seconds, time.time(), job_id, owner))
+    return cursor.rowcount == 1
+
+
+def finish(connection, job_id, owner, cases=None, error=None, max_attempts=5, retry_delay=30):
+    """
+        Mark a leased job done, or failed and due for another attempt after an exponential backoff.
+    """
+    if error is None:
+        connection.execute("update jobs set status = 'done', cases = ?, last_error = null, updated = ? "
+                           "where id = ? and lease_owner = ?", (cases, time.time(), job_id, owner))
+        return
+    job = connection.execute("select attempts from jobs where id = ?", (job_id,)).fetchone()
+    status = 'failed' if job['attempts'] >= max_attempts else 'pending'
+    connection.execute("update jobs set status = ?, last_error = ?, available_at = ?, updated = ? "
+                       "where id = ? and lease_owner = ?",
+                       (status, error, time.time() + retry_delay * 2 ** (job['attempts'] - 1), time.time(), job_id,
+                        owner))
+
+
+def api_request(url, api_key=None, timeout=60):
+    """
+        This function takes a url and returns the parsed json object. If necessary, it submits the auth header.
+        A request that gets no response for timeout seconds raises, so a stalled connection fails the job's attempt
+        instead of holding its lease forever.
+    """
+    headers = {'Authorization': 'Token ' + api_key} if api_key else {}
+    response = requests.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def crawl_job(crawl_dir, job, api_url=API_URL, api_key=None, sleep_delay=.25, lost=None, owner=None):
+    """
+        Download every page of a job into its shard. The shard is written under a temporary name unique to the worker
+        (owner, by default hostname-pid, as crawl_dir may be shared between machines) and renamed when complete, so
+        a shard file is always a whole job. Return the number of cases.
+    """
+    owner = owner or '{}-{}'.format(socket.gethostname(), os.getpid())
+    url = api_url + '?' + urlencode(json.loads(job['params']))
+    shard_path = os.path.join(crawl_dir, 'shards', job['id'] + '.jsonl')
+    temporary_path = '{}.{}.tmp'.format(shard_path, owner)
+    cases = 0
+    try:
+        with open(temporary_path, 'w') as shard_file:
+            while url:
+                if lost and lost.is_set():
+                    raise Exception("lease lost")
+                results = api_request(url, api_key)
+                for case in results['results']:
+                    shard_file.write(json.dumps(case) + '\n')
+                cases += len(results['results'])
+                url = results['next']
+                if url:
+                    time.sleep(sleep_delay)
+        os.replace(temporary_path, shard_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return cases
+
+
+def work(crawl_dir, owner=None, api_url=API_URL, api_key=None, lease_seconds=300, heartbeat_seconds=60,
+         max_attempts=5, retry_delay=30, sleep_delay=.25, poll_seconds=60):
+    """
+        Lease and crawl jobs until every job is done or failed. While the remaining jobs wait out a retry delay or are
+        leased by other workers, sleep until the next one could be available (checking at least every poll_seconds).
+        Return the number of jobs completed.
+    """
+    owner = owner or '{}-{}'.format(socket.gethostname(), os.getpid())
+    connection = connect(crawl_dir)
+    completed = 0
+    while True:
+        job = lease(connection, owner, lease_seconds, max_attempts)
+        if not job:
+            available = next_available(connection)
+            if available is None:
+                return completed
+            time.sleep(min(max(available - time.time(), .1), poll_seconds))
+            continue
+
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            beat_connection = connect(crawl_dir)
+            while not stop.wait(heartbeat_seconds):
+                if not heartbeat(beat_connection, job['id'], owner, lease_seconds):
+                    lost.set()
+                    return
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        print("{}: crawling {}".format(owner, job['id']))
+        try:
+            cases = crawl_job(crawl_dir, job, api_url=api_url, api_key=api_key, sleep_delay=sleep_delay, lost=lost,
+                              owner=owner)
+            finish(connection, job['id'], owner, cases=cases)
+            completed += 1
+        except Exception as e:
+            print("{}: {} failed: {}".format(owner, job['id'], e))
+            finish(connection, job['id'], owner, error=str(e), max_attempts=max_attempts, retry_delay=retry_delay)
+        finally:
+            stop.set()
+            beater.join()
+
+
+def run_workers(crawl_dir, processes=1, **kwargs):
+    """
+        Run work() in several local processes, and wait for them.
+    """
+    if processes == 1:
+        return work(crawl_dir, **kwargs)
+    workers = [multiprocessing.Process(target=work, args=(crawl_dir,), kwargs=kwargs) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def status(crawl_dir):
+    """
+        Return {status: (jobs, cases)}, and the jobs that failed for good with their last error.
+    """
+    connection = connect(crawl_dir)
+    counts = {row['status']: (row['jobs'], row['cases'] or 0) for row in connection.execute(
+        "select status, count(*) as jobs, sum(cases) as cases from jobs group by status")}
+    failed = [(row['id'], row['last_error']) for row in connection.execute(
+        "select id, last_error from jobs where status = 'failed' order by id")]
+    return counts, failed
+
+
+def retry_failed(crawl_dir):
+    """
+        Make jobs that failed for good available again, with a fresh attempt count.
+    """
+    connection = connect(crawl_dir)
+    return connection.execute("update jobs set status = 'pending', attempts = 0, available_at = 0 "
+                              "where status = 'failed'").rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Coordinate an API crawl across processes and machines.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('plan', help='add jobs to the queue')
+    command.add_argument('--reporters', nargs='*', default=[], help='reporter ids to crawl')
+    command.add_argument('--courts', nargs='*', default=[], help='court slugs to crawl')
+    command.add_argument('--start-year', type=int, default=1658)
+    command.add_argument('--end-year', type=int, default=2018)
+    command.add_argument('--years-per-job', type=int, default=10)
+    command.add_argument('--full-case', action='store_true', help='download case text (see the API limits)')
+    command.add_argument('--page-size', type=int, default=1000)
+
+    command = commands.add_parser('work', help='crawl jobs until the queue is empty')
+    command.add_argument('--processes', type=int, default=1, help='worker processes on this machine (default 1)')
+    command.add_argument('--api-url', default=API_URL)
+    command.add_argument('--api-key', help='api key (optional; only needed if requesting full text)')
+    command.add_argument('--lease-seconds', type=int, default=300)
+    command.add_argument('--heartbeat-seconds', type=int, default=60)
+    command.add_argument('--max-attempts', type=int, default=5)
+    command.add_argument('--retry-delay', type=float, default=30, help='seconds before the first retry of a failed '
+                                                                        'job, doubling after each attempt (default 30)')
+    command.add_argument('--sleep-delay', type=float, default=.25, help='pause between requests; please be kind')
+
+    commands.add_parser('status', help='print job counts')
+    commands.add_parser('retry-failed', help='retry jobs that ran out of attempts')
+
+    for command in commands.choices.values():
+        command.add_argument('crawl_dir', help='shared crawl directory')
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        added = plan(args.crawl_dir, reporters=args.reporters, courts=args.courts, start_year=args.start_year,
+                     end_year=args.end_year, years_per_job=args.years_per_job, full_case=args.full_case,
+                     page_size=args.page_size)
+        print("Added {} jobs".format(added))
+    elif args.command == 'work':
+        run_workers(args.crawl_dir, processes=args.processes, api_url=args.api_url, api_key=args.api_key,
+                    lease_seconds=args.lease_seconds, heartbeat_seconds=args.heartbeat_seconds,
+                    max_attempts=args.max_attempts, retry_delay=args.retry_delay, sleep_delay=args.sleep_delay)
+    elif args.command == 'status':
+        counts, failed = status(args.crawl_dir)
+        for job_status, (jobs, cases) in sorted(counts.items()):
+            print("{}: {} jobs, {} cases".format(job_status, jobs, cases))
+        for job_id, error in failed:
+            print("failed {}: {}".format(job_id, error))
+    else:
+        print("Retrying {} jobs".format(retry_failed(args.crawl_dir)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
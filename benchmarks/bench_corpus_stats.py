@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import lzma
+import argparse
+import tempfile
+
+import pandas as pd
+
+from benchmarks import fixtures
+
+"""
+    Benchmark of ngrams/corpus_stats.py against the ngrams notebook's approach, on a whole bulk jurisdiction.
+
+    Times building the case and opinion tables, then each breakdown both ways: the notebook's (a list of dicts per
+    case, a boolean DataFrame filter per year and opinion count, nested loops to flatten opinions) and corpus_stats'
+    (single-pass bincounts over columnar tables). Results of both are checked to match.
+
+    Usage (from the repository root):
+
+        $ python -m benchmarks.bench_corpus_stats Illinois          # the real Illinois bulk file (downloaded if needed)
+        $ python -m benchmarks.bench_corpus_stats --synthetic 50000 # offline, with generated cases
+"""
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def notebook_tables(compressed_file):
+    """
+    The notebook's tables: every case in memory, then a metadata DataFrame and a flattened opinions DataFrame.
+    """
+    cases = []
+    with lzma.open(compressed_file) as infile:
+        for line in infile:
+            cases.append(json.loads(str(line, 'utf-8')))
+
+    metadata_df = pd.DataFrame([{'year': int(case['decision_date'][:4]),
+                                 'name': case['name'],
+                                 'citation': case['citations'][0]['cite'],
+                                 'court': case['court']['name'],
+                                 'opinion_count': len(case['casebody']['data']['opinions'])} for case in cases])
+
+    opinion_data = []
+    for case in cases:
+        for opinion in case["casebody"]["data"]["opinions"]:
+            temp = {}
+            keys = list(case.keys())
+            keys.remove('casebody')
+            for key in keys:
+                temp[key] = case[key]
+            for key in opinion.keys():
+                temp[key] = opinion[key]
+            opinion_data.append(temp)
+    return metadata_df, pd.DataFrame(opinion_data)
+
+
+def notebook_opinion_counts_by_year(metadata_df):
+    return [[year,
+             metadata_df[(metadata_df['year'] == year) & (metadata_df["opinion_count"] == 1)].shape[0],
+             metadata_df[(metadata_df['year'] == year) & (metadata_df["opinion_count"] == 2)].shape[0],
+             metadata_df[(metadata_df['year'] == year) & (metadata_df["opinion_count"] == 3)].shape[0],
+             metadata_df[(metadata_df['year'] == year) & (metadata_df["opinion_count"] >= 4)].shape[0]]
+            for year in metadata_df['year'].unique()]
+
+
+def run(compressed_file, processes=None):
+    from ngrams import corpus_stats
+
+    rows = []
+    (metadata_df, opinions_df), seconds = timed(notebook_tables, compressed_file)
+    (cases, opinions), fast_seconds = timed(corpus_stats.build_tables, [compressed_file], processes=processes)
+    rows.append(('build tables', seconds, fast_seconds))
+
+    for name, slow, fast in [
+        ('counts by year', lambda: metadata_df['year'].value_counts().sort_index(),
+         lambda: corpus_stats.counts_by_year(cases)),
+        ('counts by court', lambda: metadata_df['court'].value_counts().sort_index(),
+         lambda: corpus_stats.counts_by_court(cases)),
+        ('opinions by type', lambda: opinions_df['type'].value_counts().sort_index(),
+         lambda: corpus_stats.opinions_by_type(opinions)),
+        ('opinion counts by year', lambda: notebook_opinion_counts_by_year(metadata_df),
+         lambda: corpus_stats.opinion_counts_by_year(cases)),
+    ]:
+        expected, seconds = timed(slow)
+        result, fast_seconds = timed(fast)
+        if name == 'opinion counts by year':
+            expected = sorted(expected)
+            result = [[year] + list(counts) for year, counts in zip(result.index, result.reindex(
+                columns=[1, 2, 3, '4+'], fill_value=0).to_numpy().tolist())]
+            assert [row[1:] for row in expected] == [row[1:] for row in result], name
+        else:
+            assert expected.to_dict() == result.to_dict(), name
+        rows.append((name, seconds, fast_seconds))
+
+    print("%s cases, %s opinions" % (len(cases), len(opinions)))
+    print("%-24s %12s %14s %8s" % ('', 'notebook (s)', 'corpus_stats (s)', 'speedup'))
+    for name, seconds, fast_seconds in rows:
+        print("%-24s %12.4f %14.4f %7.1fx" % (name, seconds, fast_seconds, seconds / max(fast_seconds, 1e-9)))
+    return rows
+
+
+def main():
+    """
+    Parse command line arguments and run the benchmark on a jurisdiction or on synthetic data.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark corpus_stats against the ngrams notebook.')
+    parser.add_argument('jurisdiction', nargs='?', default='Illinois', help='jurisdiction name (default Illinois)')
+    parser.add_argument('--synthetic', type=int, help='use this many generated cases instead of a bulk file')
+    parser.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as data_dir:
+            compressed_file = fixtures.write_jsonl_xz(os.path.join(data_dir, 'data.jsonl.xz'), args.synthetic)
+            run(compressed_file, processes=args.processes)
+    else:
+        import utils
+        run(utils.get_and_extract_from_bulk(jurisdiction=args.jurisdiction, data_format='json'),
+            processes=args.processes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
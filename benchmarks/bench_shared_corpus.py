@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import resource
+import multiprocessing
+from collections import Counter
+
+from benchmarks import fixtures
+
+"""
+    Benchmark of shared_corpus.py against handing pickled case dicts to a multiprocessing pool.
+
+    Both approaches count a word's occurrences per year over every case of a bulk file with the same number of worker
+    processes. Each one runs in a fresh process, and reports its load and map time, the bytes pickled to send tasks to
+    workers, and the peak RSS of the parent and of the largest worker.
+
+    Usage (from the repository root):
+
+        $ python -m benchmarks.bench_shared_corpus --synthetic 50000 --processes 8
+        $ python -m benchmarks.bench_shared_corpus Illinois
+"""
+
+
+WORD = 'witchcraft'
+
+
+def count_cases(cases):
+    """
+    Pickle approach worker: count WORD per year in a list of case dicts.
+    """
+    import utils
+    counts = Counter()
+    for case in cases:
+        year = int(case['decision_date'][:4])
+        for opinion in utils.get_opinions(case):
+            counts[year] += opinion['text'].count(WORD)
+    return counts
+
+
+def count_range(corpus, start, stop):
+    """
+    Shared corpus worker: count WORD per year in a range of cases.
+    """
+    counts = Counter()
+    for index in range(start, stop):
+        counts[int(corpus.year[index])] += corpus.text(index).count(WORD)
+    return counts
+
+
+def run_pickled(compressed_file, processes, chunk_size):
+    import utils
+    start = time.perf_counter()
+    cases = list(utils.read_cases_from_bulk(compressed_file))
+    loaded = time.perf_counter()
+    chunks = [cases[index:index + chunk_size] for index in range(0, len(cases), chunk_size)]
+    sent_bytes = sum(len(pickle.dumps(chunk)) for chunk in chunks)
+    mapped = time.perf_counter()
+    counts = Counter()
+    with multiprocessing.Pool(processes) as pool:
+        for partial in pool.map(count_cases, chunks):
+            counts.update(partial)
+    return counts, loaded - start, time.perf_counter() - mapped, sent_bytes
+
+
+def run_shared(compressed_file, processes, chunk_size):
+    from shared_corpus import SharedCorpus
+    start = time.perf_counter()
+    with SharedCorpus.from_bulk(compressed_file) as corpus:
+        loaded = time.perf_counter()
+        sent_bytes = sum(len(pickle.dumps((count_range, start, stop))) for start, stop in corpus.ranges(chunk_size))
+        mapped = time.perf_counter()
+        counts = Counter()
+        for partial in corpus.map(count_range, processes=processes, chunk_size=chunk_size):
+            counts.update(partial)
+        return counts, loaded - start, time.perf_counter() - mapped, sent_bytes
+
+
+APPROACHES = {'pickle': run_pickled, 'shared': run_shared}
+
+
+def _rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(who).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _run_in_child(name, compressed_file, processes, chunk_size, queue):
+    counts, load_seconds, map_seconds, sent_bytes = APPROACHES[name](compressed_file, processes, chunk_size)
+    queue.put({'total': sum(counts.values()), 'load_seconds': round(load_seconds, 3),
+               'map_seconds': round(map_seconds, 3), 'sent_mb': round(sent_bytes / 1024 / 1024, 2),
+               'parent_rss_mb': round(_rss_mb(resource.RUSAGE_SELF), 1),
+               'worker_rss_mb': round(_rss_mb(resource.RUSAGE_CHILDREN), 1)})
+
+
+def run(compressed_file, processes, chunk_size):
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in APPROACHES:
+        queue = context.Queue()
+        process = context.Process(target=_run_in_child, args=(name, compressed_file, processes, chunk_size, queue))
+        process.start()
+        results[name] = queue.get()
+        process.join()
+        print("%-8s load %7.2f s  map %7.2f s  sent %9.2f MB  parent RSS %7.1f MB  largest worker RSS %7.1f MB" % (
+            name, results[name]['load_seconds'], results[name]['map_seconds'], results[name]['sent_mb'],
+            results[name]['parent_rss_mb'], results[name]['worker_rss_mb']))
+    assert results['pickle']['total'] == results['shared']['total']
+    return results
+
+
+def main():
+    """
+    Parse command line arguments and run both approaches on a jurisdiction or on synthetic data.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark shared_corpus against pickling cases to workers.')
+    parser.add_argument('jurisdiction', nargs='?', default='Illinois', help='jurisdiction name (default Illinois)')
+    parser.add_argument('--synthetic', type=int, help='use this many generated cases instead of a bulk file')
+    parser.add_argument('--processes', type=int, default=4, help='worker processes (default 4)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='cases per task (default 1000)')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as data_dir:
+            compressed_file = fixtures.write_jsonl_xz(os.path.join(data_dir, 'data.jsonl.xz'), args.synthetic)
+            run(compressed_file, args.processes, args.chunk_size)
+    else:
+        import utils
+        run(utils.get_and_extract_from_bulk(jurisdiction=args.jurisdiction, data_format='json'), args.processes,
+            args.chunk_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from benchmarks.run_benchmarks import BASELINES_PATH
+
+"""
+    Startup time regression benchmark for the entry points.
+
+    Imports each entry point module in a fresh interpreter with `python -X importtime`, several times, and reports the
+    best cumulative import time. It fails if an entry point pulls in one of HEAVY_MODULES at import time (they should
+    only load when a command needs them), or if import time grew more than --tolerance over its baseline in
+    benchmarks/baselines.json.
+
+    Usage (from the repository root):
+
+        $ python -m benchmarks.bench_startup --save-baseline
+        $ python -m benchmarks.bench_startup
+"""
+
+
+ENTRY_POINTS = ['cli', 'utils', 'metadata', 'instrumentation']
+HEAVY_MODULES = ['requests', 'urllib3', 'certifi', 'tqdm', 'argparse']
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(module):
+    """
+    Import module in a fresh interpreter. Return (cumulative microseconds for module, names of all modules imported).
+    """
+    code = 'import %s' % module if module else 'pass'
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                               cwd=REPO_ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total = 0
+    imported = set()
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip())
+        if name.strip() == module:
+            total = int(cumulative)
+    return total, imported
+
+
+def measure(modules, repeat=5):
+    """
+    Return {module: {'import_us': best cumulative import time, 'heavy': heavy modules imported}}.
+    """
+    # modules the bare interpreter already loads (e.g. from .pth files) don't count against entry points
+    _, preloaded = import_profile(None)
+    results = {}
+    for module in modules:
+        timings = []
+        heavy = set()
+        for _ in range(repeat):
+            total, imported = import_profile(module)
+            timings.append(total)
+            heavy |= {name for name in imported - preloaded if name.split('.')[0] in HEAVY_MODULES}
+        results[module] = {'import_us': min(timings), 'heavy': sorted(heavy)}
+    return results
+
+
+def main():
+    """
+    Parse command line arguments, measure import times and compare them with baselines.
+    """
+    parser = argparse.ArgumentParser(description='Measure import time of entry points with -X importtime.')
+    parser.add_argument('modules', nargs='*', help='modules to import (default %s)' % ", ".join(ENTRY_POINTS))
+    parser.add_argument('--repeat', type=int, default=5, help='imports per module; the best is kept (default 5)')
+    parser.add_argument('--tolerance', type=float, default=.5, help='allowed regression vs baselines (default .5)')
+    parser.add_argument('--save-baseline', action='store_true', help='write results to benchmarks/baselines.json')
+    args = parser.parse_args()
+
+    results = measure(args.modules or ENTRY_POINTS, repeat=args.repeat)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+
+    regressions = []
+    for module, result in results.items():
+        print("%-16s %8s us  %s" % (module, result['import_us'],
+                                    "imports " + ", ".join(result['heavy']) if result['heavy'] else ""))
+        if result['heavy']:
+            regressions.append("%s imports %s at startup" % (module, ", ".join(result['heavy'])))
+        baseline = baselines.get('startup', {}).get(module)
+        if baseline and result['import_us'] > baseline['import_us'] * (1 + args.tolerance):
+            regressions.append("%s: %s us, baseline %s us" % (module, result['import_us'], baseline['import_us']))
+
+    if args.save_baseline:
+        baselines.setdefault('startup', {}).update(results)
+        with open(BASELINES_PATH, 'w') as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        print("Saved baselines to %s" % BASELINES_PATH)
+        return 0
+
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
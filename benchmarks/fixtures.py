@@ -0,0 +1,107 @@
+import io
+import os
+import json
+import lzma
+import random
+import zipfile
+
+"""
+    Synthetic CAP data for benchmarks: case records shaped like the API's and bulk files' cases, and bulk
+    data.jsonl.xz / zip files of any size. Everything is generated from a seed, so the same arguments always give
+    the same data.
+"""
+
+
+WORDS = ("the court plaintiff defendant appeal judgment evidence contract witness jury trial motion statute "
+         "negligence damages property county state railway company injury verdict error reversed affirmed "
+         "testimony opinion dissent witchcraft turkey horse computer telephone automobile").split()
+
+JURISDICTIONS = [
+    {'id': 29, 'name': 'Ill.', 'name_long': 'Illinois', 'slug': 'ill', 'whitelisted': True},
+    {'id': 34, 'name': 'Ark.', 'name_long': 'Arkansas', 'slug': 'ark', 'whitelisted': True},
+    {'id': 4, 'name': 'Mass.', 'name_long': 'Massachusetts', 'slug': 'mass', 'whitelisted': False},
+]
+
+COURTS = [
+    {'id': 8772, 'name': 'Illinois Supreme Court', 'name_abbreviation': 'Ill.', 'slug': 'ill', 'jurisdiction': 29},
+    {'id': 8837, 'name': 'Illinois Appellate Court', 'name_abbreviation': 'Ill. App. Ct.', 'slug': 'ill-app-ct',
+     'jurisdiction': 29},
+    {'id': 8808, 'name': 'Arkansas Supreme Court', 'name_abbreviation': 'Ark.', 'slug': 'ark', 'jurisdiction': 34},
+    {'id': 15176, 'name': 'Massachusetts Appellate Decisions', 'name_abbreviation': 'Mass. App. Dec.',
+     'slug': 'mass-app-dec', 'jurisdiction': 4},
+]
+
+REPORTERS = [
+    {'id': 1058, 'full_name': 'Illinois Reports', 'short_name': 'Ill.', 'jurisdictions': [29]},
+    {'id': 368, 'full_name': 'Arkansas Reports', 'short_name': 'Ark.', 'jurisdictions': [34]},
+    {'id': 579, 'full_name': 'Massachusetts Appellate Decisions', 'short_name': 'Mass. App. Dec.',
+     'jurisdictions': [4]},
+]
+
+
+def make_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+
+def make_case(case_id, api_url="http://localhost/v1/", words=300, seed=0):
+    """
+    Return one full case (casebody included) with text of roughly the given number of words.
+    """
+    rng = random.Random(seed * 1000003 + case_id)
+    court = COURTS[case_id % len(COURTS)]
+    jurisdiction = next(jur for jur in JURISDICTIONS if jur['id'] == court['jurisdiction'])
+    reporter = next(rep for rep in REPORTERS if jurisdiction['id'] in rep['jurisdictions'])
+    volume = 1 + case_id // 100
+    first_page = 1 + case_id % 100 * 5
+    opinions = [{'type': 'majority', 'author': 'Mr. Justice %s' % rng.choice(['Cartwright', 'Craig', 'Carter']),
+                 'text': make_text(rng, words)}]
+    if case_id % 7 == 0:
+        opinions.append({'type': 'dissent', 'author': 'Mr. Justice Magruder', 'text': make_text(rng, words // 3)})
+
+    return {
+        'id': case_id,
+        'url': '%scases/%s/' % (api_url, case_id),
+        'frontend_url': 'https://cite.case.law/%s/%s/%s/' % (reporter['short_name'].lower(), volume, first_page),
+        'name': '%s v. %s' % (rng.choice(WORDS).title(), rng.choice(WORDS).title()),
+        'name_abbreviation': '%s v. %s' % (rng.choice(WORDS).title(), rng.choice(WORDS).title()),
+        'decision_date': '%s-%02d-%02d' % (1850 + case_id % 170, 1 + case_id % 12, 1 + case_id % 28),
+        'docket_number': 'No. %s' % case_id,
+        'first_page': str(first_page),
+        'last_page': str(first_page + 4),
+        'citations': [{'cite': '%s %s %s' % (volume, reporter['short_name'], first_page), 'type': 'official'}],
+        'volume': {'volume_number': str(volume)},
+        'reporter': {'id': reporter['id'], 'full_name': reporter['full_name']},
+        'court': dict(court, url='%scourts/%s/' % (api_url, court['slug'])),
+        'jurisdiction': dict(jurisdiction, url='%sjurisdictions/%s/' % (api_url, jurisdiction['slug'])),
+        'casebody': {'status': 'ok', 'data': {'head_matter': make_text(rng, 40), 'judges': [], 'attorneys': [],
+                                              'parties': [], 'opinions': opinions}},
+    }
+
+
+def make_cases(count, api_url="http://localhost/v1/", words=300, seed=0):
+    return [make_case(case_id, api_url=api_url, words=words, seed=seed) for case_id in range(1, count + 1)]
+
+
+def write_jsonl_xz(path, count, words=300, seed=0):
+    """
+    Write a bulk-style data.jsonl.xz file of count synthetic cases.
+    """
+    with lzma.open(path, 'wb') as out_file:
+        for case_id in range(1, count + 1):
+            out_file.write((json.dumps(make_case(case_id, words=words, seed=seed)) + '\n').encode('utf-8'))
+    return path
+
+
+def make_bulk_zip(name, count, words=300, seed=0):
+    """
+    Return the bytes of a bulk zip file laid out like the API's: <name>/data/data.jsonl.xz
+    """
+    jsonl = io.BytesIO()
+    with lzma.open(jsonl, 'wb') as out_file:
+        for case_id in range(1, count + 1):
+            out_file.write((json.dumps(make_case(case_id, words=words, seed=seed)) + '\n').encode('utf-8'))
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr(os.path.join(name, 'data', 'data.jsonl.xz'), jsonl.getvalue())
+    return archive.getvalue()
@@ -0,0 +1,225 @@
+import gzip
+import time
+import json
+import random
+import threading
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import fixtures
+
+"""
+    A local stand-in for the CAP API, serving synthetic data:
+
+    - /v1/cases/ (paginated with a cursor; search, jurisdiction, court and page_size filters),
+    - /v1/cases/<id>/, /v1/courts/, /v1/jurisdictions/ and /v1/reporters/,
+    - /v1/bulk/ listing one zip per jurisdiction, downloadable from /download/<file> with Range support.
+
+    JSON responses are gzip-compressed for clients that accept it, as the real API's are. Every response can be
+    delayed by a fixed latency, and a fraction of them can fail with a 500, to see how clients cope. Each request's
+    path, status and handling time are recorded in server.requests.
+
+    Usage:
+
+        with MockCapServer(case_count=5000, latency=.01) as server:
+            settings.API_URL = server.url
+            ...
+"""
+
+
+class MockCapServer(object):
+    """
+    Runs the mock API in a background thread on a free local port.
+    """
+
+    def __init__(self, case_count=1000, words=300, page_size=100, latency=0, error_rate=0, bulk_cases=1000, seed=0,
+                 host='127.0.0.1', port=0):
+        self.case_count = case_count
+        self.words = words
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bulk_cases = bulk_cases
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.url = 'http://%s:%s' % self.httpd.server_address
+        self.api_url = self.url + '/v1/'
+        self.cases = fixtures.make_cases(case_count, api_url=self.api_url, words=words, seed=seed)
+        self.filtered = {}
+        self._bulk_files = {}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def bulk_file(self, name):
+        """
+        Bulk zip bytes for a jurisdiction, generated on first request.
+        """
+        with self.lock:
+            if name not in self._bulk_files:
+                self._bulk_files[name] = fixtures.make_bulk_zip(name, self.bulk_cases, words=self.words,
+                                                                seed=self.seed)
+            return self._bulk_files[name]
+
+    def should_fail(self):
+        with self.lock:
+            return self.error_rate and self.random.random() < self.error_rate
+
+    def record(self, path, status, seconds):
+        with self.lock:
+            self.requests.append((path, status, seconds))
+
+
+def _bulk_name(jurisdiction, body_format):
+    return '%s-20200302-%s' % (jurisdiction['name_long'], body_format)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes: without TCP_NODELAY, kept-alive clients wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        mock = self.server.mock
+        start = time.perf_counter()
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+
+        if mock.should_fail():
+            status = self.send_json({'detail': 'Simulated server error'}, 500)
+        elif parts[:1] == ['download'] and len(parts) == 2:
+            status = self.send_bulk_file(parts[1])
+        elif parts[:1] != ['v1']:
+            status = self.send_json({'detail': 'Not found.'}, 404)
+        elif len(parts) == 1:
+            status = self.send_json({resource: '%s%s/' % (mock.api_url, resource)
+                                     for resource in ['cases', 'jurisdictions', 'courts', 'reporters', 'bulk']})
+        elif parts[1] == 'cases' and len(parts) == 3:
+            case = next((case for case in mock.cases if str(case['id']) == parts[2]), None)
+            status = self.send_json(self.strip(case, query) if case else {'detail': 'Not found.'}, 200 if case else 404)
+        elif parts[1] == 'cases':
+            status = self.send_page(self.filter_cases(query), query, url.path)
+        elif parts[1] in ('jurisdictions', 'courts', 'reporters'):
+            records = {'jurisdictions': fixtures.JURISDICTIONS, 'courts': fixtures.COURTS,
+                       'reporters': fixtures.REPORTERS}[parts[1]]
+            status = self.send_page(records, query, url.path)
+        elif parts[1] == 'bulk':
+            body_format = query.get('body_format', 'text')
+            status = self.send_json({'count': len(fixtures.JURISDICTIONS), 'next': None, 'previous': None,
+                                     'results': [{'file_name': _bulk_name(jur, body_format) + '.zip',
+                                                  'download_url': '%s/download/%s.zip' % (
+                                                      mock.url, _bulk_name(jur, body_format)),
+                                                  'jurisdiction': jur['slug']}
+                                                 for jur in fixtures.JURISDICTIONS]})
+        else:
+            status = self.send_json({'detail': 'Not found.'}, 404)
+
+        mock.record(url.path, status, time.perf_counter() - start)
+
+    def filter_cases(self, query):
+        mock = self.server.mock
+        key = tuple(sorted((name, value) for name, value in query.items() if name != 'cursor'))
+        with mock.lock:
+            if key in mock.filtered:
+                return mock.filtered[key]
+        cases = mock.cases
+        if query.get('jurisdiction'):
+            cases = [case for case in cases if case['jurisdiction']['slug'] == query['jurisdiction']]
+        if query.get('court'):
+            cases = [case for case in cases if case['court']['slug'] == query['court']]
+        if query.get('search'):
+            terms = query['search'].lower().split()
+            cases = [case for case in cases
+                     if all(term in case['casebody']['data']['opinions'][0]['text'] for term in terms)]
+        if query.get('decision_date_min'):
+            cases = [case for case in cases if case['decision_date'] >= query['decision_date_min']]
+        if query.get('decision_date_max'):
+            cases = [case for case in cases if case['decision_date'] <= query['decision_date_max']]
+        if query.get('ordering'):
+            field = query['ordering'].lstrip('-')
+            cases = sorted(cases, key=lambda case: case[field], reverse=query['ordering'].startswith('-'))
+        cases = [self.strip(case, query) for case in cases]
+        with mock.lock:
+            mock.filtered[key] = cases
+        return cases
+
+    def strip(self, case, query):
+        if query.get('full_case') == 'true':
+            return case
+        return {key: value for key, value in case.items() if key != 'casebody'}
+
+    def send_page(self, records, query, path):
+        mock = self.server.mock
+        offset = int(query.get('cursor', 0))
+        page_size = int(query.get('page_size', mock.page_size))
+        next_url = None
+        if offset + page_size < len(records):
+            next_url = '%s%s?%s' % (mock.url, path, urlencode(dict(query, cursor=offset + page_size)))
+        return self.send_json({'count': len(records), 'next': next_url, 'previous': None,
+                               'results': records[offset:offset + page_size]})
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if compress:
+            body = gzip.compress(body, compresslevel=6)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def send_bulk_file(self, file_name):
+        body = self.server.mock.bulk_file(file_name.split('.zip')[0])
+        status = 200
+        start, end = 0, len(body) - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, _, last = range_header[len('bytes='):].partition('-')
+            start = int(first) if first else max(0, len(body) - int(last))
+            end = min(int(last), len(body) - 1) if first and last else len(body) - 1
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */%s' % len(body))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return 416
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', 'bytes %s-%s/%s' % (start, end, len(body)))
+        self.end_headers()
+        self.wfile.write(body[start:end + 1])
+        return status
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+import multiprocessing
+from queue import Empty
+
+from benchmarks.mock_server import MockCapServer
+
+"""
+    Offline benchmarks of the API client, CSV export, bulk ingest and search paths, run against a local mock API.
+
+    Each benchmark runs in a fresh process (so peak memory is its own) and reports throughput, p50/p99 latency of its
+    unit of work (an API page, or a chunk of bulk cases) and peak RSS. Results are compared with
+    benchmarks/baselines.json, and the script exits non-zero if a benchmark got slower or hungrier than its baseline
+    by more than --tolerance.
+
+    Usage (from the repository root):
+
+        $ python -m benchmarks.run_benchmarks                         # run everything, compare with baselines
+        $ python -m benchmarks.run_benchmarks crawl export --latency .02 --error-rate .01
+        $ python -m benchmarks.run_benchmarks --save-baseline         # record this machine's numbers as baselines
+
+    Baselines are machine-specific: record them on the machine you compare on.
+"""
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+MAX_ATTEMPTS = 5
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def configure_settings(api_root, data_dir):
+    """
+    Point the shared settings at the mock server and a scratch data directory.
+    """
+    from config import settings
+    settings.API_URL = api_root
+    settings.API_VERSION = 'v1'
+    settings.API_BULK_URL = api_root + '/v1/bulk'
+    settings.DATA_DIR = data_dir
+    return settings
+
+
+def bench_crawl(api_root, data_dir, options):
+    """
+    Page through every case with the python wrapper, as download_to_csv does.
+    """
+    from python_wrapper.cap import Cap
+    cap = Cap()
+    latencies = []
+    items = errors = 0
+    url = cap.search_cases(uri_only=True) + '?page_size=%s' % options['page_size']
+    attempts = 0
+    while url:
+        start = time.perf_counter()
+        try:
+            page = cap._request(url).json()
+        except Exception:
+            errors += 1
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                raise Exception("Giving up on %s after %s attempts" % (url, attempts))
+            continue
+        attempts = 0
+        latencies.append(time.perf_counter() - start)
+        items += len(page['results'])
+        url = page['next']
+    return items, latencies, errors
+
+
+def bench_export(api_root, data_dir, options):
+    """
+    Export every case to CSV with api_to_csv.
+    """
+    from api_to_csv import api_to_csv
+    latencies = []
+    items = 0
+    start = time.perf_counter()
+    url = '%s/v1/cases/?page_size=%s' % (api_root, options['page_size'])
+    for result in api_to_csv.get_results(url):
+        items += 1
+        if items % options['page_size'] == 0:
+            latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+    return items, latencies, 0
+
+
+def bench_bulk_ingest(api_root, data_dir, options):
+    """
+    Download and extract a bulk file, then read every case of it.
+    """
+    import utils
+    latencies = []
+    items = 0
+    compressed_file = utils.get_cases_from_bulk(jurisdiction="Illinois", data_format="json")
+    start = time.perf_counter()
+    for _ in utils.read_cases_from_bulk(compressed_file):
+        items += 1
+        if items % 1000 == 0:
+            latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+    return items, latencies, 0
+
+
+def bench_search(api_root, data_dir, options):
+    """
+    Run api_text_search over a term matching most cases, and count the cases written.
+    """
+    from api_text_search import api_text_search
+    start = time.perf_counter()
+    api_text_search.extract(word=options['search_term'])
+    seconds = time.perf_counter() - start
+    with open(os.path.join(data_dir, '%s.json' % options['search_term'])) as results_file:
+        items = sum(len(cases) for cases in json.load(results_file).values())
+    return items, [seconds], 0
+
+
+def bench_search_jsonl(api_root, data_dir, options):
+    """
+    Like bench_search, streaming cases to per-jurisdiction jsonl shards instead.
+    """
+    from api_text_search import api_text_search
+    start = time.perf_counter()
+    index_path = api_text_search.extract(word=options['search_term'], out_format='jsonl')
+    seconds = time.perf_counter() - start
+    with open(index_path) as index_file:
+        items = json.load(index_file)['cases']
+    return items, [seconds], 0
+
+
+BENCHMARKS = {
+    'crawl': bench_crawl,
+    'export': bench_export,
+    'bulk_ingest': bench_bulk_ingest,
+    'search': bench_search,
+    'search_jsonl': bench_search_jsonl,
+}
+
+
+def _run_in_child(name, api_root, options, queue):
+    with tempfile.TemporaryDirectory() as data_dir:
+        configure_settings(api_root, data_dir)
+        start = time.perf_counter()
+        items, latencies, errors = BENCHMARKS[name](api_root, data_dir, options)
+        seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    queue.put({
+        'items': items,
+        'seconds': round(seconds, 3),
+        'items_per_second': round(items / seconds, 1) if seconds else 0,
+        'p50_ms': round(percentile(latencies, .5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, .99) * 1000, 2),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'errors': errors,
+    })
+
+
+def run_benchmark(name, api_root, options):
+    """
+    Run one benchmark in a fresh process and return its results, or {'error': ...} if the process failed.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_in_child, args=(name, api_root, options, queue))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive():
+                # the child may have put its result just before exiting
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    result = {'error': 'benchmark process exited with code %s' % process.exitcode}
+    process.join()
+    return result
+
+
+def compare(results, baselines, tolerance):
+    """
+    Return a list of regression messages: throughput lower, or p99 latency or peak RSS higher than the baseline
+    by more than tolerance.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if not baseline or 'error' in result:
+            continue
+        if result['items_per_second'] < baseline['items_per_second'] * (1 - tolerance):
+            regressions.append("%s: %s items/s, baseline %s" % (
+                name, result['items_per_second'], baseline['items_per_second']))
+        if result['p99_ms'] > baseline['p99_ms'] * (1 + tolerance):
+            regressions.append("%s: p99 %s ms, baseline %s" % (name, result['p99_ms'], baseline['p99_ms']))
+        if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+            regressions.append("%s: peak RSS %s MB, baseline %s" % (
+                name, result['peak_rss_mb'], baseline['peak_rss_mb']))
+    return regressions
+
+
+def main():
+    """
+    Parse command line arguments, start the mock server, run benchmarks and compare them with baselines.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark CAP example code against a local mock API.')
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run (default all): %s' % ", ".join(BENCHMARKS))
+    parser.add_argument('--cases', type=int, default=5000, help='cases served by the mock API (default 5000)')
+    parser.add_argument('--bulk-cases', type=int, default=5000, help='cases in each bulk file (default 5000)')
+    parser.add_argument('--words', type=int, default=300, help='words per opinion (default 300)')
+    parser.add_argument('--page-size', type=int, default=100, help='cases per API page (default 100)')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response (default 0)')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of responses failing with a 500')
+    parser.add_argument('--search-term', default='witchcraft', help='term for the search benchmark')
+    parser.add_argument('--tolerance', type=float, default=.2, help='allowed regression vs baselines (default .2)')
+    parser.add_argument('--save-baseline', action='store_true', help='write results to benchmarks/baselines.json')
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    args = parser.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    options = {'page_size': args.page_size, 'search_term': args.search_term}
+    results = {}
+    with MockCapServer(case_count=args.cases, words=args.words, page_size=args.page_size, latency=args.latency,
+                       error_rate=args.error_rate, bulk_cases=args.bulk_cases) as server:
+        for name in names:
+            results[name] = run_benchmark(name, server.url, options)
+            if args.json:
+                continue
+            if 'error' in results[name]:
+                print("%-12s FAILED: %s" % (name, results[name]['error']))
+            else:
+                print("%-12s %8s items %10s items/s  p50 %8s ms  p99 %8s ms  peak RSS %7s MB  %s errors" % (
+                    name, results[name]['items'], results[name]['items_per_second'], results[name]['p50_ms'],
+                    results[name]['p99_ms'], results[name]['peak_rss_mb'], results[name]['errors']))
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+
+    failed = [name for name, result in results.items() if 'error' in result]
+    if args.save_baseline:
+        baselines.update({name: result for name, result in results.items() if name not in failed})
+        with open(BASELINES_PATH, 'w') as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        print("Saved baselines to %s" % BASELINES_PATH)
+        return 1 if failed else 0
+
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import csv
+import json
+import sys
+import argparse
+from collections import Counter
+from multiprocessing import Pool
+
+import utils
+
+"""
+    Count every judge's opinions by year, court and opinion type across whole bulk jurisdictions.
+
+    The cartwright notebook builds a DataFrame of every parsed case and filters it in memory, which only works for one
+    jurisdiction at a time and has to be redone for every question. This script streams each bulk file once, counts
+    opinions in worker processes, and merges their partial counts. Counts are plain Counters keyed by
+    (author, year, court, opinion type), so partial results from any chunk or jurisdiction can simply be added together.
+
+    The result is written to a small CSV table (one row per author/year/court/type) which can be loaded and queried
+    later without re-parsing any XML.
+
+    Usage (from the repository root):
+
+        $ python -m bulk_exploration.prolificness Illinois Arkansas --data-format xml --out-path data/prolificness.csv
+
+    Then, in a notebook:
+
+        counts = prolificness.load_table("../data/prolificness.csv")
+        prolificness.opinions_by_year(counts, author="Mr. Justice Cartwright")
+"""
+
+
+FIELDNAMES = ['author', 'year', 'court', 'type', 'count']
+
+
+def clean_author(author):
+    """
+    Normalize whitespace in an author line, and fold every per curiam spelling into one name.
+    """
+    author = " ".join(author.replace(u'\xad', '').split())
+    if "curiam" in author.lower():
+        return "Per Curiam."
+    return author
+
+
+def count_opinions(cases):
+    """
+    Count opinions of the given cases, keyed by (author, year, court, opinion type).
+    Opinions without an author are skipped.
+    """
+    counts = Counter()
+    for case in cases:
+        year = int(case['decision_date'][:4])
+        court = case['court']['name']
+        for opinion in utils.get_opinions(case):
+            author = clean_author(opinion['author'])
+            if author:
+                counts[(author, year, court, opinion['type'])] += 1
+    return counts
+
+
+def _count_chunk(lines):
+    """
+    Worker: decode a chunk of raw bulk lines and count its opinions.
+    """
+    return count_opinions(json.loads(str(line, 'utf-8')) for line in lines)
+
+
+def aggregate(compressed_files, processes=None, chunk_size=1000):
+    """
+    Stream every bulk file once and return the merged opinion counts.
+    Chunks of all files are shared across one pool of worker processes.
+    """
+    def chunks():
+        for compressed_file in compressed_files:
+            utils.print_info("counting opinions in %s" % compressed_file)
+            for chunk in utils.read_chunks_from_bulk(compressed_file, chunk_size=chunk_size):
+                yield chunk
+
+    counts = Counter()
+    with Pool(processes) as pool:
+        for partial in pool.imap_unordered(_count_chunk, chunks()):
+            counts.update(partial)
+    return counts
+
+
+def aggregate_jurisdictions(jurisdictions, data_format="xml", processes=None, chunk_size=1000):
+    """
+    Download bulk files of the given jurisdictions if needed, and return their merged opinion counts.
+    """
+    compressed_files = [utils.get_and_extract_from_bulk(jurisdiction=jurisdiction, data_format=data_format)
+                        for jurisdiction in jurisdictions]
+    return aggregate(compressed_files, processes=processes, chunk_size=chunk_size)
+
+
+def write_table(counts, out_path):
+    """
+    Write opinion counts to a CSV table, sorted by author, year, court and type.
+    """
+    with open(out_path, 'w', newline='', encoding='utf-8') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(FIELDNAMES)
+        for (author, year, court, opinion_type), count in sorted(counts.items()):
+            writer.writerow([author, year, court, opinion_type, count])
+
+
+def load_table(path):
+    """
+    Load a table written by write_table back into opinion counts.
+    """
+    counts = Counter()
+    with open(path, newline='', encoding='utf-8') as in_file:
+        for row in csv.DictReader(in_file):
+            counts[(row['author'], int(row['year']), row['court'], row['type'])] += int(row['count'])
+    return counts
+
+
+def query(counts, author=None, year=None, court=None, opinion_type=None):
+    """
+    Return the subset of opinion counts matching every given field. author matches as a substring.
+    """
+    return Counter({key: count for key, count in counts.items()
+                    if (author is None or author in key[0])
+                    and (year is None or key[1] == year)
+                    and (court is None or key[2] == court)
+                    and (opinion_type is None or key[3] == opinion_type)})
+
+
+def opinions_by_author(counts):
+    """
+    Return total opinion counts per author, most prolific first.
+    """
+    totals = Counter()
+    for (author, _, _, _), count in counts.items():
+        totals[author] += count
+    return totals.most_common()
+
+
+def opinions_by_year(counts, author=None, court=None, opinion_type=None):
+    """
+    Return a sorted list of (year, opinion count) tuples, e.g. for plotting one judge's output over time.
+    """
+    years = Counter()
+    for (_, year, _, _), count in query(counts, author=author, court=court, opinion_type=opinion_type).items():
+        years[year] += count
+    return sorted(years.items())
+
+
+def main():
+    """
+    Parse command line arguments, count opinions and write the table.
+    """
+    parser = argparse.ArgumentParser(description='Count opinions per judge by year, court and type from bulk data.')
+    parser.add_argument('jurisdictions', nargs='+', help='jurisdiction names, e.g. Illinois Arkansas')
+    parser.add_argument('--data-format', default='xml', help='bulk casebody format, xml or json (default xml)')
+    parser.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='cases per worker task (default 1000)')
+    parser.add_argument('--out-path', default='prolificness.csv', help='output CSV path (default prolificness.csv)')
+    args = parser.parse_args()
+
+    counts = aggregate_jurisdictions(args.jurisdictions, data_format=args.data_format,
+                                     processes=args.processes, chunk_size=args.chunk_size)
+    write_table(counts, args.out_path)
+    utils.print_info("Wrote %s rows to %s" % (len(counts), args.out_path))
+    for author, count in opinions_by_author(counts)[:10]:
+        print("%s: %s" % (author, count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
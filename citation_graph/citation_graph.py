@@ -0,0 +1,396 @@
+import os
+import re
+import sys
+import json
+import argparse
+from array import array
+from multiprocessing import Pool
+
+import numpy as np
+
+import utils
+
+"""
+    Build a citation graph of whole bulk jurisdictions, and query it.
+
+    Bulk files are streamed once. Worker processes pull citation strings like "123 Ill. App. 3d 456" out of every
+    opinion, and the main process resolves them to case ids through a hash index of every case's own citations.
+    Citations of cases outside the processed jurisdictions stay unresolved and are dropped.
+
+    The graph is stored as compressed sparse row (CSR) adjacency, in both directions, in plain .npy files:
+
+        case_ids.npy      sorted case ids; a case's position in this array is its node number
+        indptr.npy        cases cited by node n are indices[indptr[n]:indptr[n + 1]]
+        indices.npy
+        in_indptr.npy     cases citing node n are in_indices[in_indptr[n]:in_indptr[n + 1]]
+        in_indices.npy
+        citations.tsv     normalized citation -> case id, to look cases up by cite
+
+    Arrays are memory-mapped when loaded, so opening a graph of millions of edges is instant and only the pages a query
+    touches are read. Degrees, k-hop neighborhoods and PageRank are computed with vectorized numpy over those arrays.
+
+    Usage (from the repository root):
+
+        $ python -m citation_graph.citation_graph build Illinois Arkansas --out-dir data/citation_graph
+        $ python -m citation_graph.citation_graph top data/citation_graph --limit 20
+        $ python -m citation_graph.citation_graph case data/citation_graph "91 Ill. 2d 1" --hops 2
+
+    Or, in a notebook:
+
+        graph = citation_graph.CitationGraph("../data/citation_graph")
+        graph.in_degree(graph.lookup("91 Ill. 2d 1"))
+"""
+
+
+# volume, reporter abbreviation (e.g. "Ill.", "N.E.2d", "Ill. App. 3d"), page
+CITE_RE = re.compile(r"\b(\d{1,4})\s+((?:[A-Z][A-Za-z.']*|\d(?:d|th|st|nd|rd)\b)(?:\s?(?:[A-Z][A-Za-z.']*|\d(?:d|th|st|nd|rd)\b)){0,5})\s+(\d{1,5})\b")
+
+
+def _normalize(volume, reporter, page):
+    return "%s %s %s" % (int(volume), reporter.replace('.', '').replace(' ', '').lower(), int(page))
+
+
+def normalize_cite(cite):
+    """
+    Return the normalized form of a citation string ("12 N. E. 2d 345" -> "12 ne2d 345"), or None if it doesn't
+    look like a citation.
+    """
+    match = CITE_RE.search(cite)
+    return _normalize(*match.groups()) if match else None
+
+
+def extract_cites(text):
+    """
+    Return the normalized citations found in a piece of text.
+    """
+    return [_normalize(*match.groups()) for match in CITE_RE.finditer(text)]
+
+
+def case_citations(case):
+    """
+    Return (case id, the case's own normalized citations, normalized citations found in its opinions).
+    """
+    own = [cite for cite in (normalize_cite(citation['cite']) for citation in case.get('citations', [])) if cite]
+    cited = set()
+    for opinion in utils.get_opinions(case):
+        cited.update(extract_cites(opinion['text']))
+    cited.difference_update(own)
+    return case['id'], own, sorted(cited)
+
+
+def _extract_chunk(lines):
+    """
+    Worker: decode a chunk of raw bulk lines and extract their citations.
+    """
+    return [case_citations(json.loads(str(line, 'utf-8'))) for line in lines]
+
+
+def collect(records):
+    """
+    Resolve (case id, own cites, cited cites) records into edges.
+
+    Every distinct citation string is interned once into cite_tokens; edges are kept as two compact arrays of
+    (citing node, cited token) until every case has been seen and the tokens can be resolved.
+    Return (case ids by node, citing nodes, cited nodes, {normalized cite: case id}); unresolved edges are dropped.
+    """
+    case_ids = array('q')
+    cite_tokens = {}
+    token_nodes = array('q')
+    sources = array('q')
+    targets = array('q')
+
+    def token(cite):
+        if cite not in cite_tokens:
+            cite_tokens[cite] = len(token_nodes)
+            token_nodes.append(-1)
+        return cite_tokens[cite]
+
+    for case_id, own, cited in records:
+        node = len(case_ids)
+        case_ids.append(case_id)
+        for cite in own:
+            token_nodes[token(cite)] = node
+        for cite in cited:
+            sources.append(node)
+            targets.append(token(cite))
+
+    token_nodes = np.frombuffer(token_nodes, dtype=np.int64)
+    sources = np.frombuffer(sources, dtype=np.int64)
+    targets = token_nodes[np.frombuffer(targets, dtype=np.int64)]
+    resolved = (targets >= 0) & (targets != sources)
+    cite_index = {cite: case_ids[token_nodes[index]] for cite, index in cite_tokens.items()
+                  if token_nodes[index] >= 0}
+    return np.frombuffer(case_ids, dtype=np.int64), sources[resolved], targets[resolved], cite_index
+
+
+def _indptr(sources, node_count):
+    """
+    Return the CSR row pointer of edges sorted by source.
+    """
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    return indptr
+
+
+def write_graph(out_dir, case_ids, sources, targets, cite_index):
+    """
+    Write a graph returned by collect() to out_dir. Nodes are renumbered in case id order, and duplicate edges are
+    dropped.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    order = np.argsort(case_ids, kind='stable')
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    node_count = len(case_ids)
+
+    edges = np.unique(renumber[sources] * node_count + renumber[targets])
+    sources, targets = edges // node_count, edges % node_count
+
+    # np.unique sorted edges by citing node, then cited node; a stable sort by cited node gives the reverse graph
+    in_order = np.argsort(targets, kind='stable')
+    indptr, indices = _indptr(sources, node_count), targets.astype(np.int32)
+    in_indptr, in_indices = _indptr(targets, node_count), sources[in_order].astype(np.int32)
+    np.save(os.path.join(out_dir, 'case_ids.npy'), case_ids[order])
+    np.save(os.path.join(out_dir, 'indptr.npy'), indptr)
+    np.save(os.path.join(out_dir, 'indices.npy'), indices)
+    np.save(os.path.join(out_dir, 'in_indptr.npy'), in_indptr)
+    np.save(os.path.join(out_dir, 'in_indices.npy'), in_indices)
+    with open(os.path.join(out_dir, 'citations.tsv'), 'w', encoding='utf-8') as out_file:
+        for cite, case_id in sorted(cite_index.items()):
+            out_file.write("%s\t%s\n" % (cite, case_id))
+    return len(edges)
+
+
+def build(compressed_files, out_dir, processes=None, chunk_size=1000):
+    """
+    Stream every bulk file once, extracting citations in worker processes, and write the graph to out_dir.
+    Return (case count, edge count).
+    """
+    def chunks():
+        for compressed_file in compressed_files:
+            utils.print_info("extracting citations from %s" % compressed_file)
+            for chunk in utils.read_chunks_from_bulk(compressed_file, chunk_size=chunk_size):
+                yield chunk
+
+    def records(pool):
+        for chunk in pool.imap(_extract_chunk, chunks()):
+            for record in chunk:
+                yield record
+
+    with Pool(processes) as pool:
+        case_ids, sources, targets, cite_index = collect(records(pool))
+    edge_count = write_graph(out_dir, case_ids, sources, targets, cite_index)
+    return len(case_ids), edge_count
+
+
+def build_jurisdictions(jurisdictions, out_dir, data_format="json", processes=None, chunk_size=1000):
+    """
+    Download bulk files of the given jurisdictions if needed, and build their citation graph.
+    """
+    compressed_files = [utils.get_and_extract_from_bulk(jurisdiction=jurisdiction, data_format=data_format)
+                        for jurisdiction in jurisdictions]
+    return build(compressed_files, out_dir, processes=processes, chunk_size=chunk_size)
+
+
+def _neighbors(indptr, indices, nodes):
+    """
+    Return the concatenated adjacency lists of many nodes at once, without a python loop.
+    """
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=indices.dtype)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+    return indices[offsets]
+
+
+class CitationGraph(object):
+    """
+    A citation graph written by write_graph(), memory-mapped from disk.
+    Methods take and return case ids; node numbers are only used internally.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        self.case_ids = load('case_ids')
+        self.indptr = load('indptr')
+        self.indices = load('indices')
+        self.in_indptr = load('in_indptr')
+        self.in_indices = load('in_indices')
+        self._cite_index = None
+
+    def __len__(self):
+        return len(self.case_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def nodes(self, case_ids):
+        """
+        Return node numbers of case ids. Raise KeyError for cases not in the graph.
+        """
+        case_ids = np.atleast_1d(np.asarray(case_ids, dtype=np.int64))
+        nodes = np.searchsorted(self.case_ids, case_ids)
+        found = nodes < len(self.case_ids)
+        found[found] = self.case_ids[nodes[found]] == case_ids[found]
+        if not found.all():
+            raise KeyError("Cases not in graph: %s" % case_ids[~found].tolist())
+        return nodes
+
+    def lookup(self, cite):
+        """
+        Return the id of the case with the given citation, or None.
+        """
+        if self._cite_index is None:
+            self._cite_index = {}
+            with open(os.path.join(self.path, 'citations.tsv'), encoding='utf-8') as in_file:
+                for line in in_file:
+                    normalized, case_id = line.rstrip('\n').split('\t')
+                    self._cite_index[normalized] = int(case_id)
+        return self._cite_index.get(normalize_cite(cite))
+
+    def out_degrees(self):
+        """
+        Number of cases each case cites, by node.
+        """
+        return np.diff(self.indptr)
+
+    def in_degrees(self):
+        """
+        Number of cases citing each case, by node.
+        """
+        return np.diff(self.in_indptr)
+
+    def out_degree(self, case_id):
+        node = self.nodes(case_id)[0]
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def in_degree(self, case_id):
+        node = self.nodes(case_id)[0]
+        return int(self.in_indptr[node + 1] - self.in_indptr[node])
+
+    def cites(self, case_id):
+        """
+        Return ids of the cases a case cites.
+        """
+        return self.case_ids[_neighbors(self.indptr, self.indices, self.nodes(case_id))]
+
+    def cited_by(self, case_id):
+        """
+        Return ids of the cases citing a case.
+        """
+        return self.case_ids[_neighbors(self.in_indptr, self.in_indices, self.nodes(case_id))]
+
+    def k_hop(self, case_ids, hops=2, direction='out'):
+        """
+        Breadth-first search from one or more cases, following citations ('out'), citing cases ('in') or both.
+        Return (case ids, distances) of every case reached within hops, excluding the start cases.
+        """
+        if direction not in ('out', 'in', 'both'):
+            raise Exception("Unknown direction %s. Use out, in or both." % direction)
+        distances = np.full(len(self.case_ids), -1, dtype=np.int32)
+        frontier = np.unique(self.nodes(case_ids))
+        distances[frontier] = 0
+        for hop in range(1, hops + 1):
+            reached = []
+            if direction in ('out', 'both'):
+                reached.append(_neighbors(self.indptr, self.indices, frontier))
+            if direction in ('in', 'both'):
+                reached.append(_neighbors(self.in_indptr, self.in_indices, frontier))
+            frontier = np.unique(np.concatenate(reached))
+            frontier = frontier[distances[frontier] < 0]
+            if not len(frontier):
+                break
+            distances[frontier] = hop
+        found = np.flatnonzero(distances > 0)
+        return self.case_ids[found], distances[found]
+
+    def pagerank(self, damping=.85, iterations=100, tolerance=1e-6):
+        """
+        Return the PageRank of every case, by node, by power iteration.
+        Rank of cases citing nothing is spread evenly over every case.
+        """
+        node_count = len(self.case_ids)
+        out_degrees = self.out_degrees()
+        dangling = out_degrees == 0
+        # citing node of every edge, so each iteration is one gather and one bincount over the edges
+        sources = np.repeat(np.arange(node_count, dtype=np.int32), out_degrees)
+        indices = np.asarray(self.indices)
+        weights = np.where(dangling, 0, 1 / np.maximum(out_degrees, 1))
+
+        ranks = np.full(node_count, 1 / node_count)
+        for _ in range(iterations):
+            flows = np.bincount(indices, weights=(ranks * weights)[sources], minlength=node_count)
+            new_ranks = (1 - damping) / node_count + damping * (flows + ranks[dangling].sum() / node_count)
+            change = np.abs(new_ranks - ranks).sum()
+            ranks = new_ranks
+            if change < tolerance:
+                break
+        return ranks
+
+    def top(self, scores, limit=10):
+        """
+        Return (case id, score) tuples of the highest scores, given scores by node.
+        """
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit] if limit else []
+        best = sorted(best, key=lambda node: -scores[node])
+        return [(int(self.case_ids[node]), scores[node].item()) for node in best]
+
+
+def main():
+    """
+    Parse command line arguments, then build or query a citation graph.
+    """
+    parser = argparse.ArgumentParser(description='Build and query a citation graph of bulk cases.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('build', help='build a graph from bulk jurisdictions')
+    command.add_argument('jurisdictions', nargs='+', help='jurisdiction names, e.g. Illinois Arkansas')
+    command.add_argument('--data-format', default='json', help='bulk casebody format, json or xml (default json)')
+    command.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    command.add_argument('--chunk-size', type=int, default=1000, help='cases per worker task (default 1000)')
+    command.add_argument('--out-dir', default='citation_graph_data', help='output directory')
+
+    command = commands.add_parser('top', help='print the most cited cases')
+    command.add_argument('path', help='graph directory')
+    command.add_argument('--limit', type=int, default=20, help='cases to print (default 20)')
+    command.add_argument('--pagerank', action='store_true', help='rank by PageRank instead of citation count')
+
+    command = commands.add_parser('case', help='print degrees and neighborhood of a case')
+    command.add_argument('path', help='graph directory')
+    command.add_argument('case', help='case id or citation')
+    command.add_argument('--hops', type=int, default=1, help='neighborhood size (default 1)')
+    command.add_argument('--direction', default='out', help='out (cited), in (citing) or both (default out)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        case_count, edge_count = build_jurisdictions(args.jurisdictions, args.out_dir, data_format=args.data_format,
+                                                     processes=args.processes, chunk_size=args.chunk_size)
+        utils.print_info("Wrote %s cases and %s citations to %s" % (case_count, edge_count, args.out_dir))
+        return 0
+
+    graph = CitationGraph(args.path)
+    if args.command == 'top':
+        scores = graph.pagerank() if args.pagerank else graph.in_degrees()
+        for case_id, score in graph.top(scores, args.limit):
+            print("%s: %s" % (case_id, score))
+        return 0
+
+    case_id = int(args.case) if args.case.isdigit() else graph.lookup(args.case)
+    if case_id is None:
+        print("No case found for %s" % args.case)
+        return 1
+    print("case %s cites %s cases and is cited by %s" % (case_id, graph.out_degree(case_id), graph.in_degree(case_id)))
+    case_ids, distances = graph.k_hop(case_id, hops=args.hops, direction=args.direction)
+    for hop in range(1, args.hops + 1):
+        print("%s hop(s): %s cases" % (hop, int((distances == hop).sum())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
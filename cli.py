@@ -0,0 +1,91 @@
+import sys
+
+"""
+    Command line entry point for the helper tasks in fabfile.py, without needing Fabric.
+
+    Importing this module has no side effects and imports nothing heavy: argparse, utils and the helpers each
+    command needs are only imported once main() runs.
+
+    Usage (from the repository root):
+
+        $ python cli.py show-api-url
+        $ python cli.py list-jurisdictions --whitelisted
+        $ python cli.py get-cases-from-bulk Illinois --data-format xml
+        $ python cli.py get-cases-from-bulk Illinois --profile cprofile --profile-path bulk.prof
+        $ python cli.py refresh-metadata --force
+"""
+
+
+def show_api_url(args):
+    import utils
+    print(utils.get_api_url())
+
+
+def list_jurisdictions(args):
+    import utils
+    for jurisdiction in utils.get_jurisdictions():
+        if args.whitelisted and not jurisdiction['whitelisted']:
+            continue
+        if args.blacklisted and jurisdiction['whitelisted']:
+            continue
+        print(jurisdiction['name_long'])
+
+
+def get_cases_from_bulk(args):
+    import utils
+    if args.profile:
+        import instrumentation
+        with instrumentation.profiled(args.profile, args.profile_path or 'bulk.' + args.profile):
+            print(utils.get_and_extract_from_bulk(jurisdiction=args.jurisdiction, data_format=args.data_format))
+    else:
+        print(utils.get_and_extract_from_bulk(jurisdiction=args.jurisdiction, data_format=args.data_format))
+    if args.metrics_path:
+        import instrumentation
+        instrumentation.write(args.metrics_path)
+
+
+def refresh_metadata(args):
+    import metadata
+    changes = metadata.get_registry().refresh(force=args.force)
+    for endpoint, (added, changed, removed) in changes.items():
+        print("%s: %s added, %s changed, %s removed" % (endpoint, added, changed, removed))
+
+
+def main(argv=None):
+    """
+    Parse command line arguments and run the requested command.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='CAP examples helper tasks.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('show-api-url', help='print the API url from settings')
+    command.set_defaults(run=show_api_url)
+
+    command = commands.add_parser('list-jurisdictions', help='print jurisdiction names')
+    command.add_argument('--whitelisted', action='store_true', help='only whitelisted jurisdictions')
+    command.add_argument('--blacklisted', action='store_true', help='only blacklisted jurisdictions')
+    command.set_defaults(run=list_jurisdictions)
+
+    command = commands.add_parser('get-cases-from-bulk', help='download and extract a jurisdiction from /bulk')
+    command.add_argument('jurisdiction', nargs='?', default='Illinois', help='jurisdiction name (default Illinois)')
+    command.add_argument('--data-format', default='json', help='json or xml (default json)')
+    command.add_argument('--metrics-path', help='write download metrics here (.prom or .json)')
+    command.add_argument('--profile', choices=['cprofile', 'tracemalloc'],
+                         help='profile the download with cProfile, or sample its memory with tracemalloc')
+    command.add_argument('--profile-path', help='write the profile here (default bulk.cprofile or bulk.tracemalloc)')
+    command.set_defaults(run=get_cases_from_bulk)
+
+    command = commands.add_parser('refresh-metadata', help='update the jurisdictions/courts/reporters snapshot')
+    command.add_argument('--force', action='store_true', help='rewrite every snapshot even if nothing changed')
+    command.set_defaults(run=refresh_metadata)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
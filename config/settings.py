@@ -0,0 +1,7 @@
+from config.settings_base import *
+
+##### EDIT BELOW
+# claim your key at https://case.law/user/details
+API_KEY = "Paste your key in between these quotation marks"
+API_URL = "https://api.case.law"
+API_VERSION = "v1"
\ No newline at end of file
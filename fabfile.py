@@ -3,11 +3,12 @@ import os
 from fabric.decorators import task
 from fabric.api import local
 
-import utils
+# utils (and anything heavier) is imported inside each task, so fab only pays for what the task it runs needs.
 
 
 @task
 def setup():
+    import utils
     utils.print_info("Setting up cap-examples")
 
     if not os.path.exists("settings.py"):
@@ -28,23 +29,43 @@ def setup():
 
 
 @task
-def get_cases_from_bulk(jurisdiction="Illinois", data_format="json"):
+def get_cases_from_bulk(jurisdiction="Illinois", data_format="json", metrics_path=None):
     """
     Gets all cases of a requested jurisdiction from /bulk if available
     Saves to /data folder
+    Optionally writes download metrics to metrics_path (.prom or .json)
     """
+    import utils
     utils.get_and_extract_from_bulk(jurisdiction=jurisdiction, data_format=data_format)
+    if metrics_path:
+        import instrumentation
+        instrumentation.write(metrics_path)
 
 
 @task
 def show_api_url():
+    import utils
     url = utils.get_api_url()
     print(url)
     return url
 
 
+@task
+def refresh_metadata(force=False):
+    """
+    Update the local snapshot of jurisdictions, courts and reporters
+    Only endpoints with added, changed or removed records are rewritten, unless force is set
+    """
+    import metadata
+    changes = metadata.get_registry().refresh(force=force in (True, 'True', 'true', '1'))
+    for endpoint, (added, changed, removed) in changes.items():
+        print("%s: %s added, %s changed, %s removed" % (endpoint, added, changed, removed))
+    return changes
+
+
 @task
 def list_jurisdictions():
+    import utils
     jurisdictions = utils.get_jurisdictions()
     for jurisdiction in jurisdictions:
         print(jurisdiction['name_long'])
@@ -53,6 +74,7 @@ def list_jurisdictions():
 
 @task
 def list_whitelisted_jurisdictions():
+    import utils
     jurisdictions = utils.get_jurisdictions()
     utils.print_info("Whitelisted jurisdictions")
     for jurisdiction in jurisdictions:
@@ -63,6 +85,7 @@ def list_whitelisted_jurisdictions():
 
 @task
 def list_blacklisted_jurisdictions():
+    import utils
     utils.print_info("Blacklisted jurisdictions")
     jurisdictions = utils.get_jurisdictions()
     for jurisdiction in jurisdictions:
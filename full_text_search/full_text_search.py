@@ -1,9 +1,47 @@
-import requests
+import sys
+import argparse
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+"""
+    Count the cases containing a keyword in each jurisdiction, and find the oldest one.
+
+    search_story() pages through every matching case, which takes thousands of requests for common words.
+    count_story() asks each jurisdiction instead, in parallel, for one case ordered by decision date: the page's count
+    is the number of matching cases and its first result is the oldest one. That's one request per jurisdiction
+    whatever the number of results, and the jurisdiction list comes from the local metadata snapshot, so many keywords
+    can be counted in one run.
+
+    Usage (from the repository root):
+
+        $ python -m full_text_search.full_text_search turkey
+        $ python -m full_text_search.full_text_search turkey pumpkin cranberry --counts --workers 16
+"""
+
+
+API_URL = 'https://api.case.law/v1/'
+
+
+def print_story(keyword, results_count, jurisdictions):
+    print('\n' + 'Results for keyword: ' + keyword)
+    print('Total cases: ' + str(results_count))
+
+    results_sorted = OrderedDict(sorted(jurisdictions.items(), key=lambda kv: kv[1]['oldest_case_date']))
+
+    print('\n')
+    print('Jurisdiction-by-Jurisdiction Results' + '\n')
+
+    for values in results_sorted.values():
+        print(values['name'] + ': ' + str(values['count']))
+        print('Oldest case: ' + values['oldest_case_name'] + '(' + values['oldest_case_date'] + ')')
+        print('Link: ' + values['oldest_case_url'])
+        print('\n')
 
 
 def search_story(keyword):
-    starting_url = 'https://api.case.law/v1/cases/?search=' + keyword
+    starting_url = API_URL + 'cases/?search=' + keyword
 
     jurisdictions = {}
     results_count = 0
@@ -37,24 +75,79 @@ def search_story(keyword):
 
         else:
             new_count = jurisdictions[jurisdiction]['count'] + 1
+            jurisdictions[jurisdiction]['count'] = new_count
             if jurisdictions[jurisdiction]['oldest_case_date'] > date:
                 jurisdictions[jurisdiction] = {'name': jurisdiction, 'count': new_count, 'oldest_case_id': id,
                                                'oldest_case_name': name, 'oldest_case_date': date,
                                                'oldest_case_url': url}
 
-    print('\n' + 'Results for keyword: ' + keyword)
-    print('Total cases: ' + str(results_count))
-
-    results_sorted = OrderedDict(sorted(jurisdictions.items(), key=lambda kv: kv[1]['oldest_case_date']))
-
-    print('\n')
-    print('Jurisdiction-by-Jurisdiction Results' + '\n')
-
-    for values in results_sorted.values():
-        print(values['name'] + ': ' + str(values['count']))
-        print('Oldest case: ' + values['oldest_case_name'] + '(' + values['oldest_case_date'] + ')')
-        print('Link: ' + values['oldest_case_url'])
-        print('\n')
-
-
-search_story('turkey')
+    print_story(keyword, results_count, jurisdictions)
+
+
+def count_stories(keywords, workers=8, api_url=None):
+    """
+    Return {keyword: (total count, {jurisdiction name: count and oldest case})} for each keyword, with one
+    page_size=1 request per keyword and jurisdiction containing it, run on workers threads.
+    api_url defaults to the one in settings.
+    """
+    import utils
+    import metadata
+
+    api_url = api_url or utils.get_api_url()
+
+    def count(session, keyword, jurisdiction=None):
+        params = {'search': keyword, 'page_size': 1, 'ordering': 'decision_date'}
+        if jurisdiction:
+            params['jurisdiction'] = jurisdiction['slug']
+        response = session.get(api_url + 'cases/', params=params)
+        response.raise_for_status()
+        page = response.json()
+        return keyword, jurisdiction, page['count'], page['results'][0] if page['results'] else None
+
+    jurisdictions = metadata.get_registry().jurisdictions.records
+    stories = {}
+    # one session shared by the workers, with a connection pool big enough to keep each worker's connection open
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        session.mount(api_url, requests.adapters.HTTPAdapter(pool_maxsize=workers))
+        # totals first, so that jurisdictions are only asked about keywords found somewhere
+        for keyword, _, total, _ in executor.map(lambda keyword: count(session, keyword), keywords):
+            stories[keyword] = (total, {})
+        tasks = [(keyword, jurisdiction) for keyword in keywords if stories[keyword][0]
+                 for jurisdiction in jurisdictions]
+        for keyword, jurisdiction, total, oldest in executor.map(lambda task: count(session, *task), tasks):
+            if not total:
+                continue
+            stories[keyword][1][jurisdiction['name']] = {
+                'name': jurisdiction['name'], 'count': total, 'oldest_case_id': oldest['id'],
+                'oldest_case_name': oldest['name_abbreviation'], 'oldest_case_date': oldest['decision_date'],
+                'oldest_case_url': oldest['url']}
+    return stories
+
+
+def count_story(keyword, workers=8):
+    total, jurisdictions = count_stories([keyword], workers=workers)[keyword]
+    print_story(keyword, total, jurisdictions)
+
+
+def main():
+    """
+    Parse command line arguments and print the story of each keyword.
+    """
+    parser = argparse.ArgumentParser(description='Count cases containing keywords, by jurisdiction.')
+    parser.add_argument('keywords', nargs='*', default=['turkey'], help='keywords to search for (default turkey)')
+    parser.add_argument('--counts', action='store_true',
+                        help='one count query per jurisdiction instead of downloading every matching case')
+    parser.add_argument('--workers', type=int, default=8, help='parallel count queries (default 8)')
+    args = parser.parse_args()
+
+    if args.counts:
+        for keyword, (total, jurisdictions) in count_stories(args.keywords, workers=args.workers).items():
+            print_story(keyword, total, jurisdictions)
+    else:
+        for keyword in args.keywords:
+            search_story(keyword)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+"""
+    Counters, gauges, histograms and hooks for the API client and bulk data helpers.
+
+    Instrumented code records events with increment(), observe(), set_gauge() or timer():
+
+        with instrumentation.timer('cap_request_seconds', endpoint='cases'):
+            response = requests.get(url)
+        instrumentation.increment('cap_response_bytes_total', len(response.content))
+
+    Everything is kept in memory in the module's registry and can be written out at the end of a run, as a Prometheus
+    text file (e.g. for node_exporter's textfile collector) or as json:
+
+        instrumentation.write('metrics.prom')    # or 'metrics.json'
+
+    Callbacks added with add_hook(callback) are called as callback(kind, name, value, labels) for every event, to
+    forward them elsewhere or print progress.
+
+    For a closer look at one run, profiled('cprofile', 'run.prof') profiles a block of code, and
+    profiled('tracemalloc', 'memory.txt') samples its memory use every few seconds. `python cli.py get-cases-from-bulk
+    --profile cprofile` does this for a bulk download.
+
+    Uses only the standard library, so the dependency-free scripts can use it too.
+"""
+
+
+DEFAULT_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Histogram(object):
+    """
+    Cumulative bucket counts, sum and count of observed values, as Prometheus histograms keep them.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in (None if above the last bucket).
+        """
+        rank = fraction * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return None
+
+
+class Metrics(object):
+    """
+    A registry of counters, gauges and histograms, keyed by name and labels.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.hooks = []
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            key = (name, _label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._call_hooks('counter', name, value, labels)
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, _label_key(labels))] = value
+        self._call_hooks('gauge', name, value, labels)
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = (name, _label_key(labels))
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+        self._call_hooks('histogram', name, value, labels)
+
+    def _call_hooks(self, kind, name, value, labels):
+        for hook in self.hooks:
+            hook(kind, name, value, labels)
+
+    def to_dict(self):
+        """
+        Return every metric as plain data. Counters also get a per-second rate over the registry's lifetime.
+        """
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value,
+                              'per_second': round(value / elapsed, 3)}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), 'count': histogram.count,
+                                'sum': round(histogram.sum, 6), 'p50': histogram.quantile(.5),
+                                'p99': histogram.quantile(.99)}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('"', '\\"')) for key, value in pairs)
+
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append('# TYPE %s counter' % name)
+                    typed.add(name)
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+            for (name, labels), value in sorted(self.gauges.items()):
+                if name not in typed:
+                    lines.append('# TYPE %s gauge' % name)
+                    typed.add(name)
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append('# TYPE %s histogram' % name)
+                    typed.add(name)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append('%s_bucket%s %s' % (name, format_labels(labels, [('le', bound)]), count))
+                lines.append('%s_bucket%s %s' % (name, format_labels(labels, [('le', '+Inf')]), histogram.count))
+                lines.append('%s_sum%s %s' % (name, format_labels(labels), histogram.sum))
+                lines.append('%s_count%s %s' % (name, format_labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def increment(name, value=1, **labels):
+    metrics.increment(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    metrics.set_gauge(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    metrics.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Observe the seconds spent in a block of code into histogram name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(name, time.perf_counter() - start, **labels)
+
+
+def add_hook(callback):
+    metrics.hooks.append(callback)
+
+
+def remove_hook(callback):
+    metrics.hooks.remove(callback)
+
+
+def write(path):
+    """
+    Write every metric to path, in Prometheus text format if it ends in .prom and as json otherwise.
+    """
+    with open(path, 'w') as out_file:
+        if path.endswith('.prom'):
+            out_file.write(metrics.to_prometheus())
+        else:
+            json.dump(metrics.to_dict(), out_file, indent=2)
+
+
+@contextmanager
+def profiled(mode, out_path, interval=5, limit=25):
+    """
+    Profile a block of code.
+
+    mode='cprofile' writes cProfile stats to out_path (open them with pstats or snakeviz).
+    mode='tracemalloc' samples memory every interval seconds, recording current and peak traced memory as
+    gauges, and writes the top allocation sites of the last sample to out_path.
+    """
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(out_path)
+
+    elif mode == 'tracemalloc':
+        import tracemalloc
+        stop = threading.Event()
+
+        def sample():
+            current, peak = tracemalloc.get_traced_memory()
+            set_gauge('traced_memory_bytes', current, kind='current')
+            set_gauge('traced_memory_bytes', peak, kind='peak')
+            return tracemalloc.take_snapshot()
+
+        def sampler():
+            while not stop.wait(interval):
+                sample()
+
+        tracemalloc.start()
+        thread = threading.Thread(target=sampler, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            snapshot = sample()
+            tracemalloc.stop()
+            with open(out_path, 'w') as out_file:
+                for stat in snapshot.statistics('lineno')[:limit]:
+                    out_file.write('%s\n' % stat)
+
+    else:
+        raise Exception("Unknown profiling mode %s. Use cprofile or tracemalloc." % mode)
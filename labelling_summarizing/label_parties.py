@@ -0,0 +1,170 @@
+import json
+import sys
+import argparse
+from collections import Counter
+from itertools import islice
+
+"""
+    Label the parties named in case names (people, organizations, geopolitical entities) in bulk.
+
+    The labelling notebook runs the full spaCy pipeline on one case name at a time and counts entities with a separate
+    list scan per label. This script instead:
+
+    - disables every pipe the named entity recognizer doesn't need,
+    - feeds names through nlp.pipe in windows of cases, optionally across several processes,
+    - parses each distinct case name only once (case names like "People v. Smith" repeat a lot), optionally keeping
+      that cache on disk between runs,
+    - tallies all labels in one pass, and
+    - streams one jsonl record per case to disk as soon as it is labelled.
+
+    Usage (from the repository root):
+
+        $ python -m labelling_summarizing.label_parties cars_cases_json_list_new.json --out-path labels_new.jsonl \
+            --n-process 4 --cache-path case_name_labels.jsonl
+
+    Pass --model with the path of a model saved with nlp.to_disk() to use the notebook's retrained model.
+"""
+
+
+PARTY_LABELS = ['PERSON', 'ORG', 'GPE']
+
+
+def load_model(model='en_core_web_sm'):
+    """
+    Load a spaCy model by name or path, keeping only what entity recognition needs.
+    """
+    import spacy
+    return ner_only(spacy.load(model))
+
+
+def ner_only(nlp):
+    """
+    Disable every pipe of a loaded model that the named entity recognizer doesn't depend on.
+    A shared tok2vec layer is only kept if the recognizer listens to it.
+    """
+    keep = {'ner'}
+    for name in ('tok2vec', 'transformer'):
+        if name in nlp.pipe_names:
+            if 'ner' in getattr(nlp.get_pipe(name), 'listening_components', []):
+                keep.add(name)
+    nlp.select_pipes(disable=[name for name in nlp.pipe_names if name not in keep])
+    return nlp
+
+
+def read_cases(path):
+    """
+    Yield cases from a json list (as downloaded for the notebook) or a jsonl file.
+    """
+    with open(path, encoding='utf-8') as in_file:
+        if path.endswith('.jsonl'):
+            for line in in_file:
+                yield json.loads(line)
+        else:
+            for case in json.load(in_file):
+                yield case
+
+
+def load_cache(path):
+    """
+    Load a case name -> entities cache written by label_parties.
+    """
+    cache = {}
+    try:
+        with open(path, encoding='utf-8') as cache_file:
+            for line in cache_file:
+                record = json.loads(line)
+                cache[record['name']] = [tuple(entity) for entity in record['entities']]
+    except FileNotFoundError:
+        pass
+    return cache
+
+
+def label_parties(cases, nlp, n_process=1, batch_size=1000, cache=None, cache_file=None):
+    """
+    Yield (case, entities) for each case in input order, where entities is a list of (text, label) tuples found in its
+    name. Only names missing from cache are parsed, once each; new results are added to cache, and appended to
+    cache_file if given.
+
+    Cases are read and labelled in windows of batch_size * n_process cases (one nlp.pipe call each), so memory stays
+    bounded however long the input is.
+    """
+    cache = {} if cache is None else cache
+    cases = iter(cases)
+    window_size = batch_size * max(n_process, 1)
+    while True:
+        window = list(islice(cases, window_size))
+        if not window:
+            return
+        # distinct names of the window that aren't cached yet, in order
+        names = list(dict.fromkeys(case['name'] for case in window if case['name'] not in cache))
+        if names:
+            for name, doc in zip(names, nlp.pipe(names, batch_size=batch_size, n_process=n_process)):
+                entities = [(ent.text, ent.label_) for ent in doc.ents]
+                cache[name] = entities
+                if cache_file:
+                    cache_file.write(json.dumps({'name': name, 'entities': entities}) + '\n')
+        for case in window:
+            yield case, cache[case['name']]
+
+
+def label_to_file(cases, nlp, out_path, n_process=1, batch_size=1000, cache_path=None):
+    """
+    Label cases, writing one {'id', 'name', 'entities'} jsonl record per case to out_path.
+    Returns (entity counts by label, case counts by label, total case count), tallied in the same pass.
+    """
+    entity_counts = Counter()
+    cases_with = Counter()
+    case_count = 0
+
+    cache = load_cache(cache_path) if cache_path else {}
+    cache_file = open(cache_path, 'a', encoding='utf-8') if cache_path else None
+    try:
+        with open(out_path, 'w', encoding='utf-8') as out_file:
+            for case, entities in label_parties(cases, nlp, n_process=n_process, batch_size=batch_size,
+                                                cache=cache, cache_file=cache_file):
+                labels = Counter(label for _, label in entities)
+                entity_counts.update(labels)
+                cases_with.update(labels.keys())
+                case_count += 1
+                out_file.write(json.dumps({'id': case.get('id'), 'name': case['name'], 'entities': entities}) + '\n')
+    finally:
+        if cache_file:
+            cache_file.close()
+
+    return entity_counts, cases_with, case_count
+
+
+def print_summary(entity_counts, cases_with, case_count):
+    """
+    Print the share of each party type, as the labelling notebook does.
+    """
+    total_count = sum(entity_counts[label] for label in PARTY_LABELS) or 1
+    for label in PARTY_LABELS:
+        print("%s %s entities were named, which is %s%% of all the parties named" % (
+            entity_counts[label], label, entity_counts[label] * 100 / total_count))
+        print("%s%% of cases name at least one %s entity" % (cases_with[label] * 100 / (case_count or 1), label))
+
+
+def main():
+    """
+    Parse command line arguments and label every case of the input file.
+    """
+    parser = argparse.ArgumentParser(description='Label parties named in case names with spaCy.')
+    parser.add_argument('in_path', help='json list or jsonl file of cases')
+    parser.add_argument('--out-path', default='labels.jsonl', help='output jsonl path (default labels.jsonl)')
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path (default en_core_web_sm)')
+    parser.add_argument('--n-process', type=int, default=1, help='spaCy worker processes (default 1)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='case names per batch (default 1000)')
+    parser.add_argument('--cache-path', help='jsonl file caching labels by case name across runs')
+    args = parser.parse_args()
+
+    nlp = load_model(args.model)
+    entity_counts, cases_with, case_count = label_to_file(read_cases(args.in_path), nlp, args.out_path,
+                                                          n_process=args.n_process, batch_size=args.batch_size,
+                                                          cache_path=args.cache_path)
+    print_summary(entity_counts, cases_with, case_count)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
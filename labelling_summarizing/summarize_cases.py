@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+    Summarize full-body cases from a jsonl file in a pool of worker processes.
+
+    The labelling notebook loads every case into memory and summarizes them one after another. This script reads cases
+    one line at a time, hands their text to worker processes (never more than a few batches ahead of the writer, so
+    memory stays flat), and appends each summary to a jsonl file as soon as it is ready, in input order.
+
+    Summaries are cached by a hash of the summarized text, the summarizer and its settings, so re-running over the same
+    or an updated file only summarizes cases whose text changed. Read, cache, summarize and write times are reported
+    per stage.
+
+    Summaries use gensim's TextRank summarizer as the notebook does when it is available (gensim < 4.0), and otherwise
+    a simple word-frequency extractive summarizer.
+
+    Usage (from the repository root):
+
+        $ python -m labelling_summarizing.summarize_cases gpe_cases_new_v1.jsonl --out-path summaries_new.jsonl \
+            --processes 4 --cache-path summaries_cache.jsonl
+"""
+
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+WORD_RE = re.compile(r"[a-z']+")
+
+
+def case_text(case):
+    """
+    Return the part of a case's first opinion worth summarizing, or its head matter if it has no opinions.
+    Rough heuristic from the notebook - the description of the case is in the first half of long texts.
+    """
+    data = case['casebody']['data']
+    if data.get('opinions'):
+        text = data['opinions'][0]['text']
+    else:
+        text = data.get('head_matter') or ''
+    if len(text) > 3000:
+        text = text[:len(text) // 2]
+    return text
+
+
+def frequency_summarize(text, word_count=500):
+    """
+    Extractive summary: keep the sentences with the most frequent words, in their original order,
+    until word_count is reached.
+    """
+    sentences = [sentence for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+    frequencies = Counter(WORD_RE.findall(text.lower()))
+    scores = []
+    for index, sentence in enumerate(sentences):
+        words = WORD_RE.findall(sentence.lower())
+        scores.append((sum(frequencies[word] for word in words) / (len(words) or 1), index))
+
+    chosen = []
+    total_words = 0
+    for _, index in sorted(scores, reverse=True):
+        sentence_words = len(sentences[index].split())
+        if chosen and total_words + sentence_words > word_count:
+            continue
+        chosen.append(index)
+        total_words += sentence_words
+    return " ".join(sentences[index] for index in sorted(chosen))
+
+
+def summarize_text(text, word_count=500):
+    """
+    Worker: summarize one text and return (summary, seconds spent).
+    """
+    start = time.perf_counter()
+    try:
+        from gensim.summarization.summarizer import summarize
+        try:
+            summary = summarize(text, word_count=word_count)
+        except ValueError:
+            # gensim refuses texts with a single sentence
+            summary = text
+    except ImportError:
+        summary = frequency_summarize(text, word_count=word_count)
+    return summary, time.perf_counter() - start
+
+
+def summarizer_name():
+    """
+    Name of the summarizer summarize_text uses in this environment.
+    """
+    try:
+        from gensim.summarization.summarizer import summarize  # noqa: F401
+        return 'gensim-textrank'
+    except ImportError:
+        return 'frequency'
+
+
+def cache_key(text, word_count, summarizer):
+    """
+    Content hash identifying a summary: the summarized text plus the summarizer and settings used.
+    """
+    return hashlib.sha256(("%s\n%s\n%s" % (summarizer, word_count, text)).encode('utf-8')).hexdigest()
+
+
+def load_cache(path):
+    """
+    Load a content hash -> summary cache written by summarize_to_file.
+    """
+    cache = {}
+    try:
+        with open(path, encoding='utf-8') as cache_file:
+            for line in cache_file:
+                record = json.loads(line)
+                cache[record['key']] = record['summary']
+    except FileNotFoundError:
+        pass
+    return cache
+
+
+class StageStats(object):
+    """
+    Collects item counts and latencies for each pipeline stage.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.latencies.setdefault(stage, []).append(seconds)
+
+    def report(self):
+        """
+        Return {stage: {count, total_seconds, per_second, p50_ms, p99_ms}}; per_second is against wall time.
+        """
+        elapsed = time.perf_counter() - self.started
+        report = {}
+        for stage, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            report[stage] = {
+                'count': len(ordered),
+                'total_seconds': round(sum(ordered), 3),
+                'per_second': round(len(ordered) / elapsed, 2) if elapsed else 0,
+                'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+                'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * .99))] * 1000, 3),
+            }
+        return report
+
+    def print_report(self):
+        for stage, values in self.report().items():
+            print("%-10s %8s items %10s/s  p50 %10s ms  p99 %10s ms" % (
+                stage, values['count'], values['per_second'], values['p50_ms'], values['p99_ms']))
+
+
+def read_cases(path, stats=None):
+    """
+    Yield cases from a jsonl file one line at a time.
+    """
+    with open(path, encoding='utf-8') as in_file:
+        while True:
+            start = time.perf_counter()
+            line = in_file.readline()
+            if not line:
+                break
+            case = json.loads(line)
+            if stats:
+                stats.add('read', time.perf_counter() - start)
+            yield case
+
+
+def summarize_cases(cases, processes=None, word_count=500, cache=None, cache_file=None, stats=None, max_pending=None):
+    """
+    Yield (case, summary, cached) for each case, in input order.
+    Texts already in cache are not summarized again; new summaries are added to cache (and cache_file if given).
+    At most max_pending cases (default 4 per process) are held in memory waiting on workers.
+    """
+    cache = {} if cache is None else cache
+    stats = stats or StageStats()
+    summarizer = summarizer_name()
+
+    max_pending = max_pending or (processes or os.cpu_count() or 1) * 4
+    pending = deque()
+
+    with ProcessPoolExecutor(processes) as executor:
+
+        def finish(case, key, result):
+            if isinstance(result, str):
+                return case, result, True
+            summary, seconds = result.result()
+            stats.add('summarize', seconds)
+            cache[key] = summary
+            if cache_file:
+                cache_file.write(json.dumps({'key': key, 'summary': summary}) + '\n')
+            return case, summary, False
+
+        for case in cases:
+            start = time.perf_counter()
+            text = case_text(case)
+            key = cache_key(text, word_count, summarizer)
+            summary = cache.get(key)
+            stats.add('cache', time.perf_counter() - start)
+
+            if summary is not None:
+                pending.append((case, key, summary))
+            else:
+                pending.append((case, key, executor.submit(summarize_text, text, word_count)))
+
+            while len(pending) > max_pending or (pending and isinstance(pending[0][2], str)):
+                yield finish(*pending.popleft())
+
+        while pending:
+            yield finish(*pending.popleft())
+
+
+def summarize_to_file(in_path, out_path, processes=None, word_count=500, cache_path=None):
+    """
+    Summarize every case of a jsonl file, appending one {'id', 'frontend_url', 'summary', 'cached'} record per case
+    to out_path as it completes. Returns the StageStats of the run.
+    """
+    stats = StageStats()
+    cache = load_cache(cache_path) if cache_path else {}
+    cache_file = open(cache_path, 'a', encoding='utf-8') if cache_path else None
+    try:
+        with open(out_path, 'w', encoding='utf-8') as out_file:
+            cases = read_cases(in_path, stats=stats)
+            for case, summary, cached in summarize_cases(cases, processes=processes, word_count=word_count,
+                                                         cache=cache, cache_file=cache_file, stats=stats):
+                start = time.perf_counter()
+                out_file.write(json.dumps({'id': case['id'], 'frontend_url': case.get('frontend_url'),
+                                           'summary': summary, 'cached': cached}) + '\n')
+                out_file.flush()
+                stats.add('write', time.perf_counter() - start)
+    finally:
+        if cache_file:
+            cache_file.close()
+    return stats
+
+
+def main():
+    """
+    Parse command line arguments, summarize every case and print per-stage statistics.
+    """
+    parser = argparse.ArgumentParser(description='Summarize full-body cases from a jsonl file.')
+    parser.add_argument('in_path', help='jsonl file of full-body cases')
+    parser.add_argument('--out-path', default='summaries.jsonl', help='output jsonl path (default summaries.jsonl)')
+    parser.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    parser.add_argument('--word-count', type=int, default=500, help='words per summary (default 500)')
+    parser.add_argument('--cache-path', help='jsonl file caching summaries by content hash across runs')
+    args = parser.parse_args()
+
+    stats = summarize_to_file(args.in_path, args.out_path, processes=args.processes, word_count=args.word_count,
+                              cache_path=args.cache_path)
+    stats.print_report()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+import utils
+
+"""
+    Geocode every court of courts.csv (created by the map_courts notebook) into active_courts.csv.
+
+    The notebook geocodes one court at a time and loses its progress when interrupted. This script:
+
+    - looks up each distinct court name only once,
+    - runs lookups in a thread pool, never faster than --rate requests per second,
+    - appends every lookup result to a query -> result cache file as soon as it arrives, and
+    - on restart, skips courts already in the output file and answers repeated queries from the cache,
+      so an interrupted run picks up where it left off.
+
+    The geocoder is pluggable: anything with a geocode(query) method returning Google-style results can be passed to
+    geocode_courts, e.g. a stub returning canned results in tests. GoogleGeocoder wraps googlemaps.Client.
+
+    Usage (from the repository root, with GOOGLE_API_KEY set in config/settings.py):
+
+        $ python -m map_courts.geocode_courts --workers 8 --rate 20
+"""
+
+
+COURTS_FIELDNAMES = ['court_id', 'court_slug', 'court_name', 'jurisdiction_name', 'jurisdiction_slug']
+ACTIVE_COURTS_FIELDNAMES = COURTS_FIELDNAMES + ['addresses', 'longitudes', 'latitudes', 'google_ids']
+
+
+class GoogleGeocoder(object):
+    """
+    Geocoder backend using the Google Maps geocoding API.
+    """
+
+    def __init__(self, api_key=None):
+        import googlemaps
+        self.client = googlemaps.Client(key=api_key or settings.GOOGLE_API_KEY)
+
+    def geocode(self, query):
+        return self.client.geocode(query)
+
+
+class RateLimiter(object):
+    """
+    Blocks callers of wait() so that, across all threads, calls go through at most per_second times per second.
+    """
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.next_call > now:
+                time.sleep(self.next_call - now)
+                now = self.next_call
+            self.next_call = now + self.interval
+
+
+def load_cache(path):
+    """
+    Load a query -> geocoder results cache written by geocode_courts.
+    """
+    cache = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as cache_file:
+            for line in cache_file:
+                record = json.loads(line)
+                cache[record['query']] = record['results']
+    return cache
+
+
+def matching_locations(court, geocode_results):
+    """
+    Return (addresses, longitudes, latitudes, google_ids) of the results located in the court's own jurisdiction.
+    Google can return several results per court; those are kept and dealt with later, as in the notebook.
+    """
+    addresses, longitudes, latitudes, google_ids = [], [], [], []
+    for result in geocode_results:
+        for component in result['address_components']:
+            if 'administrative_area_level_1' in component['types'] \
+                    and component['long_name'] == court['jurisdiction_name']:
+                addresses.append(result['formatted_address'])
+                longitudes.append(result['geometry']['location']['lng'])
+                latitudes.append(result['geometry']['location']['lat'])
+                google_ids.append(result['place_id'])
+    return addresses, longitudes, latitudes, google_ids
+
+
+def geocode_courts(courts_path, out_path, geocoder, cache_path, workers=8, rate=10):
+    """
+    Geocode the courts of courts_path and append those located in their jurisdiction to out_path.
+    Courts already in out_path are skipped, and queries already in cache_path are not sent again.
+    Returns the number of rows written.
+    """
+    with open(courts_path, newline='', encoding='utf-8') as courts_file:
+        courts = list(csv.DictReader(courts_file))
+
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path, newline='', encoding='utf-8') as out_file:
+            done = {row['court_id'] for row in csv.DictReader(out_file)}
+    courts = [court for court in courts if court['court_id'] not in done]
+
+    cache = load_cache(cache_path)
+    # distinct court names, in file order
+    queries = [name for name in dict.fromkeys(court['court_name'] for court in courts) if name not in cache]
+    utils.print_info("%s courts left to geocode, %s distinct queries not in cache" % (len(courts), len(queries)))
+
+    limiter = RateLimiter(rate)
+
+    def lookup(query):
+        limiter.wait()
+        return geocoder.geocode(query)
+
+    written = 0
+    write_header = not os.path.exists(out_path)
+    with ThreadPoolExecutor(workers) as executor, \
+            open(cache_path, 'a', encoding='utf-8') as cache_file, \
+            open(out_path, 'a', newline='', encoding='utf-8') as out_file:
+        futures = {query: executor.submit(lookup, query) for query in queries}
+        writer = csv.DictWriter(out_file, fieldnames=ACTIVE_COURTS_FIELDNAMES)
+        if write_header:
+            writer.writeheader()
+
+        try:
+            for court in courts:
+                query = court['court_name']
+                if query not in cache:
+                    try:
+                        cache[query] = futures[query].result()
+                    except Exception as e:
+                        # leave it out of the cache so the next run tries again
+                        print("Could not geocode %s: %s" % (query, e))
+                        continue
+                    cache_file.write(json.dumps({'query': query, 'results': cache[query]}) + '\n')
+                    cache_file.flush()
+
+                addresses, longitudes, latitudes, google_ids = matching_locations(court, cache[query])
+                # only add courts with a location in their jurisdiction
+                if longitudes:
+                    row = {key: court[key] for key in COURTS_FIELDNAMES}
+                    row.update({'addresses': json.dumps(addresses), 'longitudes': json.dumps(longitudes),
+                                'latitudes': json.dumps(latitudes), 'google_ids': json.dumps(google_ids)})
+                    writer.writerow(row)
+                    out_file.flush()
+                    written += 1
+        finally:
+            # on interruption, don't wait for lookups that haven't started yet
+            for future in futures.values():
+                future.cancel()
+
+    return written
+
+
+def main():
+    """
+    Parse command line arguments and geocode courts with Google.
+    """
+    data_dir = os.path.join(settings.DATA_DIR, 'court_map')
+    parser = argparse.ArgumentParser(description='Geocode courts.csv into active_courts.csv.')
+    parser.add_argument('--courts-path', default=os.path.join(data_dir, 'courts.csv'), help='input courts csv')
+    parser.add_argument('--out-path', default=os.path.join(data_dir, 'active_courts.csv'), help='output csv')
+    parser.add_argument('--cache-path', default=os.path.join(data_dir, 'geocode_cache.jsonl'),
+                        help='query -> result cache, kept across runs')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent lookups (default 8)')
+    parser.add_argument('--rate', type=float, default=10, help='maximum lookups per second (default 10)')
+    args = parser.parse_args()
+
+    written = geocode_courts(args.courts_path, args.out_path, GoogleGeocoder(), args.cache_path,
+                             workers=args.workers, rate=args.rate)
+    utils.print_info("Added %s courts to %s" % (written, args.out_path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
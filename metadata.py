@@ -0,0 +1,240 @@
+import os
+import json
+import bisect
+import datetime
+
+from config import settings
+import utils
+
+"""
+    Local snapshot of the API's jurisdictions, courts and reporters, with in-memory indexes.
+
+    Each endpoint is downloaded (every page of it) the first time it is needed and saved under data/metadata/,
+    after which lookups never touch the network:
+
+        registry = metadata.get_registry()
+        registry.jurisdictions.is_valid_slug("ill")        # O(1)
+        registry.courts.resolve("Ill. App. Ct.")           # by id, slug, name or abbreviation
+        registry.courts.prefix("illinois app")             # names or abbreviations starting with ...
+        registry.reporters.search("appellate")             # names or abbreviations containing ...
+
+    `fab refresh_metadata` brings the snapshot up to date, rewriting only endpoints with added, changed or removed
+    records.
+"""
+
+
+ENDPOINTS = {
+    # endpoint: (name fields, abbreviation fields)
+    'jurisdictions': (['name_long'], ['name']),
+    'courts': (['name'], ['name_abbreviation']),
+    'reporters': (['full_name'], ['short_name']),
+}
+
+PAGE_SIZE = 1000
+
+
+def _normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class MetadataIndex(object):
+    """
+    Indexes of one endpoint's records by id, slug, name and abbreviation.
+    Names and abbreviations are matched case-insensitively.
+    """
+
+    def __init__(self, records, name_fields=('name',), abbreviation_fields=()):
+        self.records = records
+        self.by_id = {}
+        self.by_slug = {}
+        self.by_name = {}
+        self._labels = []  # (normalized name or abbreviation, record position), sorted for prefix lookups
+        self._labels_at = {}  # record position -> its normalized names and abbreviations
+        self._trigrams = {}  # trigram -> positions of records whose names or abbreviations contain it
+
+        for position, record in enumerate(records):
+            self.by_id[record['id']] = record
+            if record.get('slug'):
+                self.by_slug[record['slug']] = record
+            for field in list(name_fields) + list(abbreviation_fields):
+                if not record.get(field):
+                    continue
+                label = _normalize(record[field])
+                self.by_name.setdefault(label, []).append(record)
+                self._labels.append((label, position))
+                self._labels_at.setdefault(position, []).append(label)
+                for trigram in _trigrams(label):
+                    self._trigrams.setdefault(trigram, set()).add(position)
+        self._labels.sort()
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, record_id):
+        """
+        Return the record with this numeric id, or None.
+        """
+        return self.by_id.get(int(record_id))
+
+    def is_valid_slug(self, slug):
+        return slug in self.by_slug
+
+    def resolve(self, value):
+        """
+        Return the single record matching an id, slug, name or abbreviation exactly, or None.
+        Raises an Exception if a name or abbreviation matches several records.
+        """
+        if isinstance(value, int) or str(value).isdigit():
+            return self.get(value)
+        if value in self.by_slug:
+            return self.by_slug[value]
+        matches = self.by_name.get(_normalize(value), [])
+        unique = {record['id']: record for record in matches}
+        if len(unique) > 1:
+            raise Exception("%s is ambiguous: %s" % (value, ", ".join(str(record_id) for record_id in unique)))
+        return matches[0] if matches else None
+
+    def prefix(self, text):
+        """
+        Return records with a name or abbreviation starting with text.
+        """
+        text = _normalize(text)
+        positions = []
+        index = bisect.bisect_left(self._labels, (text,))
+        while index < len(self._labels) and self._labels[index][0].startswith(text):
+            positions.append(self._labels[index][1])
+            index += 1
+        return self._records_at(positions)
+
+    def search(self, text):
+        """
+        Return records with a name or abbreviation containing text.
+        """
+        text = _normalize(text)
+        if len(text) < 3:
+            positions = [position for label, position in self._labels if text in label]
+        else:
+            candidates = set.intersection(*[self._trigrams.get(trigram, set()) for trigram in _trigrams(text)])
+            positions = [position for position in candidates
+                         if any(text in label for label in self._labels_at[position])]
+        return self._records_at(positions)
+
+    def _records_at(self, positions):
+        return [self.records[position] for position in sorted(set(positions))]
+
+
+class MetadataRegistry(object):
+    """
+    Snapshot-backed indexes of every metadata endpoint, loaded lazily one endpoint at a time.
+    """
+
+    def __init__(self, snapshot_dir=None):
+        self.snapshot_dir = snapshot_dir or os.path.join(settings.DATA_DIR, 'metadata')
+        self._indexes = {}
+
+    @property
+    def jurisdictions(self):
+        return self.index('jurisdictions')
+
+    @property
+    def courts(self):
+        return self.index('courts')
+
+    @property
+    def reporters(self):
+        return self.index('reporters')
+
+    def index(self, endpoint):
+        """
+        Return the index of an endpoint, downloading its snapshot first if there isn't one.
+        """
+        if endpoint not in self._indexes:
+            snapshot = self._read_snapshot(endpoint)
+            if snapshot is None:
+                snapshot = self._download(endpoint)
+            self._set_index(endpoint, snapshot['results'])
+        return self._indexes[endpoint]
+
+    def refresh(self, endpoints=None, force=False):
+        """
+        Bring snapshots up to date. Every page of each endpoint is fetched (metadata endpoints only have a few) and
+        compared with the snapshot record by record; the snapshot and index are only rewritten when a record was added,
+        changed or removed, or when forced. Returns {endpoint: (added, changed, removed)}.
+        """
+        changes = {}
+        for endpoint in endpoints or ENDPOINTS:
+            snapshot = self._read_snapshot(endpoint)
+            old = {record['id']: record for record in (snapshot['results'] if snapshot else [])}
+            results = self._fetch(endpoint)
+            new = {record['id']: record for record in results}
+            changes[endpoint] = (len(new.keys() - old.keys()),
+                                 sum(1 for record_id in new.keys() & old.keys() if new[record_id] != old[record_id]),
+                                 len(old.keys() - new.keys()))
+            if force or snapshot is None or any(changes[endpoint]):
+                self._save(endpoint, results)
+                self._set_index(endpoint, results)
+        return changes
+
+    def _set_index(self, endpoint, records):
+        name_fields, abbreviation_fields = ENDPOINTS[endpoint]
+        self._indexes[endpoint] = MetadataIndex(records, name_fields, abbreviation_fields)
+
+    def _snapshot_path(self, endpoint):
+        return os.path.join(self.snapshot_dir, endpoint + '.json')
+
+    def _read_snapshot(self, endpoint):
+        try:
+            with open(self._snapshot_path(endpoint), encoding='utf-8') as snapshot_file:
+                return json.load(snapshot_file)
+        except FileNotFoundError:
+            return None
+
+    def _get_page(self, url):
+        import requests
+        response = requests.get(url, headers=utils.get_auth_headers())
+        if response.status_code != 200:
+            raise Exception("Something went wrong.\n\n%s" % response.reason)
+        return response.json()
+
+    def _fetch(self, endpoint):
+        """
+        Download every page of an endpoint and return its records.
+        """
+        utils.print_info("Downloading %s metadata" % endpoint)
+        results = []
+        url = utils.get_api_url(endpoint) + '?page_size=%s' % PAGE_SIZE
+        while url:
+            page = self._get_page(url)
+            results += page['results']
+            url = page['next']
+        return results
+
+    def _save(self, endpoint, results):
+        snapshot = {'downloaded': datetime.datetime.now().isoformat(), 'count': len(results), 'results': results}
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with open(self._snapshot_path(endpoint), 'w', encoding='utf-8') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        return snapshot
+
+    def _download(self, endpoint):
+        """
+        Download every page of an endpoint and save it as a snapshot.
+        """
+        return self._save(endpoint, self._fetch(endpoint))
+
+
+_registry = None
+
+
+def get_registry():
+    """
+    Return the shared registry, backed by the snapshot in settings.DATA_DIR.
+    """
+    global _registry
+    if _registry is None:
+        _registry = MetadataRegistry()
+    return _registry
@@ -0,0 +1,274 @@
+import re
+import csv
+import sys
+import json
+import zlib
+import argparse
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+import utils
+
+"""
+    Find cases whose opinions are near-duplicates of each other, e.g. the same opinion published in several reporters.
+
+    Comparing every pair of cases is quadratic, so this uses MinHash and locality sensitive hashing (LSH):
+
+    - each case's opinion text is split into overlapping shingles of a few words, hashed with numpy,
+    - a MinHash signature (the minimum of num_perm random hash functions over the shingles) summarizes the set of
+      shingles, so that the share of equal signature values of two cases estimates the Jaccard similarity of their
+      shingle sets,
+    - signatures are cut into bands; cases sharing all values of any band land in the same bucket and become candidate
+      pairs. Only candidates whose estimated similarity reaches the threshold are joined into a cluster.
+
+    Signatures are computed in worker processes over chunks of the bulk files, and each case is compared only with the
+    cases it shares a bucket with, so the whole run is roughly linear in the number of cases.
+
+    Cases with fewer than --min-shingles distinct shingles (e.g. a bare "Judgment affirmed.") are left out: short
+    boilerplate texts are identical across unrelated cases, and would otherwise all fall into one cluster.
+
+    Clusters are written to a CSV (cluster number, case id, name, citation), and load_duplicates() returns the ids of
+    every case but the first of each cluster, to skip them when counting n-grams or search results.
+
+    Usage (from the repository root):
+
+        $ python -m near_duplicates.near_duplicates Illinois Arkansas --threshold .8 --out-path duplicates.csv
+"""
+
+
+FIELDNAMES = ['cluster', 'case_id', 'name_abbreviation', 'citation']
+WORD_RE = re.compile(r"\w+")
+
+
+def permutations(num_perm, seed=1):
+    """
+    Return (a, b) parameters of num_perm random hash functions h(x) = ((a * x + b) mod 2**64) >> 32, a odd.
+    """
+    generator = np.random.RandomState(seed)
+    a = generator.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(4)
+    b = generator.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(4)
+    return a + np.uint64(1), b
+
+
+def shingle_hashes(text, shingle_size=5):
+    """
+    Return unique 32 bit hashes of every run of shingle_size consecutive words of text.
+    """
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.uint64,
+                              count=len(words))
+    shingle_count = max(len(words) - shingle_size + 1, 1)
+    hashes = np.zeros(shingle_count, dtype=np.uint64)
+    # polynomial hash of each window, computed for every window at once; overflow wraps around as intended
+    for offset in range(min(shingle_size, len(words))):
+        hashes = hashes * np.uint64(1000003) + word_hashes[offset:offset + shingle_count]
+    return np.unique(hashes >> np.uint64(32) ^ hashes & np.uint64(0xffffffff))
+
+
+def minhash(hashes, a, b, block_size=4096):
+    """
+    Return the MinHash signature (one uint32 per hash function) of a set of 32 bit shingle hashes.
+    """
+    if not len(hashes):
+        return None
+    signature = np.full(len(a), 0xffffffff, dtype=np.uint64)
+    # blocks of shingles keep the (hash functions x shingles) matrix small for long opinions;
+    # multiplication overflows and wraps around modulo 2**64, which is what multiply-shift hashing wants
+    for start in range(0, len(hashes), block_size):
+        values = (np.outer(a, hashes[start:start + block_size]) + b[:, None]) >> np.uint64(32)
+        np.minimum(signature, values.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def case_signature(case, a, b, shingle_size=5, min_shingles=10):
+    """
+    Return the signature of the text of every opinion of a case, or None if the text has fewer than min_shingles
+    distinct shingles.
+    """
+    text = " ".join(opinion['text'] for opinion in utils.get_opinions(case))
+    hashes = shingle_hashes(text, shingle_size=shingle_size)
+    if len(hashes) < max(min_shingles, 1):
+        return None
+    return minhash(hashes, a, b)
+
+
+def _signature_chunk(lines, num_perm=128, shingle_size=5, min_shingles=10, seed=1):
+    """
+    Worker: decode a chunk of raw bulk lines and return (case id, name, citation, signature) of each case with enough
+    text.
+    """
+    a, b = permutations(num_perm, seed)
+    results = []
+    for line in lines:
+        case = json.loads(str(line, 'utf-8'))
+        signature = case_signature(case, a, b, shingle_size=shingle_size, min_shingles=min_shingles)
+        if signature is not None:
+            citation = case['citations'][0]['cite'] if case.get('citations') else ''
+            results.append((case['id'], case.get('name_abbreviation', ''), citation, signature))
+    return results
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Return the (bands, rows) split of num_perm signature values whose LSH threshold, (1 / bands) ** (1 / rows),
+    is closest to threshold.
+    """
+    splits = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(splits, key=lambda split: abs((1 / split[0]) ** (1 / split[1]) - threshold))
+
+
+class DuplicateIndex(object):
+    """
+    LSH buckets and union-find clusters of the signatures added so far.
+
+    Each bucket keeps the first bucket_size cases that landed in it: a case is compared with at most bucket_size cases
+    per band, so boilerplate opinions shared by thousands of cases don't make adding a case quadratic, while a
+    duplicate still finds its original in a bucket an unrelated case reached first.
+    """
+
+    def __init__(self, num_perm=128, threshold=.8, bucket_size=8):
+        self.threshold = threshold
+        self.bucket_size = bucket_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.buckets = {}
+        self.signatures = []
+        self.parents = []
+        self.records = []
+
+    def find(self, index):
+        while self.parents[index] != index:
+            self.parents[index] = self.parents[self.parents[index]]
+            index = self.parents[index]
+        return index
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parents[max(first, second)] = min(first, second)
+
+    def add(self, record, signature):
+        """
+        Add a case, joining it with every earlier case that shares a bucket and is similar enough.
+        """
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        self.parents.append(index)
+        self.records.append(record)
+        candidates = set()
+        for band in range(self.bands):
+            key = (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            bucket = self.buckets.setdefault(key, [])
+            candidates.update(bucket)
+            if len(bucket) < self.bucket_size:
+                bucket.append(index)
+        for candidate in candidates:
+            if self.find(candidate) != self.find(index) and self.similarity(candidate, index) >= self.threshold:
+                self.union(candidate, index)
+
+    def similarity(self, first, second):
+        """
+        Estimated Jaccard similarity of two cases' shingle sets.
+        """
+        return float(np.mean(self.signatures[first] == self.signatures[second]))
+
+    def clusters(self):
+        """
+        Return lists of records of every cluster with more than one case, in the order cases were added.
+        """
+        clusters = {}
+        for index, record in enumerate(self.records):
+            clusters.setdefault(self.find(index), []).append(record)
+        return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def find_duplicates(compressed_files, num_perm=128, threshold=.8, shingle_size=5, min_shingles=10, bucket_size=8,
+                    processes=None, chunk_size=1000):
+    """
+    Stream every bulk file once, computing signatures in worker processes, and return clusters of
+    (case id, name, citation) records of near-duplicate cases. Cases with fewer than min_shingles distinct shingles
+    are never clustered, and each is compared with at most bucket_size earlier cases per LSH band.
+    """
+    def chunks():
+        for compressed_file in compressed_files:
+            utils.print_info("hashing cases in %s" % compressed_file)
+            for chunk in utils.read_chunks_from_bulk(compressed_file, chunk_size=chunk_size):
+                yield chunk
+
+    index = DuplicateIndex(num_perm=num_perm, threshold=threshold, bucket_size=bucket_size)
+    worker = partial(_signature_chunk, num_perm=num_perm, shingle_size=shingle_size, min_shingles=min_shingles)
+    with Pool(processes) as pool:
+        for results in pool.imap(worker, chunks()):
+            for case_id, name, citation, signature in results:
+                index.add((case_id, name, citation), signature)
+    return index.clusters()
+
+
+def find_duplicates_in_jurisdictions(jurisdictions, data_format="json", **kwargs):
+    """
+    Download bulk files of the given jurisdictions if needed, and return clusters of near-duplicate cases.
+    """
+    compressed_files = [utils.get_and_extract_from_bulk(jurisdiction=jurisdiction, data_format=data_format)
+                        for jurisdiction in jurisdictions]
+    return find_duplicates(compressed_files, **kwargs)
+
+
+def write_clusters(clusters, out_path):
+    with open(out_path, 'w', newline='', encoding='utf-8') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(FIELDNAMES)
+        for number, cluster in enumerate(clusters):
+            for case_id, name, citation in cluster:
+                writer.writerow([number, case_id, name, citation])
+
+
+def load_duplicates(path):
+    """
+    Return the set of ids of duplicate cases in a file written by write_clusters: every case but the first of its
+    cluster.
+    """
+    duplicates = set()
+    seen_clusters = set()
+    with open(path, newline='', encoding='utf-8') as in_file:
+        for row in csv.DictReader(in_file):
+            if row['cluster'] in seen_clusters:
+                duplicates.add(int(row['case_id']))
+            seen_clusters.add(row['cluster'])
+    return duplicates
+
+
+def main():
+    """
+    Parse command line arguments, find near-duplicate cases and write their clusters.
+    """
+    parser = argparse.ArgumentParser(description='Find near-duplicate cases in bulk data with MinHash and LSH.')
+    parser.add_argument('jurisdictions', nargs='+', help='jurisdiction names, e.g. Illinois Arkansas')
+    parser.add_argument('--data-format', default='json', help='bulk casebody format, json or xml (default json)')
+    parser.add_argument('--threshold', type=float, default=.8, help='minimum estimated similarity (default .8)')
+    parser.add_argument('--num-perm', type=int, default=128, help='hash functions per signature (default 128)')
+    parser.add_argument('--shingle-size', type=int, default=5, help='words per shingle (default 5)')
+    parser.add_argument('--min-shingles', type=int, default=10,
+                        help='skip cases with fewer distinct shingles than this, e.g. one-line opinions (default 10)')
+    parser.add_argument('--bucket-size', type=int, default=8,
+                        help='earlier cases each case is compared with per LSH band, at most (default 8)')
+    parser.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='cases per worker task (default 1000)')
+    parser.add_argument('--out-path', default='duplicates.csv', help='output CSV path (default duplicates.csv)')
+    args = parser.parse_args()
+
+    clusters = find_duplicates_in_jurisdictions(args.jurisdictions, data_format=args.data_format,
+                                                num_perm=args.num_perm, threshold=args.threshold,
+                                                shingle_size=args.shingle_size, min_shingles=args.min_shingles,
+                                                bucket_size=args.bucket_size, processes=args.processes,
+                                                chunk_size=args.chunk_size)
+    write_clusters(clusters, args.out_path)
+    utils.print_info("Wrote %s clusters of %s cases to %s" % (
+        len(clusters), sum(len(cluster) for cluster in clusters), args.out_path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import sys
+import json
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+"""
+    Case and opinion metadata tables of a bulk jurisdiction, and fast breakdowns of them.
+
+    The ngrams notebook loads every case into memory, flattens opinions with nested loops, and counts opinions per year
+    with four DataFrame filters for every year. Here worker processes pull only the needed fields out of chunks of the
+    bulk file, and the main process stacks them into columns: integer arrays, and pandas categoricals for courts and
+    opinion types, so every breakdown is one pass of np.bincount over integer codes.
+
+    Usage (from the repository root):
+
+        $ python -m ngrams.corpus_stats Illinois
+
+    Or, in a notebook:
+
+        cases, opinions = corpus_stats.load_jurisdiction("Illinois")
+        corpus_stats.opinion_counts_by_year(cases).plot.bar(stacked=True)
+
+    benchmarks/bench_corpus_stats.py compares these breakdowns with the notebook's DataFrame filters.
+"""
+
+
+CASE_COLUMNS = ['id', 'year', 'court', 'citation', 'name', 'opinion_count']
+OPINION_COLUMNS = ['case_id', 'year', 'court', 'type', 'author', 'word_count']
+
+
+def case_rows(case):
+    """
+    Return the case's metadata row and one row per opinion, as tuples in CASE_COLUMNS and OPINION_COLUMNS order.
+    """
+    year = int(case['decision_date'][:4])
+    court = case['court']['name']
+    opinions = utils.get_opinions(case)
+    citation = case['citations'][0]['cite'] if case.get('citations') else ''
+    return ((case['id'], year, court, citation, case['name'], len(opinions)),
+            [(case['id'], year, court, opinion['type'], opinion['author'], len(opinion['text'].split()))
+             for opinion in opinions])
+
+
+def _chunk_columns(lines):
+    """
+    Worker: decode a chunk of raw bulk lines and return its (case columns, opinion columns) as lists.
+    """
+    cases, opinions = [], []
+    for line in lines:
+        case, case_opinions = case_rows(json.loads(str(line, 'utf-8')))
+        cases.append(case)
+        opinions.extend(case_opinions)
+    return list(zip(*cases)) or [[] for _ in CASE_COLUMNS], list(zip(*opinions)) or [[] for _ in OPINION_COLUMNS]
+
+
+def _frame(columns, names, categorical=()):
+    frame = pd.DataFrame({name: pd.Categorical(column) if name in categorical else column
+                          for name, column in zip(names, columns)})
+    for name in ('id', 'case_id'):
+        if name in frame:
+            frame[name] = frame[name].astype(np.int64)
+    for name in ('year', 'opinion_count', 'word_count'):
+        if name in frame:
+            frame[name] = frame[name].astype(np.int32)
+    return frame
+
+
+def build_tables(compressed_files, processes=None, chunk_size=1000):
+    """
+    Stream bulk files once and return (cases, opinions) DataFrames. court and type are categoricals.
+    """
+    def chunks():
+        for compressed_file in compressed_files:
+            utils.print_info("reading %s" % compressed_file)
+            for chunk in utils.read_chunks_from_bulk(compressed_file, chunk_size=chunk_size):
+                yield chunk
+
+    case_columns = [[] for _ in CASE_COLUMNS]
+    opinion_columns = [[] for _ in OPINION_COLUMNS]
+    with Pool(processes) as pool:
+        for cases, opinions in pool.imap(_chunk_columns, chunks()):
+            for column, values in zip(case_columns, cases):
+                column.extend(values)
+            for column, values in zip(opinion_columns, opinions):
+                column.extend(values)
+    return (_frame(case_columns, CASE_COLUMNS, categorical=('court',)),
+            _frame(opinion_columns, OPINION_COLUMNS, categorical=('court', 'type')))
+
+
+def load_jurisdiction(jurisdiction="Illinois", data_format="json", processes=None):
+    """
+    Download the bulk file of a jurisdiction if needed, and return its (cases, opinions) DataFrames.
+    """
+    compressed_file = utils.get_and_extract_from_bulk(jurisdiction=jurisdiction, data_format=data_format)
+    return build_tables([compressed_file], processes=processes)
+
+
+def _codes(column):
+    """
+    Return (int64 codes, labels) of a column: category codes, or offsets from the smallest value of integers.
+    Codes are widened from pandas' int8/int16 category codes so that crosstab can combine them without overflowing.
+    """
+    if hasattr(column, 'cat'):
+        return column.cat.codes.to_numpy().astype(np.int64), list(column.cat.categories)
+    values = column.to_numpy().astype(np.int64)
+    if not len(values):
+        return values, []
+    low = values.min()
+    return values - low, list(range(low, values.max() + 1))
+
+
+def counts(column):
+    """
+    Return how many rows have each value of a column, as a Series sorted by value, without empty values.
+    """
+    codes, labels = _codes(column)
+    totals = pd.Series(np.bincount(codes, minlength=len(labels)), index=labels)
+    return totals[totals > 0]
+
+
+def crosstab(rows, columns):
+    """
+    Return a DataFrame of how many rows have each pair of values of two columns, in one bincount.
+    Rows and columns with no counts at all are left out.
+    """
+    row_codes, row_labels = _codes(rows)
+    column_codes, column_labels = _codes(columns)
+    cells = np.bincount(row_codes * len(column_labels) + column_codes, minlength=len(row_labels) * len(column_labels))
+    table = pd.DataFrame(cells.reshape(len(row_labels), len(column_labels)), index=row_labels, columns=column_labels)
+    return table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+
+
+def counts_by_year(cases):
+    return counts(cases['year'])
+
+
+def counts_by_court(cases):
+    return counts(cases['court'])
+
+
+def counts_by_opinion_count(cases):
+    return counts(cases['opinion_count'])
+
+
+def opinions_by_type(opinions):
+    return counts(opinions['type'])
+
+
+def opinions_by_year_and_type(opinions):
+    return crosstab(opinions['year'], opinions['type'])
+
+
+def opinion_counts_by_year(cases, max_count=4):
+    """
+    Return cases per year (rows) and number of opinions (columns), with every case of max_count or more opinions
+    in the last column, as the notebook's n_opinions table.
+    """
+    opinion_counts = pd.Series(np.minimum(cases['opinion_count'].to_numpy(), max_count), index=cases.index)
+    table = crosstab(cases['year'], opinion_counts)
+    return table.rename(columns={max_count: '%s+' % max_count})
+
+
+def main():
+    """
+    Parse command line arguments, build the tables of a jurisdiction and print its breakdowns.
+    """
+    parser = argparse.ArgumentParser(description='Case and opinion counts of a bulk jurisdiction.')
+    parser.add_argument('jurisdiction', nargs='?', default='Illinois', help='jurisdiction name (default Illinois)')
+    parser.add_argument('--data-format', default='json', help='bulk casebody format, json or xml (default json)')
+    parser.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    args = parser.parse_args()
+
+    cases, opinions = load_jurisdiction(args.jurisdiction, data_format=args.data_format, processes=args.processes)
+    print("%s cases, %s opinions" % (len(cases), len(opinions)))
+    for title, table in [('Cases by court', counts_by_court(cases)),
+                         ('Cases by opinion count', counts_by_opinion_count(cases)),
+                         ('Opinions by type', opinions_by_type(opinions)),
+                         ('Cases by year and opinion count', opinion_counts_by_year(cases))]:
+        print("\n%s\n%s" % (title, table.to_string()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
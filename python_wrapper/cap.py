@@ -4,6 +4,9 @@ import requests
 import datetime
 
 from config import settings
+import instrumentation
+import metadata
+from api_to_csv import api_to_csv
 
 
 class Cap(object):
@@ -28,7 +31,10 @@ class Cap(object):
         """
         Internal method for making API requests.
         """
-        response = requests.get(url, headers=self.header)
+        with instrumentation.timer('cap_request_seconds'):
+            response = requests.get(url, headers=self.header)
+        instrumentation.increment('cap_requests_total', status=response.status_code)
+        instrumentation.increment('cap_response_bytes_total', len(response.content))
 
         if str(response.status_code).startswith('2'):
             return response
@@ -124,8 +130,7 @@ class Cap(object):
 
         if jurisdiction:
             jurisdiction = jurisdiction.lower()
-            valid_jurisdictions = [elem['slug'] for elem in self.get_jurisdictions()["results"]]
-            if jurisdiction not in valid_jurisdictions:
+            if not metadata.get_registry().jurisdictions.is_valid_slug(jurisdiction):
                 raise Exception("Jurisdiction not recognized. Check spelling?")
             url_queries.append("jurisdiction=%s" % jurisdiction)
 
@@ -227,8 +232,7 @@ class Cap(object):
 
         if jurisdiction:
             jurisdiction = jurisdiction.lower()
-            valid_jurisdictions = [elem['slug'] for elem in self.get_jurisdictions()["results"]]
-            if jurisdiction not in valid_jurisdictions:
+            if not metadata.get_registry().jurisdictions.is_valid_slug(jurisdiction):
                 raise Exception("Jurisdiction not recognized. Check spelling?")
             url_queries.append("jurisdiction=%s" % jurisdiction)
 
@@ -397,3 +401,29 @@ class Cap(object):
                         break
 
         print("Downloaded " + str(downloaded_count) + " court cases to file " + filename + ".")
+
+    def sync_cases(self, filename, fields=None, out_format="csv", full=False, **search):
+        """
+        Keep a file of search results up to date: the first call downloads every result, later calls only
+        download cases that are new or changed since, and upsert them into the file by id. A watermark of the
+        last sync is saved next to the file (filename + '.watermark.json').
+
+        :param filename: file to keep up to date (.csv or .jsonl)
+        :type filename: str
+        :param fields: fields to write; see api_to_csv. Must include id and decision_date. default
+                       api_to_csv.DEFAULT_FIELDS
+        :type fields: list of strings
+        :param out_format: 'csv' or 'jsonl'
+        :type out_format: str
+        :param full: when set to true, refetch every result (only changed rows are rewritten).
+        :type full: boolean
+        :param search: search parameters, as for search_cases (search_term, jurisdiction, court, ...)
+
+        :return: number of new, changed and deleted cases
+        """
+        uri = self.search_cases(uri_only=True, **search)
+        stats = api_to_csv.sync_query_to_csv(uri, api_key=self.API_KEY, out_path=filename, fields=fields,
+                                             out_format=out_format, full=full)
+        print("Synced %s: %s new, %s changed, %s deleted." % (filename, stats["new"], stats["changed"],
+                                                                stats["deleted"]))
+        return stats
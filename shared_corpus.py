@@ -0,0 +1,203 @@
+import json
+import mmap
+from array import array
+from multiprocessing import Pool, shared_memory, util
+
+import numpy as np
+
+import utils
+
+"""
+    A parsed bulk jurisdiction in one flat block of memory that worker processes share instead of receiving pickles.
+
+    Handing a list of case dicts to a multiprocessing pool pickles every case into every task, so IPC time and memory
+    grow with the number of workers. A SharedCorpus stores the same cases as columns in one buffer:
+
+        text, name          utf-8 blobs, with text_offsets / name_offsets arrays: case i's text is
+                            text[text_offsets[i]:text_offsets[i + 1]]
+        id, year, court, opinion_count
+                            numpy arrays (court as codes into corpus.courts)
+
+    The buffer is either a multiprocessing.shared_memory block or a file that is memory-mapped. Workers attach to it
+    once, by name or path, and are then only sent (start, stop) ranges of case indexes:
+
+        with shared_corpus.SharedCorpus.from_bulk(compressed_file) as corpus:
+            totals = corpus.map(count_words, processes=8)
+
+    where count_words(corpus, start, stop) is a module-level function reading corpus.text(i), corpus.year[i] etc.
+    for its range and returning a partial result. benchmarks/bench_shared_corpus.py compares this with pickling cases.
+"""
+
+
+COLUMNS = [
+    # name, dtype
+    ('id', np.int64),
+    ('year', np.int16),
+    ('court', np.int32),
+    ('opinion_count', np.int16),
+    ('text_offsets', np.int64),
+    ('name_offsets', np.int64),
+    ('text', np.uint8),
+    ('name', np.uint8),
+]
+
+
+class SharedCorpus(object):
+    """
+    Columns of a corpus laid out in one buffer. Create one with from_bulk(), share it with attach(), open(), or map().
+    """
+
+    def __init__(self, buffer, layout, owner=None, created=False):
+        self.buffer = buffer
+        self.layout = layout
+        self.courts = layout['courts']
+        self.owner = owner
+        # only the process that created a shared memory block frees it; attached ones just detach
+        self.created = created
+        for name, dtype in COLUMNS:
+            offset, count = layout['columns'][name]
+            setattr(self, name if name not in ('text', 'name') else '_' + name,
+                    np.frombuffer(buffer, dtype=dtype, count=count, offset=offset))
+
+    def __len__(self):
+        return len(self.id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        if self.created and isinstance(self.owner, shared_memory.SharedMemory):
+            self.owner.unlink()
+
+    @classmethod
+    def from_bulk(cls, compressed_file, path=None):
+        """
+        Read a bulk data.jsonl.xz file into a new corpus: in shared memory, or in a file at path if given.
+        """
+        columns = {name: array('q') for name in ('id', 'year', 'court', 'opinion_count')}
+        text_offsets, name_offsets = array('q', [0]), array('q', [0])
+        text, names = bytearray(), bytearray()
+        courts = {}
+        for case in utils.read_cases_from_bulk(compressed_file):
+            opinions = utils.get_opinions(case)
+            columns['id'].append(case['id'])
+            columns['year'].append(int(case['decision_date'][:4]))
+            columns['court'].append(courts.setdefault(case['court']['name'], len(courts)))
+            columns['opinion_count'].append(len(opinions))
+            text += "\n\n".join(opinion['text'] for opinion in opinions).encode('utf-8')
+            names += case['name_abbreviation'].encode('utf-8')
+            text_offsets.append(len(text))
+            name_offsets.append(len(names))
+
+        data = dict(columns, text_offsets=text_offsets, name_offsets=name_offsets, text=text, name=names)
+        return cls.from_columns(data, sorted(courts, key=courts.get), path=path)
+
+    @classmethod
+    def from_columns(cls, data, courts, path=None):
+        """
+        Copy columns ({name: sequence}, as in COLUMNS) into a new buffer: shared memory, or a file at path.
+        """
+        arrays = {name: np.asarray(data[name], dtype=dtype) for name, dtype in COLUMNS}
+        layout = {'courts': list(courts), 'columns': {}}
+        size = 0
+        for name, dtype in COLUMNS:
+            # keep every column aligned to 8 bytes
+            size += -size % 8
+            layout['columns'][name] = (size, len(arrays[name]))
+            size += arrays[name].nbytes
+        size = max(size, 1)
+
+        if path:
+            with open(path, 'wb') as out_file:
+                out_file.truncate(size)
+            with open(path, 'r+b') as out_file:
+                buffer = mmap.mmap(out_file.fileno(), size)
+            owner = path
+        else:
+            owner = shared_memory.SharedMemory(create=True, size=size)
+            buffer = owner.buf
+        for name, dtype in COLUMNS:
+            offset, count = layout['columns'][name]
+            np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)[:] = arrays[name]
+
+        if path:
+            buffer.flush()
+            layout['path'] = path
+            with open(path + '.json', 'w') as layout_file:
+                json.dump(layout, layout_file)
+        else:
+            layout['shared_memory'] = owner.name
+        return cls(buffer, layout, owner=owner, created=True)
+
+    @classmethod
+    def attach(cls, layout):
+        """
+        Attach to a corpus created by another process, from its layout, without copying it.
+        """
+        if 'path' in layout:
+            return cls.open(layout['path'])
+        block = shared_memory.SharedMemory(name=layout['shared_memory'])
+        return cls(block.buf, layout, owner=block)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map a corpus saved to a file by from_bulk(path=...).
+        """
+        with open(path + '.json') as layout_file:
+            layout = json.load(layout_file)
+        with open(path, 'rb') as in_file:
+            buffer = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, layout)
+
+    def close(self):
+        """
+        Detach from the buffer. The creator of a shared memory corpus frees it on leaving its with block.
+        """
+        if self.buffer is None:
+            return
+        # the column arrays export the buffer, which can't be closed while they exist
+        for name, _ in COLUMNS:
+            setattr(self, name if name not in ('text', 'name') else '_' + name, None)
+        if isinstance(self.owner, shared_memory.SharedMemory):
+            self.owner.close()
+        elif isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.buffer = None
+
+    def text(self, index):
+        return self._text[self.text_offsets[index]:self.text_offsets[index + 1]].tobytes().decode('utf-8')
+
+    def name(self, index):
+        return self._name[self.name_offsets[index]:self.name_offsets[index + 1]].tobytes().decode('utf-8')
+
+    def case(self, index):
+        return {'id': int(self.id[index]), 'name_abbreviation': self.name(index), 'year': int(self.year[index]),
+                'court': self.courts[self.court[index]], 'opinion_count': int(self.opinion_count[index]),
+                'text': self.text(index)}
+
+    def ranges(self, chunk_size=1000):
+        return [(start, min(start + chunk_size, len(self))) for start in range(0, len(self), chunk_size)]
+
+    def map(self, function, processes=None, chunk_size=1000):
+        """
+        Return [function(corpus, start, stop) for each range of chunk_size cases], computed in a pool of worker
+        processes that each attach to the corpus once. function must be importable by the workers.
+        """
+        with Pool(processes, initializer=_attach_worker, initargs=(self.layout,)) as pool:
+            return pool.starmap(_run_range, [(function, start, stop) for start, stop in self.ranges(chunk_size)])
+
+
+_worker_corpus = None
+
+
+def _attach_worker(layout):
+    global _worker_corpus
+    _worker_corpus = SharedCorpus.attach(layout)
+    # detach before the worker exits, rather than leaving it to garbage collection after the views are gone
+    util.Finalize(None, _worker_corpus.close, exitpriority=0)
+
+
+def _run_range(function, start, stop):
+    return function(_worker_corpus, start, stop)
@@ -0,0 +1,335 @@
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+import utils
+
+"""
+    "Find cases like this one" over downloaded bulk jurisdictions, without the API.
+
+    Building the index has two steps:
+
+    - add: stream a jurisdiction's bulk file through worker processes, hashing each case's words into a fixed number
+      of features (no vocabulary to keep in memory), and save its sparse term count matrix. Each jurisdiction is saved
+      separately, so adding one more jurisdiction doesn't re-read the others.
+    - build: weight the counts of every added jurisdiction by TF-IDF, optionally reduce them to --dims dense dimensions
+      with a truncated SVD (latent semantic analysis), and cluster those into --lists inverted lists with k-means.
+
+    A query is turned into the same kind of vector. With reduced vectors only the lists whose centroids are closest to
+    the query are scored (an approximate nearest neighbor search); otherwise every case is scored with one sparse
+    matrix-vector product. Vectors are memory-mapped from the index directory, so loading an index is instant.
+
+    Usage (from the repository root):
+
+        $ python -m similar_cases.similar_cases add Illinois Arkansas --index-dir data/similar_cases
+        $ python -m similar_cases.similar_cases build --index-dir data/similar_cases --dims 128
+        $ python -m similar_cases.similar_cases query --index-dir data/similar_cases --case-id 435800
+        $ python -m similar_cases.similar_cases query --index-dir data/similar_cases --text "railroad crossing collision"
+"""
+
+
+WORD_RE = re.compile(r"[a-z]{3,}")
+N_FEATURES = 1 << 18
+
+
+def hash_counts(text, n_features=N_FEATURES):
+    """
+    Return (feature indices, counts) of the words of text, hashed into n_features.
+    """
+    words = WORD_RE.findall(text.lower())
+    features = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.int64, count=len(words))
+    return np.unique(features % n_features, return_counts=True)
+
+
+def _count_chunk(lines, n_features=N_FEATURES):
+    """
+    Worker: decode a chunk of raw bulk lines and return (case ids, names, CSR matrix of hashed term counts).
+    """
+    case_ids, names, indptr, indices, counts = [], [], [0], [], []
+    for line in lines:
+        case = json.loads(str(line, 'utf-8'))
+        features, feature_counts = hash_counts(" ".join(opinion['text'] for opinion in utils.get_opinions(case)),
+                                               n_features)
+        case_ids.append(case['id'])
+        names.append(case['name_abbreviation'])
+        indices.append(features)
+        counts.append(feature_counts)
+        indptr.append(indptr[-1] + len(features))
+    matrix = sparse.csr_matrix((np.concatenate(counts).astype(np.float32) if counts else [],
+                                np.concatenate(indices) if indices else [], indptr), shape=(len(case_ids), n_features))
+    return case_ids, names, matrix
+
+
+def add_jurisdiction(index_dir, jurisdiction, data_format="json", n_features=N_FEATURES, processes=None,
+                     chunk_size=1000, force=False):
+    """
+    Hash the cases of a jurisdiction into index_dir/parts/<jurisdiction>/, unless that was done already.
+    Return the number of cases added.
+    """
+    part_dir = os.path.join(index_dir, 'parts', jurisdiction)
+    if os.path.exists(os.path.join(part_dir, 'counts.npz')) and not force:
+        utils.print_info("%s is already in %s" % (jurisdiction, index_dir))
+        return 0
+    compressed_file = utils.get_and_extract_from_bulk(jurisdiction=jurisdiction, data_format=data_format)
+
+    case_ids, names, matrices = [], [], []
+    worker = partial(_count_chunk, n_features=n_features)
+    with Pool(processes) as pool:
+        for chunk_ids, chunk_names, matrix in pool.imap(worker, utils.read_chunks_from_bulk(compressed_file,
+                                                                                             chunk_size=chunk_size)):
+            case_ids.extend(chunk_ids)
+            names.extend(chunk_names)
+            matrices.append(matrix)
+
+    os.makedirs(part_dir, exist_ok=True)
+    sparse.save_npz(os.path.join(part_dir, 'counts.npz'), sparse.vstack(matrices, format='csr'))
+    np.save(os.path.join(part_dir, 'case_ids.npy'), np.array(case_ids, dtype=np.int64))
+    with open(os.path.join(part_dir, 'names.json'), 'w') as names_file:
+        json.dump(names, names_file)
+    return len(case_ids)
+
+
+def _normalize_rows(vectors):
+    if sparse.issparse(vectors):
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        return sparse.diags(1 / np.maximum(norms, 1e-12)) @ vectors
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def tfidf(counts, idf):
+    """
+    Return L2-normalized TF-IDF rows, with sublinear (1 + log) term frequency.
+    """
+    weighted = counts.tocsr(copy=True)
+    weighted.data = (1 + np.log(weighted.data)) * idf[weighted.indices]
+    return _normalize_rows(weighted).tocsr().astype(np.float32)
+
+
+def kmeans(vectors, clusters, iterations=10, sample_size=50000, seed=1):
+    """
+    Spherical k-means: return unit centroids of normalized vectors, trained on a sample of them.
+    """
+    generator = np.random.RandomState(seed)
+    sample = vectors[np.sort(generator.choice(len(vectors), min(sample_size, len(vectors)), replace=False))]
+    centroids = sample[generator.choice(len(sample), clusters, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        members = sparse.csr_matrix((np.ones(len(sample), dtype=sample.dtype), (assignments, np.arange(len(sample)))),
+                                    shape=(len(centroids), len(sample)))
+        sums = np.asarray(members @ sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+def _assign(vectors, centroids, block_size=10000):
+    return np.concatenate([np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), block_size)])
+
+
+def build_index(index_dir, dims=None, lists=None, seed=1):
+    """
+    Combine every added jurisdiction into a searchable index in index_dir.
+
+    dims reduces vectors to that many dimensions with a truncated SVD; lists (default about the square root of the
+    number of cases) is the number of inverted lists of the approximate search, which needs dims.
+    """
+    parts_dir = os.path.join(index_dir, 'parts')
+    parts = sorted(os.listdir(parts_dir))
+    counts = sparse.vstack([sparse.load_npz(os.path.join(parts_dir, part, 'counts.npz')) for part in parts],
+                           format='csr')
+    case_ids = np.concatenate([np.load(os.path.join(parts_dir, part, 'case_ids.npy')) for part in parts])
+    names = []
+    for part in parts:
+        with open(os.path.join(parts_dir, part, 'names.json')) as names_file:
+            names.extend(json.load(names_file))
+
+    # document frequency: every stored count is one (case, feature) pair
+    document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = (np.log((1 + counts.shape[0]) / (1 + document_frequency)) + 1).astype(np.float32)
+    vectors = tfidf(counts, idf)
+    del counts
+
+    # replace any previously built index
+    for name in ('idf.npy', 'tfidf.npz', 'tfidf_data.npy', 'tfidf_indices.npy', 'tfidf_indptr.npy', 'components.npy',
+                 'vectors.npy', 'centroids.npy', 'list_offsets.npy', 'list_order.npy'):
+        if os.path.exists(os.path.join(index_dir, name)):
+            os.remove(os.path.join(index_dir, name))
+    np.save(os.path.join(index_dir, 'idf.npy'), idf)
+    np.save(os.path.join(index_dir, 'case_ids.npy'), case_ids)
+    # sorted ids and their rows, to find a case's row with a binary search of the memory-mapped arrays
+    id_rows = np.argsort(case_ids, kind='stable')
+    np.save(os.path.join(index_dir, 'sorted_ids.npy'), case_ids[id_rows])
+    np.save(os.path.join(index_dir, 'id_rows.npy'), id_rows)
+    with open(os.path.join(index_dir, 'names.json'), 'w') as names_file:
+        json.dump(names, names_file)
+
+    if not dims:
+        # the CSR arrays are saved uncompressed so that queries can memory-map them
+        vectors = vectors.tocsr()
+        np.save(os.path.join(index_dir, 'tfidf_data.npy'), vectors.data)
+        np.save(os.path.join(index_dir, 'tfidf_indices.npy'), vectors.indices)
+        np.save(os.path.join(index_dir, 'tfidf_indptr.npy'), vectors.indptr)
+        return len(case_ids)
+
+    _, _, components = svds(vectors, k=dims, random_state=seed)
+    components = components.T.astype(np.float32)
+    vectors = _normalize_rows(np.asarray(vectors @ components, dtype=np.float32))
+    np.save(os.path.join(index_dir, 'components.npy'), components)
+
+    lists = lists or max(1, int(np.sqrt(len(vectors))))
+    centroids = kmeans(vectors, min(lists, len(vectors)), seed=seed).astype(np.float32)
+    assignments = _assign(vectors, centroids)
+    # vectors are stored grouped by list, so probing a list reads one contiguous block
+    list_order = np.argsort(assignments, kind='stable')
+    list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=list_offsets[1:])
+    np.save(os.path.join(index_dir, 'vectors.npy'), vectors[list_order])
+    np.save(os.path.join(index_dir, 'list_order.npy'), list_order)
+    np.save(os.path.join(index_dir, 'list_offsets.npy'), list_offsets)
+    np.save(os.path.join(index_dir, 'centroids.npy'), centroids)
+    return len(case_ids)
+
+
+class SimilarCases(object):
+    """
+    A similarity index written by build_index(), loaded from disk.
+    """
+
+    def __init__(self, index_dir, probes=8):
+        self.index_dir = index_dir
+        self.probes = probes
+        load = lambda name: np.load(os.path.join(index_dir, name), mmap_mode='r')
+        self.idf = load('idf.npy')
+        self.case_ids = load('case_ids.npy')
+        with open(os.path.join(index_dir, 'names.json')) as names_file:
+            self.names = json.load(names_file)
+        self.sorted_ids = load('sorted_ids.npy')
+        self.id_rows = load('id_rows.npy')
+        if os.path.exists(os.path.join(index_dir, 'vectors.npy')):
+            self.tfidf = None
+            self.components = load('components.npy')
+            self.vectors = load('vectors.npy')
+            self.centroids = load('centroids.npy')
+            self.list_order = load('list_order.npy')
+            self.list_offsets = load('list_offsets.npy')
+            # row of each case in the list-grouped vectors
+            self.positions = np.empty(len(self.list_order), dtype=np.int64)
+            self.positions[self.list_order] = np.arange(len(self.list_order))
+        else:
+            self.tfidf = sparse.csr_matrix((load('tfidf_data.npy'), load('tfidf_indices.npy'),
+                                            load('tfidf_indptr.npy')), shape=(len(self.case_ids), len(self.idf)),
+                                           copy=False)
+
+    def row(self, case_id):
+        """
+        Return the row of a case in the index. Raises a KeyError if the case isn't in it.
+        """
+        position = int(np.searchsorted(self.sorted_ids, case_id))
+        if position == len(self.sorted_ids) or self.sorted_ids[position] != case_id:
+            raise KeyError(case_id)
+        return int(self.id_rows[position])
+
+    def text_vector(self, text):
+        features, counts = hash_counts(text, len(self.idf))
+        vector = tfidf(sparse.csr_matrix((counts.astype(np.float32), features, [0, len(features)]),
+                                         shape=(1, len(self.idf))), np.asarray(self.idf))
+        if self.tfidf is not None:
+            return vector
+        return _normalize_rows(np.asarray(vector @ self.components))[0]
+
+    def case_vector(self, case_id):
+        row = self.row(case_id)
+        if self.tfidf is not None:
+            return self.tfidf[row]
+        return np.asarray(self.vectors[self.positions[row]])
+
+    def search(self, vector, limit=10, exclude=None):
+        """
+        Return (case id, name, cosine similarity) of the limit cases closest to a query vector.
+        """
+        if self.tfidf is not None:
+            rows = np.arange(self.tfidf.shape[0])
+            scores = (self.tfidf @ vector.T).toarray().ravel()
+        else:
+            probed = np.argsort(-(self.centroids @ vector))[:self.probes]
+            positions = np.concatenate([np.arange(self.list_offsets[probe], self.list_offsets[probe + 1])
+                                        for probe in probed])
+            rows = self.list_order[positions]
+            scores = self.vectors[positions] @ vector
+        if exclude is not None:
+            scores = np.where(self.case_ids[rows] == exclude, -np.inf, scores)
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit] if limit else []
+        best = sorted(best, key=lambda index: -scores[index])
+        return [(int(self.case_ids[rows[index]]), self.names[rows[index]], float(scores[index])) for index in best]
+
+    def similar_to_case(self, case_id, limit=10):
+        return self.search(self.case_vector(case_id), limit=limit, exclude=case_id)
+
+    def similar_to_text(self, text, limit=10):
+        return self.search(self.text_vector(text), limit=limit)
+
+
+def main():
+    """
+    Parse command line arguments, then add jurisdictions to, build or query an index.
+    """
+    parser = argparse.ArgumentParser(description='Find similar cases in bulk data.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('add', help='hash the cases of bulk jurisdictions into the index')
+    command.add_argument('jurisdictions', nargs='+', help='jurisdiction names, e.g. Illinois Arkansas')
+    command.add_argument('--data-format', default='json', help='bulk casebody format, json or xml (default json)')
+    command.add_argument('--processes', type=int, help='worker processes (default one per cpu)')
+    command.add_argument('--force', action='store_true', help='hash jurisdictions added before again')
+
+    command = commands.add_parser('build', help='build the searchable index from every added jurisdiction')
+    command.add_argument('--dims', type=int, help='reduce vectors to this many dimensions (needed for approximate '
+                                                  'search; default exact search over sparse vectors)')
+    command.add_argument('--lists', type=int, help='inverted lists for approximate search (default sqrt(cases))')
+
+    command = commands.add_parser('query', help='print the cases most similar to a case or a text')
+    command.add_argument('--case-id', type=int, help='find cases similar to this case')
+    command.add_argument('--text', help='find cases similar to this text')
+    command.add_argument('--limit', type=int, default=10, help='cases to print (default 10)')
+    command.add_argument('--probes', type=int, default=8, help='inverted lists searched (default 8)')
+
+    for command in commands.choices.values():
+        command.add_argument('--index-dir', default='similar_cases_index', help='index directory')
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        for jurisdiction in args.jurisdictions:
+            count = add_jurisdiction(args.index_dir, jurisdiction, data_format=args.data_format,
+                                     processes=args.processes, force=args.force)
+            utils.print_info("Added %s cases of %s" % (count, jurisdiction))
+    elif args.command == 'build':
+        count = build_index(args.index_dir, dims=args.dims, lists=args.lists)
+        utils.print_info("Indexed %s cases in %s" % (count, args.index_dir))
+    else:
+        index = SimilarCases(args.index_dir, probes=args.probes)
+        if args.case_id:
+            results = index.similar_to_case(args.case_id, limit=args.limit)
+        elif args.text:
+            results = index.similar_to_text(args.text, limit=args.limit)
+        else:
+            parser.error("query needs --case-id or --text")
+        for case_id, name, score in results:
+            print("%.3f %s %s" % (score, case_id, name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
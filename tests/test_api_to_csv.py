@@ -0,0 +1,125 @@
+import csv
+import json
+import http.client
+
+from api_to_csv.api_to_csv import api_query_to_csv, get_results, sync_query_to_csv
+from benchmarks.mock_server import MockCapServer
+
+
+def test_get_results_reuses_connection(monkeypatch):
+    """
+    Make sure every page is fetched, over a single kept-alive connection
+    """
+    connects = []
+    connect = http.client.HTTPConnection.connect
+    monkeypatch.setattr(http.client.HTTPConnection, 'connect', lambda self: connects.append(1) or connect(self))
+
+    with MockCapServer(case_count=45, page_size=10) as server:
+        results = list(get_results(server.api_url + 'cases/'))
+        # stop after the first page: the prefetching thread must not hang
+        first = next(get_results(server.api_url + 'cases/'))
+
+    assert [result['id'] for result in results] == list(range(1, 46))
+    assert first['id'] == 1
+    assert len(connects) == 2
+
+
+def test_api_query_to_csv(tmp_path):
+    """
+    Make sure fields are projected, and queries are merged into one output without duplicates
+    """
+    csv_path = str(tmp_path / 'cases.csv')
+    jsonl_path = str(tmp_path / 'cases.jsonl')
+    sequential_path = str(tmp_path / 'sequential.jsonl')
+    with MockCapServer(case_count=60, page_size=7) as server:
+        urls = [server.api_url + 'cases/?jurisdiction=%s' % slug for slug in ('ill', 'ark', 'mass')]
+        expected = {case['id']: case for case in server.cases}
+
+        api_query_to_csv(urls[0], out_path=csv_path)
+        api_query_to_csv(urls + urls[:1], out_path=jsonl_path, fields=['id', 'court.name', 'citations'],
+                         out_format='jsonl', workers=3)
+        api_query_to_csv(urls + urls[:1], out_path=sequential_path, fields=['id'], out_format='jsonl')
+
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert rows and all(row['jurisdiction'] == 'Ill.' for row in rows)
+    assert rows[0]['citation'] == expected[int(rows[0]['id'])]['citations'][0]['cite']
+
+    with open(jsonl_path, encoding='utf-8') as jsonl_file:
+        records = [json.loads(line) for line in jsonl_file]
+    assert sorted(record['id'] for record in records) == sorted(expected)
+    with open(sequential_path, encoding='utf-8') as jsonl_file:
+        assert sorted(json.loads(line)['id'] for line in jsonl_file) == sorted(expected)
+    assert all(record['court.name'] == expected[record['id']]['court']['name'] for record in records)
+    assert records[0]['citations'] == expected[records[0]['id']]['citations']
+
+
+def test_sync_query_to_csv(tmp_path):
+    """
+    Make sure a sync only fetches what changed, and leaves the output as a full fetch would
+    """
+    out_path = str(tmp_path / 'cases.csv')
+    full_path = str(tmp_path / 'full.csv')
+    fields = ['id', 'name', 'decision_date']
+    with MockCapServer(case_count=300, page_size=10) as server:
+        url = server.api_url + 'cases/?jurisdiction=ill'
+        assert sync_query_to_csv(url, out_path=out_path, fields=fields)['new'] > 0
+
+        ill_cases = [case for case in server.cases if case['jurisdiction']['slug'] == 'ill']
+        oldest = min(ill_cases, key=lambda case: case['decision_date'])
+        # the latest case of the query is always refetched, so its new name is always picked up
+        latest = max(ill_cases, key=lambda case: case['decision_date'])
+        latest['name'] = 'Renamed v. Latest'
+        server.cases.append(dict(oldest, id=1001, decision_date='1851-06-01'))
+        server.cases.append(dict(oldest, id=1002, decision_date='2030-01-01'))
+        server.filtered.clear()
+        requests_before = len(server.requests)
+
+        stats = sync_query_to_csv(url, out_path=out_path, fields=fields)
+        assert len(server.requests) - requests_before < 30
+        assert stats['new'] == 2 and stats['deleted'] == 0
+        assert stats['changed'] == 1
+
+        server.cases.remove(ill_cases[5])
+        server.filtered.clear()
+        assert sync_query_to_csv(url, out_path=out_path, fields=fields)['deleted'] == 1
+
+        requests_before = len(server.requests)
+        assert sync_query_to_csv(url, out_path=out_path, fields=fields)['count_requests'] == 1
+        assert len(server.requests) - requests_before == 2
+        api_query_to_csv(url, out_path=full_path, fields=fields)
+
+    with open(out_path, newline='', encoding='utf-8') as out_file, \
+            open(full_path, newline='', encoding='utf-8') as full_file:
+        assert sorted(csv.reader(out_file)) == sorted(csv.reader(full_file))
+    with open(out_path + '.watermark.json') as watermark_file:
+        watermark = json.load(watermark_file)
+    assert watermark['max_decision_date'] == '2030-01-01'
+
+    # another query's fields: the old rows are replaced
+    with MockCapServer(case_count=30) as server:
+        stats = sync_query_to_csv(server.api_url + 'cases/', out_path=out_path, fields=['id', 'decision_date'])
+    assert stats['new'] == 30
+    with open(out_path, newline='', encoding='utf-8') as out_file:
+        assert next(csv.reader(out_file)) == ['id', 'decision_date'] and len(list(out_file)) == 30
+
+
+def test_client_counts_retries(monkeypatch):
+    """
+    Make sure a dropped connection is retried once, and counted
+    """
+    import instrumentation
+    instrumentation.metrics.reset()
+    getresponse = http.client.HTTPConnection.getresponse
+    drops = []
+
+    def drop_once(self):
+        if not drops:
+            drops.append(1)
+            raise http.client.RemoteDisconnected("closed")
+        return getresponse(self)
+
+    monkeypatch.setattr(http.client.HTTPConnection, 'getresponse', drop_once)
+    with MockCapServer(case_count=5) as server:
+        assert len(list(get_results(server.api_url + 'cases/'))) == 5
+    assert instrumentation.metrics.counters[('api_to_csv_retries_total', ())] == 1
@@ -0,0 +1,51 @@
+import json
+import lzma
+
+from benchmarks.fixtures import make_case
+from citation_graph import citation_graph
+
+
+# case id: (own citations, text of its opinion)
+CASES = {
+    10: (['1 Ill. 100'], "No citations here."),
+    11: (['1 Ill. 200'], "As held in People v. Smith, 1 Ill. 100, the rule applies."),
+    12: (['2 Ill. 300'], "See 1 Ill. 100; 1 Ill. 200 at 205; 1 Ill. 100 again, and 999 U.S. 1. Cited as 2 Ill. 300."),
+    13: (['2 Ill. 400', '5 N.E.2d 50'], "Compare 1 Ill. 100 with 1 Ill. 200."),
+    14: (['3 Ill. 500'], "Following 5 N. E. 2d 50, we affirm."),
+}
+
+
+def write_bulk(path):
+    with lzma.open(path, 'wt', encoding='utf-8') as out_file:
+        for case_id, (own, text) in CASES.items():
+            case = make_case(case_id)
+            case['citations'] = [{'cite': cite, 'type': 'official'} for cite in own]
+            case['casebody']['data']['opinions'] = [{'type': 'majority', 'author': None, 'text': text}]
+            out_file.write(json.dumps(case) + '\n')
+
+
+def test_citation_graph(tmp_path):
+    """
+    Make sure citations are resolved to edges once each, and degrees and PageRank follow from them
+    """
+    bulk_path = str(tmp_path / 'data.jsonl.xz')
+    write_bulk(bulk_path)
+    out_dir = str(tmp_path / 'graph')
+    assert citation_graph.build([bulk_path], out_dir, processes=2, chunk_size=2) == (5, 6)
+
+    graph = citation_graph.CitationGraph(out_dir)
+    assert len(graph) == 5 and graph.edge_count == 6
+    assert sorted(graph.cites(12).tolist()) == [10, 11]
+    assert graph.cites(14).tolist() == [13]
+    assert sorted(graph.cited_by(10).tolist()) == [11, 12, 13]
+    assert [graph.in_degree(case_id) for case_id in CASES] == [3, 2, 0, 1, 0]
+    assert [graph.out_degree(case_id) for case_id in CASES] == [0, 1, 2, 2, 1]
+    assert graph.lookup('5 N. E. 2d 50') == 13 and graph.lookup('999 U.S. 1') is None
+
+    case_ids, distances = graph.k_hop(14, hops=2)
+    assert dict(zip(case_ids.tolist(), distances.tolist())) == {13: 1, 10: 2, 11: 2}
+
+    ranks = graph.pagerank()
+    assert abs(ranks.sum() - 1) < 1e-6
+    assert [case_id for case_id, _ in graph.top(ranks, 3)] == [10, 11, 13]
+    assert [case_id for case_id, _ in graph.top(graph.in_degrees(), 2)] == [10, 11]
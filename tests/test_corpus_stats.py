@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from ngrams import corpus_stats
+
+
+def test_crosstab():
+    """
+    Make sure crosstab matches pd.crosstab, with more categories than int8 codes can combine
+    """
+    generator = np.random.RandomState(0)
+    rows = pd.Series(pd.Categorical(generator.choice(['court %s' % n for n in range(30)], size=2000)))
+    columns = pd.Series(pd.Categorical(generator.choice(['type %s' % n for n in range(15)], size=2000)))
+    years = pd.Series(generator.randint(1850, 1900, size=2000))
+
+    expected = pd.crosstab(rows, columns)
+    table = corpus_stats.crosstab(rows, columns)
+    assert (table.to_numpy() == expected.to_numpy()).all()
+    assert list(table.index) == list(expected.index) and list(table.columns) == list(expected.columns)
+
+    expected = pd.crosstab(years, columns)
+    table = corpus_stats.crosstab(years, columns)
+    assert (table.to_numpy() == expected.to_numpy()).all() and list(table.index) == list(expected.index)
+
+    assert corpus_stats.counts(rows).to_dict() == rows.value_counts().to_dict()
@@ -0,0 +1,105 @@
+import json
+import os
+
+from api_tutorial_downloader import crawl_coordinator
+from benchmarks.mock_server import MockCapServer
+
+
+def read_shards(crawl_dir):
+    shards_dir = os.path.join(crawl_dir, 'shards')
+    return {name: [json.loads(line) for line in open(os.path.join(shards_dir, name))]
+            for name in sorted(os.listdir(shards_dir))}
+
+
+def test_crawl(tmp_path, monkeypatch):
+    """
+    Make sure every case is crawled once into its job's shard, expired leases are taken over, and failures retried
+    """
+    crawl_dir = str(tmp_path)
+    courts = ['ill', 'ark', 'mass-app-dec']
+    assert crawl_coordinator.plan(crawl_dir, courts=courts, start_year=1850, end_year=2019, years_per_job=50) == 12
+    assert crawl_coordinator.plan(crawl_dir, courts=courts, start_year=1850, end_year=2019, years_per_job=50) == 0
+
+    with MockCapServer(case_count=200, page_size=10) as server:
+        # a worker that leased a job and died: its lease expires and the job goes to another worker
+        connection = crawl_coordinator.connect(crawl_dir)
+        dead = crawl_coordinator.lease(connection, 'dead-worker', lease_seconds=-1, max_attempts=5)
+        # a job that fails once is retried
+        failures = []
+        api_request = crawl_coordinator.api_request
+
+        temporary_files = set()
+
+        def flaky_request(url, api_key=None):
+            temporary_files.update(name for name in os.listdir(os.path.join(crawl_dir, 'shards'))
+                                   if name.endswith('.tmp'))
+            if 'court=ark' in url and not failures:
+                failures.append(url)
+                raise Exception("connection reset")
+            return api_request(url, api_key)
+
+        monkeypatch.setattr(crawl_coordinator, 'api_request', flaky_request)
+        crawl_coordinator.work(crawl_dir, owner='worker', api_url=server.api_url + 'cases/', retry_delay=0,
+                               sleep_delay=0)
+        expected = {case['id'] for case in server.cases if case['court']['slug'] in courts}
+
+    counts, failed = crawl_coordinator.status(crawl_dir)
+    assert counts == {'done': (12, len(expected))} and failed == []
+    assert dead['id'] == 'court-ark_1850-1899' and failures
+    # shards are written under the worker's name until complete
+    assert 'court-ill_2000-2019.jsonl.worker.tmp' in temporary_files
+
+    shards = read_shards(crawl_dir)
+    assert len(shards) == 12 and 'court-ill_2000-2019.jsonl' in shards
+    ids = [case['id'] for cases in shards.values() for case in cases]
+    assert sorted(ids) == sorted(expected)
+    for case in shards['court-mass-app-dec_1900-1949.jsonl']:
+        assert case['court']['slug'] == 'mass-app-dec' and '1900' <= case['decision_date'][:4] <= '1949'
+
+
+def test_failed_jobs(tmp_path):
+    """
+    Make sure a job that keeps failing stops after max_attempts, and can be retried
+    """
+    crawl_dir = str(tmp_path)
+    crawl_coordinator.plan(crawl_dir, courts=['ill'], start_year=1850, end_year=1850)
+    # nothing listens on port 9
+    assert crawl_coordinator.work(crawl_dir, api_url='http://127.0.0.1:9/v1/cases/', max_attempts=2,
+                                  retry_delay=0) == 0
+
+    counts, failed = crawl_coordinator.status(crawl_dir)
+    assert counts == {'failed': (1, 0)} and failed[0][0] == 'court-ill_1850-1850'
+    assert os.listdir(os.path.join(crawl_dir, 'shards')) == []
+    assert crawl_coordinator.retry_failed(crawl_dir) == 1
+
+
+def test_waiting_and_expired_leases(tmp_path, monkeypatch):
+    """
+    Make sure a worker waits out retry delays instead of leaving, and a lease expiring on its last attempt fails
+    """
+    crawl_dir = str(tmp_path)
+    crawl_coordinator.plan(crawl_dir, courts=['ill', 'ark'], start_year=1850, end_year=2019, years_per_job=170)
+    connection = crawl_coordinator.connect(crawl_dir)
+    # two workers leased the ark job and died
+    for owner in ('dead-1', 'dead-2'):
+        assert crawl_coordinator.lease(connection, owner, lease_seconds=-1, max_attempts=2)['id'] == \
+            'court-ark_1850-2019'
+
+    with MockCapServer(case_count=50, page_size=10) as server:
+        failures = []
+        api_request = crawl_coordinator.api_request
+
+        def flaky_request(url, api_key=None):
+            if not failures:
+                failures.append(url)
+                raise Exception("connection reset")
+            return api_request(url, api_key)
+
+        monkeypatch.setattr(crawl_coordinator, 'api_request', flaky_request)
+        assert crawl_coordinator.work(crawl_dir, api_url=server.api_url + 'cases/', max_attempts=2, retry_delay=.5,
+                                      sleep_delay=0) == 1
+
+    counts, failed = crawl_coordinator.status(crawl_dir)
+    assert set(counts) == {'done', 'failed'}
+    assert failed == [('court-ark_1850-2019', 'lease expired on the last attempt')]
+    assert crawl_coordinator.retry_failed(crawl_dir) == 1
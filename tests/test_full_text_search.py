@@ -0,0 +1,36 @@
+import json
+
+import metadata
+from benchmarks import fixtures
+from benchmarks.mock_server import MockCapServer
+from full_text_search import full_text_search
+
+
+def test_count_stories(tmp_path, monkeypatch):
+    """
+    Make sure each keyword is counted per jurisdiction, with its oldest case, and keywords found nowhere stop early
+    """
+    with open(str(tmp_path / 'jurisdictions.json'), 'w') as snapshot_file:
+        json.dump({'downloaded': '2022-01-01T00:00:00', 'count': len(fixtures.JURISDICTIONS),
+                   'results': fixtures.JURISDICTIONS}, snapshot_file)
+    registry = metadata.MetadataRegistry(snapshot_dir=str(tmp_path))
+    monkeypatch.setattr(metadata, 'get_registry', lambda: registry)
+
+    with MockCapServer(case_count=120, page_size=10) as server:
+        stories = full_text_search.count_stories(['turkey', 'zebra'], workers=2, api_url=server.api_url)
+        request_count = len(server.requests)
+        cases = server.cases
+
+    matching = [case for case in cases if 'turkey' in case['casebody']['data']['opinions'][0]['text']]
+    total, jurisdictions = stories['turkey']
+    assert total == len(matching) > 0
+    assert sum(values['count'] for values in jurisdictions.values()) == total
+    for name, values in jurisdictions.items():
+        in_jurisdiction = [case for case in matching if case['jurisdiction']['name'] == name]
+        oldest = min(in_jurisdiction, key=lambda case: case['decision_date'])
+        assert values['count'] == len(in_jurisdiction)
+        assert (values['oldest_case_id'], values['oldest_case_date']) == (oldest['id'], oldest['decision_date'])
+
+    assert stories['zebra'] == (0, {})
+    # two totals, then one request per jurisdiction for the keyword found
+    assert request_count == 2 + len(fixtures.JURISDICTIONS)
@@ -0,0 +1,57 @@
+import csv
+import json
+
+from map_courts.geocode_courts import geocode_courts, COURTS_FIELDNAMES
+
+
+class StubGeocoder(object):
+    """
+    Answers every query with one result in Illinois, and records the queries it was sent.
+    """
+
+    def __init__(self, fail=()):
+        self.queries = []
+        self.fail = fail
+
+    def geocode(self, query):
+        self.queries.append(query)
+        if query in self.fail:
+            raise Exception("over query limit")
+        return [{'formatted_address': query + ', IL', 'place_id': 'place-' + query,
+                 'geometry': {'location': {'lat': 41.8, 'lng': -87.6}},
+                 'address_components': [{'long_name': 'Illinois', 'types': ['administrative_area_level_1']}]}]
+
+
+def write_courts(path):
+    rows = [
+        ['1', 'ill', 'Illinois Supreme Court', 'Illinois', 'ill'],
+        ['2', 'ill-app-ct', 'Illinois Appellate Court', 'Illinois', 'ill'],
+        ['3', 'ill-app-ct-2', 'Illinois Appellate Court', 'Illinois', 'ill'],
+        ['4', 'ark', 'Arkansas Supreme Court', 'Arkansas', 'ark'],
+    ]
+    with open(path, 'w', newline='') as courts_file:
+        writer = csv.writer(courts_file)
+        writer.writerow(COURTS_FIELDNAMES)
+        writer.writerows(rows)
+
+
+def test_geocode_courts_dedupes_and_resumes(tmp_path):
+    """
+    Make sure each distinct court name is geocoded once, and a second run only retries what failed
+    """
+    courts_path, out_path, cache_path = str(tmp_path / 'courts.csv'), str(tmp_path / 'out.csv'), \
+        str(tmp_path / 'cache.jsonl')
+    write_courts(courts_path)
+
+    geocoder = StubGeocoder(fail=['Illinois Supreme Court'])
+    assert geocode_courts(courts_path, out_path, geocoder, cache_path, workers=2, rate=0) == 2
+    assert sorted(geocoder.queries) == ['Arkansas Supreme Court', 'Illinois Appellate Court', 'Illinois Supreme Court']
+
+    geocoder = StubGeocoder()
+    assert geocode_courts(courts_path, out_path, geocoder, cache_path, workers=2, rate=0) == 1
+    assert geocoder.queries == ['Illinois Supreme Court']
+
+    with open(out_path, newline='') as out_file:
+        rows = list(csv.DictReader(out_file))
+    assert sorted(row['court_id'] for row in rows) == ['1', '2', '3']
+    assert json.loads(rows[0]['longitudes']) == [-87.6]
@@ -0,0 +1,52 @@
+import io
+import json
+from collections import namedtuple
+
+from labelling_summarizing import label_parties
+
+Entity = namedtuple('Entity', ['text', 'label_'])
+Doc = namedtuple('Doc', ['ents'])
+
+
+class FakeNlp:
+    """
+    Labels the first word of a name PERSON and the last word ORG, and records every name it parses.
+    """
+    def __init__(self):
+        self.parsed = []
+        self.calls = 0
+
+    def pipe(self, names, batch_size=1000, n_process=1):
+        self.calls += 1
+        for name in names:
+            self.parsed.append(name)
+            words = name.split()
+            yield Doc([Entity(words[0], 'PERSON'), Entity(words[-1], 'ORG')])
+
+
+def test_label_parties():
+    """
+    Make sure cases come out in input order, each distinct name is parsed once, and cached names aren't parsed again
+    """
+    names = ['People v. Smith', 'Jones v. Acme', 'People v. Smith', 'Doe v. Roe', 'Jones v. Acme', 'People v. Smith',
+             'Brown v. Board']
+    cases = [{'id': case_id, 'name': name} for case_id, name in enumerate(names)]
+    nlp = FakeNlp()
+    cache = {'Doe v. Roe': [('Doe', 'PERSON')]}
+    cache_file = io.StringIO()
+
+    results = list(label_parties.label_parties(iter(cases), nlp, batch_size=3, cache=cache, cache_file=cache_file))
+
+    assert [case['id'] for case, _ in results] == list(range(len(names)))
+    assert results[0][1] == [('People', 'PERSON'), ('Smith', 'ORG')]
+    assert results[3][1] == [('Doe', 'PERSON')]
+    assert sorted(nlp.parsed) == ['Brown v. Board', 'Jones v. Acme', 'People v. Smith']
+    # one pipe call per window of 3 cases, except the second window whose names are all cached by then
+    assert nlp.calls == 2
+    written = [json.loads(line)['name'] for line in cache_file.getvalue().splitlines()]
+    assert written == nlp.parsed
+
+    # a second run parses nothing
+    nlp = FakeNlp()
+    assert list(label_parties.label_parties(cases, nlp, batch_size=3, cache=cache)) == results
+    assert nlp.parsed == [] and nlp.calls == 0
@@ -0,0 +1,50 @@
+import json
+
+from metadata import MetadataRegistry
+
+
+COURTS = [
+    {'id': 8772, 'slug': 'ill', 'name': 'Illinois Supreme Court', 'name_abbreviation': 'Ill.'},
+    {'id': 8837, 'slug': 'ill-app-ct', 'name': 'Illinois Appellate Court', 'name_abbreviation': 'Ill. App. Ct.'},
+    {'id': 8808, 'slug': 'ark', 'name': 'Arkansas Supreme Court', 'name_abbreviation': 'Ark.'},
+]
+
+
+def test_metadata_indexes(tmp_path):
+    """
+    Make sure courts can be looked up from a snapshot without touching the API
+    """
+    with open(str(tmp_path / 'courts.json'), 'w') as snapshot_file:
+        json.dump({'downloaded': '2022-01-01T00:00:00', 'count': len(COURTS), 'results': COURTS}, snapshot_file)
+    courts = MetadataRegistry(snapshot_dir=str(tmp_path)).courts
+
+    assert courts.is_valid_slug('ill-app-ct')
+    assert not courts.is_valid_slug('illinois')
+    assert courts.resolve(8808)['slug'] == 'ark'
+    assert courts.resolve('ill. app. ct.')['slug'] == 'ill-app-ct'
+    assert courts.resolve('Arkansas Supreme Court')['id'] == 8808
+    assert [court['slug'] for court in courts.prefix('illinois')] == ['ill', 'ill-app-ct']
+    assert [court['slug'] for court in courts.search('supreme')] == ['ill', 'ark']
+    assert courts.search('tax') == []
+    assert [court['slug'] for court in courts.search('app. ct')] == ['ill-app-ct']
+
+
+def test_metadata_refresh(tmp_path, monkeypatch):
+    """
+    Make sure refresh counts added, changed and removed records, including a change that keeps the count the same
+    """
+    served = [dict(court) for court in COURTS]
+    registry = MetadataRegistry(snapshot_dir=str(tmp_path))
+    monkeypatch.setattr(registry, '_get_page', lambda url: {'count': len(served), 'results': served, 'next': None})
+
+    assert registry.refresh(endpoints=['courts']) == {'courts': (3, 0, 0)}
+    assert registry.refresh(endpoints=['courts']) == {'courts': (0, 0, 0)}
+
+    served[2] = dict(served[2], name='Supreme Court of Arkansas')
+    assert registry.refresh(endpoints=['courts']) == {'courts': (0, 1, 0)}
+    assert registry.courts.resolve('supreme court of arkansas')['id'] == 8808
+    assert MetadataRegistry(snapshot_dir=str(tmp_path)).courts.resolve('Supreme Court of Arkansas')['id'] == 8808
+
+    served[0] = {'id': 9000, 'slug': 'tex', 'name': 'Texas Supreme Court', 'name_abbreviation': 'Tex.'}
+    assert registry.refresh(endpoints=['courts']) == {'courts': (1, 0, 1)}
+    assert registry.courts.is_valid_slug('tex') and not registry.courts.is_valid_slug('ill')
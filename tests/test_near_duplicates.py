@@ -0,0 +1,48 @@
+import copy
+
+import numpy as np
+
+from benchmarks.fixtures import make_case
+from near_duplicates import near_duplicates
+
+
+def test_duplicate_index():
+    """
+    Make sure a duplicate is clustered with its original even when an unrelated case reached their bucket first
+    """
+    generator = np.random.RandomState(0)
+    original = generator.randint(0, 1 << 31, size=16).astype(np.uint32)
+    # shares only the first band (of 4 rows) with the original
+    colliding = generator.randint(0, 1 << 31, size=16).astype(np.uint32)
+    colliding[:4] = original[:4]
+    # shares the first band and 13 of 16 values with the original, but no other band
+    duplicate = original.copy()
+    duplicate[[4, 8, 12]] += 1
+
+    index = near_duplicates.DuplicateIndex(num_perm=16, threshold=.7)
+    assert (index.bands, index.rows) == (4, 4)
+    for record, signature in [('colliding', colliding), ('original', original), ('duplicate', duplicate)]:
+        index.add(record, signature)
+    assert index.clusters() == [['original', 'duplicate']]
+
+    # with a single case per bucket, the duplicate is only compared with the colliding case
+    index = near_duplicates.DuplicateIndex(num_perm=16, threshold=.7, bucket_size=1)
+    for record, signature in [('colliding', colliding), ('original', original), ('duplicate', duplicate)]:
+        index.add(record, signature)
+    assert index.clusters() == []
+
+
+def test_case_signatures():
+    """
+    Make sure planted near-duplicate opinions are clustered and unrelated cases aren't
+    """
+    a, b = near_duplicates.permutations(128)
+    cases = [make_case(case_id, words=300) for case_id in range(20)]
+    reprint = dict(copy.deepcopy(cases[3]), id=100)
+    reprint['casebody']['data']['opinions'][0]['text'] += " The judgment is reversed."
+    cases.append(reprint)
+
+    index = near_duplicates.DuplicateIndex(num_perm=128, threshold=.8)
+    for case in cases:
+        index.add(case['id'], near_duplicates.case_signature(case, a, b))
+    assert index.clusters() == [[3, 100]]
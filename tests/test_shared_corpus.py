@@ -0,0 +1,64 @@
+import numpy as np
+
+from shared_corpus import SharedCorpus
+
+CASES = [
+    {'id': 11, 'name_abbreviation': 'People v. Smith', 'year': 1901, 'court': 'Ill.', 'opinion_count': 1,
+     'text': 'The turkey was stolen.'},
+    {'id': 12, 'name_abbreviation': 'Doe v. Roe', 'year': 1950, 'court': 'Ark.', 'opinion_count': 2,
+     'text': 'Affirmed. Dissent: the jury erred.'},
+    {'id': 13, 'name_abbreviation': 'État v. Café', 'year': 1999, 'court': 'Ill.', 'opinion_count': 0,
+     'text': ''},
+]
+
+
+def make_corpus(path=None):
+    courts = ['Ill.', 'Ark.']
+    texts = [case['text'].encode('utf-8') for case in CASES]
+    names = [case['name_abbreviation'].encode('utf-8') for case in CASES]
+    data = {
+        'id': [case['id'] for case in CASES],
+        'year': [case['year'] for case in CASES],
+        'court': [courts.index(case['court']) for case in CASES],
+        'opinion_count': [case['opinion_count'] for case in CASES],
+        'text_offsets': np.cumsum([0] + [len(text) for text in texts]),
+        'name_offsets': np.cumsum([0] + [len(name) for name in names]),
+        'text': bytearray(b''.join(texts)),
+        'name': bytearray(b''.join(names)),
+    }
+    return SharedCorpus.from_columns(data, courts, path=path)
+
+
+def count_range(corpus, start, stop):
+    return [(int(corpus.id[index]), len(corpus.text(index).split())) for index in range(start, stop)]
+
+
+def test_shared_memory_corpus():
+    """
+    Make sure attached corpora detach without freeing the creator's block, and workers read every case
+    """
+    with make_corpus() as corpus:
+        for _ in range(2):
+            with SharedCorpus.attach(corpus.layout) as attached:
+                assert [attached.case(index) for index in range(len(attached))] == CASES
+        assert corpus.case(1) == CASES[1]
+        results = corpus.map(count_range, processes=2, chunk_size=2)
+        name = corpus.layout['shared_memory']
+    assert results == [[(11, 4), (12, 5)], [(13, 0)]]
+
+    try:
+        SharedCorpus.attach({'shared_memory': name, 'courts': [], 'columns': {}})
+        assert False, "the block should have been freed"
+    except FileNotFoundError:
+        pass
+
+
+def test_file_corpus(tmp_path):
+    """
+    Make sure a corpus saved to a file can be opened and mapped again
+    """
+    path = str(tmp_path / 'corpus')
+    with make_corpus(path=path) as corpus:
+        assert corpus.map(count_range, processes=2, chunk_size=1) == [[(11, 4)], [(12, 5)], [(13, 0)]]
+    with SharedCorpus.open(path) as corpus:
+        assert [corpus.case(index) for index in range(len(corpus))] == CASES
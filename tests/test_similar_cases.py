@@ -0,0 +1,67 @@
+import copy
+import json
+import lzma
+
+import numpy as np
+
+import utils
+from benchmarks.fixtures import make_case
+from similar_cases import similar_cases
+
+
+def write_bulk(path, cases):
+    with lzma.open(path, 'wt', encoding='utf-8') as out_file:
+        for case in cases:
+            out_file.write(json.dumps(case) + '\n')
+
+
+def test_similar_cases(tmp_path, monkeypatch):
+    """
+    Make sure a planted near-copy of a case ranks first, in exact and approximate indexes of several jurisdictions
+    """
+    bulk_files = {
+        'Illinois': [make_case(case_id, words=200) for case_id in range(300, 330)],
+        'Arkansas': [make_case(case_id, words=200) for case_id in range(30)],
+    }
+    original = bulk_files['Illinois'][7]
+    near_copy = dict(copy.deepcopy(original), id=9017, name_abbreviation='Copy v. Original')
+    near_copy['casebody']['data']['opinions'][0]['text'] += " The judgment is reversed."
+    bulk_files['Arkansas'].append(near_copy)
+    for jurisdiction, cases in bulk_files.items():
+        write_bulk(str(tmp_path / (jurisdiction + '.jsonl.xz')), cases)
+    monkeypatch.setattr(utils, 'get_and_extract_from_bulk',
+                        lambda jurisdiction, data_format: str(tmp_path / (jurisdiction + '.jsonl.xz')))
+
+    index_dir = str(tmp_path / 'index')
+    for jurisdiction, cases in bulk_files.items():
+        assert similar_cases.add_jurisdiction(index_dir, jurisdiction, n_features=1 << 12, processes=2,
+                                              chunk_size=8) == len(cases)
+    assert similar_cases.add_jurisdiction(index_dir, 'Illinois') == 0
+
+    # exact search over the memory-mapped tf-idf matrix
+    assert similar_cases.build_index(index_dir) == 61
+    index = similar_cases.SimilarCases(index_dir)
+    # the matrix is a read-only view of the mapped files, not a copy
+    for array in (index.tfidf.data, index.tfidf.indices, index.tfidf.indptr):
+        assert not array.flags.writeable
+    # parts are stacked in name order, so case ids aren't sorted and rows are found by binary search
+    assert index.case_ids[0] == 0 and index.case_ids[31] == 300
+    for row, case_id in enumerate(index.case_ids):
+        assert index.row(case_id) == row
+    for missing in (-1, 31, 100, 1000):
+        try:
+            index.row(missing)
+            assert False, missing
+        except KeyError:
+            pass
+
+    results = index.similar_to_case(original['id'], limit=5)
+    assert results[0][:2] == (9017, 'Copy v. Original') and results[0][2] > .99 > results[1][2]
+    assert original['id'] not in [case_id for case_id, _, _ in results]
+    assert index.similar_to_text(original['casebody']['data']['opinions'][0]['text'])[0][0] in (original['id'], 9017)
+
+    # approximate search over reduced vectors, probing every list
+    similar_cases.build_index(index_dir, dims=8, lists=4)
+    index = similar_cases.SimilarCases(index_dir, probes=4)
+    assert index.tfidf is None
+    assert index.similar_to_case(9017, limit=3)[0][0] == original['id']
@@ -0,0 +1,39 @@
+import io
+import json
+
+from benchmarks.fixtures import make_case
+from labelling_summarizing import summarize_cases
+
+
+def test_summarize_cases(monkeypatch):
+    """
+    Make sure summaries come out in input order, are cached by text and summarizer, and cases without opinions work
+    """
+    cases = [make_case(case_id, words=50 + (case_id % 3) * 400) for case_id in range(12)]
+    cases[5]['casebody']['data']['opinions'] = []
+    cases[7]['casebody']['data']['opinions'] = []
+    cases[7]['casebody']['data']['head_matter'] = ''
+    cache = {}
+    cache_file = io.StringIO()
+
+    results = list(summarize_cases.summarize_cases(iter(cases), processes=2, cache=cache, cache_file=cache_file,
+                                                   max_pending=3))
+    assert [case['id'] for case, _, _ in results] == [case['id'] for case in cases]
+    assert not any(cached for _, _, cached in results)
+    assert results[5][1] and results[7][1] == ''
+    assert len(cache) == len(cache_file.getvalue().splitlines()) == 12
+    assert {json.loads(line)['key'] for line in cache_file.getvalue().splitlines()} == set(cache)
+
+    # the same cases again are all cached
+    again = list(summarize_cases.summarize_cases(cases, processes=2, cache=cache))
+    assert [(case['id'], summary) for case, summary, _ in again] == [(case['id'], summary)
+                                                                     for case, summary, _ in results]
+    assert all(cached for _, _, cached in again)
+
+    # a different summarizer doesn't reuse those summaries
+    text = summarize_cases.case_text(cases[0])
+    assert summarize_cases.cache_key(text, 500, 'frequency') != summarize_cases.cache_key(text, 500, 'gensim-textrank')
+    assert summarize_cases.cache_key(text, 500, 'frequency') != summarize_cases.cache_key(text, 400, 'frequency')
+    monkeypatch.setattr(summarize_cases, 'summarizer_name', lambda: 'other')
+    assert not any(cached for _, _, cached in summarize_cases.summarize_cases(cases[:3], processes=1, cache=cache))
+    assert len(cache) == 15
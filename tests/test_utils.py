@@ -1,3 +1,8 @@
+import sys
+import subprocess
+
+import requests
+
 from utils import *
 
 
@@ -16,3 +21,36 @@ def test_get_api_url():
     content = resp.json()
     assert "cases" in content.keys()
 
+
+def test_get_opinions():
+    """
+    Make sure opinions are read the same way from json and xml casebodies
+    """
+    json_case = {'casebody': {'data': {'opinions': [{'type': 'majority', 'author': 'Cart\xadwright, J.',
+                                                     'text': 'Affirmed.'}]}}}
+    xml_case = {'casebody': {'data': '<casebody xmlns="http://nrs.harvard.edu/urn-3:HLS.Libr.US_Case_Law.Schema.'
+                                     'Case_Body:v1"><opinion type="majority"><author>Cart\xadwright, J.</author>'
+                                     '<p>Affirmed.</p></opinion></casebody>'}}
+
+    expected = [{'type': 'majority', 'author': 'Cartwright, J.', 'text': 'Affirmed.'}]
+    assert get_opinions(json_case) == expected
+    assert get_opinions(xml_case) == expected
+
+
+def test_utils_imports_lazily():
+    """
+    Make sure importing utils doesn't load the network and progress bar libraries
+    """
+    code = "import sys, utils; print(' '.join(m for m in ('requests', 'urllib3', 'tqdm') if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    assert output.stdout.strip() == ''
+
+
+def test_get_auth_headers(monkeypatch):
+    """
+    Make sure placeholder keys aren't sent, so anonymous requests stay anonymous
+    """
+    monkeypatch.setattr(settings, 'API_KEY', 'Paste your key in between these quotation marks')
+    assert get_auth_headers() == {}
+    monkeypatch.setattr(settings, 'API_KEY', 'abc123')
+    assert get_auth_headers() == {'AUTHORIZATION': 'Token abc123'}
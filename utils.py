@@ -1,11 +1,14 @@
 import os
-import requests
+import json
+import lzma
+import time
 import zipfile
-import certifi
-import urllib3
+from xml.etree import ElementTree
 
-from urllib3.exceptions import MaxRetryError
-from tqdm import tqdm
+import instrumentation
+
+# requests, urllib3, certifi and tqdm are imported by the functions that use them, so that importing utils
+# (e.g. for `fab show_api_url` or a short batch job) stays fast.
 
 try:
     from config import settings
@@ -19,6 +22,9 @@ CEND = '\33[0m'
 
 CURL = '\33[4m'
 
+# API_KEY values of config/settings_base.py and config/settings.example.py, before a real key is pasted in
+PLACEHOLDER_API_KEYS = ('', '123', 'Paste your key in between these quotation marks')
+
 
 def get_api_url(resource=None):
     root_url = "%s/%s/" % (settings.API_URL, settings.API_VERSION)
@@ -28,10 +34,22 @@ def get_api_url(resource=None):
     return root_url + resource + '/'
 
 
+def get_auth_headers():
+    """
+    Return the authorization header for the configured API key, or no headers if no real key is set
+    """
+    api_key = getattr(settings, 'API_KEY', None)
+    if not api_key or api_key.strip() in PLACEHOLDER_API_KEYS:
+        return {}
+    return {'AUTHORIZATION': 'Token {}'.format(api_key)}
+
+
 def get_jurisdictions():
-    url = get_api_url() + 'jurisdictions'
-    response = requests.get(url)
-    return response.json()['results']
+    """
+    Return every jurisdiction, from the local metadata snapshot (downloaded on first use)
+    """
+    import metadata
+    return metadata.get_registry().jurisdictions.records
 
 
 def print_info(instruction):
@@ -42,6 +60,12 @@ def print_info(instruction):
 
 
 def get_cases_from_bulk(jurisdiction="Illinois", data_format="json"):
+    import certifi
+    import requests
+    import urllib3
+    from urllib3.exceptions import MaxRetryError
+    from tqdm import tqdm
+
     body_format = "xml" if data_format == "xml" else "text"
     bulk_url = settings.API_BULK_URL + "/?body_format=%s&filter_type=jurisdiction" % body_format
     bulk_api_results = requests.get(bulk_url)
@@ -74,12 +98,13 @@ def get_cases_from_bulk(jurisdiction="Illinois", data_format="json"):
         raise Exception("Something went wrong.\n\n%s" % resp.data)
 
     print_info("downloading %s into ../data dir" % jur['file_name'])
-    with open(filename, 'wb') as f:
+    with instrumentation.timer('bulk_download_seconds'), open(filename, 'wb') as f:
         for chunk in tqdm(resp.stream(1024)):
             f.write(chunk)
+            instrumentation.increment('bulk_download_bytes_total', len(chunk))
 
     print_info("extracting %s into ../data dir" % jur['file_name'])
-    with zipfile.ZipFile(filename, 'r') as zip_ref:
+    with instrumentation.timer('bulk_extract_seconds'), zipfile.ZipFile(filename, 'r') as zip_ref:
         zip_ref.extractall(settings.DATA_DIR)
 
     print_info("Done.")
@@ -113,6 +138,8 @@ def get_cases_from_api(**kwargs):
     """
     Get back json of the first 100 cases unless a cursor argument is provided
     """
+    import requests
+
     api_url = get_api_url(resource='cases')
     filters = "?format=json&"
     for key, val in kwargs.items():
@@ -121,8 +148,90 @@ def get_cases_from_api(**kwargs):
     api_url += filters
 
     headers = {'AUTHORIZATION': 'Token {}'.format(settings.API_KEY)}
-    response = requests.get(api_url, headers=headers)
+    with instrumentation.timer('cap_request_seconds'):
+        response = requests.get(api_url, headers=headers)
+    instrumentation.increment('cap_requests_total', status=response.status_code)
+    instrumentation.increment('cap_response_bytes_total', len(response.content))
     if response.status_code != 200:
         raise Exception("Something went wrong.\n\n%s" % response.reason)
 
     return response.json()
+
+
+def _record_bulk_read(cases, decompress_seconds, parse_seconds):
+    instrumentation.increment('bulk_cases_read_total', cases)
+    instrumentation.increment('bulk_decompress_seconds_total', decompress_seconds)
+    if parse_seconds:
+        instrumentation.increment('bulk_parse_seconds_total', parse_seconds)
+
+
+def read_cases_from_bulk(compressed_file):
+    """
+    Yield each case record of a bulk data.jsonl.xz file, decompressing one line at a time
+    """
+    # time spent decompressing and parsing is added up here and recorded every 1000 cases
+    cases, decompress_seconds, parse_seconds = 0, 0.0, 0.0
+    with lzma.open(compressed_file) as infile:
+        while True:
+            start = time.perf_counter()
+            line = infile.readline()
+            if not line:
+                break
+            decompressed = time.perf_counter()
+            case = json.loads(str(line, 'utf-8'))
+            decompress_seconds += decompressed - start
+            parse_seconds += time.perf_counter() - decompressed
+            cases += 1
+            if cases % 1000 == 0:
+                _record_bulk_read(1000, decompress_seconds, parse_seconds)
+                decompress_seconds, parse_seconds = 0.0, 0.0
+            yield case
+    _record_bulk_read(cases % 1000, decompress_seconds, parse_seconds)
+
+
+def read_chunks_from_bulk(compressed_file, chunk_size=1000):
+    """
+    Yield lists of up to chunk_size raw (still json-encoded) lines of a bulk data.jsonl.xz file.
+    Decoding is left to the caller so that chunks can be handed to worker processes cheaply.
+    """
+    chunk = []
+    with lzma.open(compressed_file) as infile:
+        start = time.perf_counter()
+        for line in infile:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                _record_bulk_read(len(chunk), time.perf_counter() - start, 0)
+                yield chunk
+                chunk = []
+                start = time.perf_counter()
+    if chunk:
+        _record_bulk_read(len(chunk), time.perf_counter() - start, 0)
+        yield chunk
+
+
+def get_opinions(case):
+    """
+    Return a list of {'type', 'author', 'text'} dicts for each opinion of a bulk case,
+    whether its casebody was downloaded in json (text) or xml format
+    """
+    data = case['casebody']['data']
+    if not isinstance(data, str):
+        return [{'type': opinion.get('type') or '',
+                 'author': (opinion.get('author') or '').replace(u'\xad', ''),
+                 'text': opinion.get('text') or ''}
+                for opinion in data.get('opinions', [])]
+
+    opinions = []
+    for elem in ElementTree.fromstring(data):
+        if elem.tag.split("}")[-1] != "opinion":
+            continue
+        author = ""
+        text = []
+        for opinion_element in elem:
+            element_text = "".join(opinion_element.itertext()).replace(u'\xad', '')
+            if opinion_element.tag.split("}")[-1] == 'author':
+                author = element_text
+            else:
+                text.append(element_text)
+        opinions.append({'type': elem.attrib.get("type", ""), 'author': author, 'text': " ".join(text)})
+    return opinions